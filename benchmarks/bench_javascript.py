@@ -0,0 +1,63 @@
+"""Micro-benchmark of the JavaScript rendering for a page of charts.
+
+Compares parsing templates/javascript.pt for every call, as done before,
+with the template parsed once and with building the JavaScript from
+strings.
+
+    bin/python benchmarks/bench_javascript.py
+"""
+
+import os
+import timeit
+from zope.pagetemplate.pagetemplatefile import PageTemplateFile
+from raisin.restyler import renderers
+
+NUMBER = 200
+TEMPLATE = os.path.join(os.path.dirname(renderers.__file__),
+                        'templates', 'javascript.pt')
+PACKAGES = "'corechart,table'"
+
+
+def get_charts(count=20):
+    """Return charts like the ones of a tab with many boxes"""
+    charts = []
+    rows = ','.join(['{"c": [{"v": "gene%s"}, {"v": %s}]}' % (row, row)
+                     for row in range(50)])
+    data = '{"cols": [{"type": "string"}, {"type": "number"}], ' \
+           '"rows": [%s]}' % rows
+    for index in range(count):
+        charttype = ['Table', 'LineChart', 'BarChart', 'HeatMap'][index % 4]
+        charts.append({'id': 'chart_%s' % index,
+                       'charttype': charttype,
+                       'data': data,
+                       'chartoptions_rendered': "width: 900, title: 'Chart'",
+                       'javascript': 'thousandsformatter.format(data, 1);\n'})
+    return charts
+
+
+def render_parsing_every_time(charts):
+    """Render the way it was done before the template was cached"""
+    pagetemplate = PageTemplateFile(TEMPLATE)
+    context = {'packages': PACKAGES, 'charts': charts}
+    return pagetemplate.pt_render(namespace=context)
+
+
+def main():
+    """Print the time per call of every way of rendering"""
+    charts = get_charts()
+    expected = render_parsing_every_time(charts)
+    candidates = [('template parsed every call',
+                   lambda: render_parsing_every_time(charts)),
+                  ('template parsed once',
+                   lambda: renderers.render_javascript_template(charts,
+                                                                PACKAGES)),
+                  ('plain strings',
+                   lambda: renderers.render_javascript_strings(charts,
+                                                               PACKAGES))]
+    for title, function in candidates:
+        assert function() == expected
+        seconds = min(timeit.Timer(function).repeat(3, NUMBER)) / NUMBER
+        print "%-30s %10.1f us per call" % (title, seconds * 1000000)
+
+if __name__ == "__main__":
+    main()
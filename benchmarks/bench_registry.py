@@ -0,0 +1,46 @@
+"""Benchmark of resolving the resources of a layout with 20 cells.
+
+Compares scanning the whole registry, as done before, with the index by
+name, for registries of growing size.
+
+    bin/python benchmarks/bench_registry.py
+"""
+
+import timeit
+from raisin.restyler.registry import RegistryIndex
+
+NUMBER = 200
+CELLS = ['resource_%s' % (index * 37) for index in range(20)]
+
+
+def scan_registry(registry, cells):
+    """Resolve the way it was done before the index"""
+    resources = []
+    unknown = set(cells)
+    for resource in registry:
+        if resource[0] in cells:
+            if resource[0] in unknown:
+                unknown.remove(resource[0])
+            if not resource in resources:
+                resources.append(resource[:])
+    if len(unknown) > 0:
+        raise AttributeError
+    return resources
+
+
+def main():
+    """Print the time per resolution for every registry size"""
+    for size in [1000, 5000, 20000]:
+        registry = [('resource_%s' % index, None, ('json', ))
+                    for index in range(size)]
+        index = RegistryIndex(registry)
+        assert list(index.resolve(CELLS)) == scan_registry(registry, CELLS)
+        for title, function in [('scan', lambda: scan_registry(registry,
+                                                               CELLS)),
+                                ('index', lambda: index.resolve(CELLS))]:
+            seconds = min(timeit.Timer(function).repeat(3, NUMBER)) / NUMBER
+            print "%6s entries %-6s %10.1f us per layout" % (size, title,
+                                                            seconds * 1000000)
+
+if __name__ == "__main__":
+    main()
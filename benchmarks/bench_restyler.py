@@ -0,0 +1,284 @@
+"""Benchmark of building pages and boxes against a synthetic backend.
+
+Every tab of every layout in PAGES, and the .html, .csv and .json views of
+a box, are built from SyntheticResourceProvider. It answers after a given
+latency, fails a given share of the fetches and returns tables with a given
+number of rows. Every scenario runs in a process of its own, once with the
+caches cleared before every request and once with warm caches. Requests per
+second, the median and 99th percentile latency and the peak memory (Linux
+only) are reported.
+
+    bin/python benchmarks/bench_restyler.py --save baseline
+    bin/python benchmarks/bench_restyler.py --compare baseline
+
+Baselines are kept as JSON in benchmarks/baselines. Comparisons mark the
+scenarios with fewer requests per second or a higher 99th percentile than
+the baseline by more than --tolerance percent, and exit with status 1.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import pickle
+import optparse
+import subprocess
+from gvizapi import gviz_api
+from raisin.restyler import provider
+from raisin.restyler import cache
+from raisin.restyler import breaker
+from raisin.restyler import snapshot
+from raisin.restyler.page import Page
+from raisin.restyler.box import Box
+from raisin.restyler.config import PICKLED
+from raisin.restyler.config import JSON
+from raisin.restyler.config import CSV
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines')
+APPLICATION_URL = 'http://localhost'
+# One page of every layout, all of their tabs are built
+PATHS = ['/',
+         '/project/ENCODE/',
+         '/project/ENCODE/experiment/subset/cell/K562/',
+         '/project/ENCODE/cell/K562/',
+         '/project/ENCODE/cell/K562/replicate/Rep1/',
+         '/project/ENCODE/cell/K562/replicate/Rep1/lane/Lane1/']
+# The box built as .html, .csv and .json
+BOX_PATH = '/project/ENCODE/'
+BOX_NAME = 'project_experimentstable'
+CACHES = [cache.RESOURCES, cache.FRAGMENTS, cache.NEGATIVES, cache.ENCODED]
+MODES = ['cold', 'warm']
+# Options passed on to the process of every scenario
+FORWARDED = ['number', 'latency', 'failure_rate', 'rows', 'seed']
+# Columns read by the boxes from the tables, by name or position
+SAMPLE_COLUMNS = ['Species', 'Cell Type', 'RNA Type', 'Localization',
+                  'Bio Replicate', 'Date']
+
+
+def get_table(rows):
+    """Return a table that all boxes can be built from"""
+    description = [('Project Id', 'string'),
+                   ('Experiment Id', 'string'),
+                   ('Start', 'number'),
+                   ('Replicate', 'string'),
+                   ('Replicate Url', 'string'),
+                   ('Reads', 'number'),
+                   ('Percent', 'number')]
+    description.extend([(column, 'string') for column in SAMPLE_COLUMNS])
+    data = []
+    for row in range(rows):
+        data.append(('ENCODE',
+                     'LID%06d' % row,
+                     row % 5 * 100,
+                     'Replicate %s' % row,
+                     '/project/ENCODE/cell/K562/replicate/Rep%s' % row,
+                     row * 1013 % 50000000,
+                     (row % 1000) / 10.0,
+                     'Homo sapiens',
+                     ['K562', 'GM12878', 'HeLa-S3', 'HepG2'][row % 4],
+                     ['LONGPOLYA', 'TOTAL', 'SHORT'][row % 3],
+                     'CELL',
+                     str(row % 2 + 1),
+                     '2012-07-25'))
+    return {'table_description': description, 'table_data': data}
+
+
+class SyntheticResourceProvider:
+    """Stands in for the Restish server, with a latency, a failure rate and
+    tables of a number of rows.
+    """
+
+    def __init__(self, latency=0.005, failure_rate=0.0, rows=1000, seed=0):
+        """Encode the table once for every content type"""
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        table = get_table(rows)
+        data_table = gviz_api.DataTable(table['table_description'],
+                                        table['table_data'])
+        self.bodies = {PICKLED: pickle.dumps(table),
+                       JSON: data_table.ToJSon(),
+                       CSV: data_table.ToCsv()}
+
+    def get(self, uri, content_type):
+        """Answer after the latency, or fail"""
+        time.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            return None
+        # Servers not knowing a content type send pickles
+        return self.bodies.get(content_type, self.bodies[PICKLED])
+
+
+def get_scenarios():
+    """Get the scenarios as (title, factory, path, route name, matchdict)"""
+    scenarios = []
+    for job in snapshot.get_page_jobs(PATHS, APPLICATION_URL, None, None,
+                                      False):
+        path, route_name, matchdict = job[4:]
+        scenarios.append(('page %s' % path, Page, path, route_name,
+                          matchdict))
+    matchdict = snapshot.match_path(BOX_PATH)[1]
+    matchdict['box_name'] = BOX_NAME
+    for extension in ['.html', '.csv', '.json']:
+        path = BOX_PATH + BOX_NAME + extension
+        scenarios.append(('box %s' % path, Box, path, None, matchdict))
+    return scenarios
+
+
+def clear_caches():
+    """Drop all cached resources, charts and bodies"""
+    for name in CACHES:
+        cache.set_cache(None, name)
+    breaker.BREAKERS.clear()
+
+
+def build(factory, path, route_name, matchdict):
+    """Build a page or box, reading the whole body of downloads"""
+    request = snapshot.SnapshotRequest(APPLICATION_URL, path, route_name,
+                                       dict(matchdict))
+    context = factory(request)
+    if factory is Box:
+        context.body
+
+
+def get_high_water_mark():
+    """Get the peak resident set size of this process in KB"""
+    for line in open('/proc/self/status'):
+        if line.startswith('VmHWM:'):
+            return int(line.split()[1])
+
+
+def get_percentile(latencies, percent):
+    """Get a percentile of the latencies"""
+    latencies = sorted(latencies)
+    return latencies[int(round(percent / 100.0 * (len(latencies) - 1)))]
+
+
+def run_scenario(title, mode, options):
+    """Build the page or box of the scenario the number of times"""
+    scenario = [scenario for scenario in get_scenarios()
+                if scenario[0] == title][0]
+    provider.set_provider(SyntheticResourceProvider(options.latency / 1000.0,
+                                                    options.failure_rate,
+                                                    options.rows,
+                                                    options.seed))
+    if mode == 'warm':
+        build(*scenario[1:])
+    latencies = []
+    for number in range(options.number):
+        if mode == 'cold':
+            clear_caches()
+        started = time.time()
+        build(*scenario[1:])
+        latencies.append(time.time() - started)
+    return {'requests_per_second': len(latencies) / sum(latencies),
+            'p50': get_percentile(latencies, 50) * 1000,
+            'p99': get_percentile(latencies, 99) * 1000,
+            'peak': get_high_water_mark()}
+
+
+def measure(title, mode, options):
+    """Run a scenario in a process of its own"""
+    arguments = [sys.executable, os.path.abspath(__file__),
+                 '--scenario', title, '--mode', mode]
+    for name in FORWARDED:
+        arguments.extend(['--' + name.replace('_', '-'),
+                          str(getattr(options, name))])
+    return json.loads(subprocess.check_output(arguments))
+
+
+def get_regressions(result, baseline, tolerance):
+    """Get what got worse than the baseline by more than tolerance
+    percent.
+    """
+    regressions = []
+    if result['requests_per_second'] < baseline['requests_per_second'] * \
+            (1 - tolerance / 100.0):
+        regressions.append('req/s')
+    if result['p99'] > baseline['p99'] * (1 + tolerance / 100.0):
+        regressions.append('p99')
+    return regressions
+
+
+def get_parser():
+    """Get the parser of the command line options"""
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('-n', '--number', type='int', default=20,
+                      help="requests per scenario and mode")
+    parser.add_option('--latency', type='float', default=5.0,
+                      help="milliseconds before the backend answers")
+    parser.add_option('--failure-rate', type='float', default=0.0,
+                      help="share of the fetches failing")
+    parser.add_option('--rows', type='int', default=1000,
+                      help="rows of every table")
+    parser.add_option('--seed', type='int', default=0,
+                      help="seed of the failures")
+    parser.add_option('-k', '--filter', default='',
+                      help="only run the scenarios with this in the title")
+    parser.add_option('--save', default=None,
+                      help="save the results as baseline of this name")
+    parser.add_option('--compare', default=None,
+                      help="compare the results with the baseline of this "
+                           "name")
+    parser.add_option('--tolerance', type='float', default=10.0,
+                      help="percent worse than the baseline that is still "
+                           "no regression")
+    parser.add_option('--scenario', default=None, help=optparse.SUPPRESS_HELP)
+    parser.add_option('--mode', default=None, help=optparse.SUPPRESS_HELP)
+    return parser
+
+
+def main(argv=None):
+    """Run the scenarios and print their results"""
+    options = get_parser().parse_args(argv)[0]
+    if not options.scenario is None:
+        print json.dumps(run_scenario(options.scenario, options.mode,
+                                      options))
+        return 0
+    baseline = None
+    if not options.compare is None:
+        filename = os.path.join(BASELINES, options.compare + '.json')
+        baseline = json.load(open(filename))
+        for name in FORWARDED:
+            if baseline['options'][name] != getattr(options, name):
+                print "Baseline %s has %s %s" % (options.compare, name,
+                                                 baseline['options'][name])
+    results = {}
+    regressions = 0
+    for title, factory, path, route_name, matchdict in get_scenarios():
+        if not options.filter in title:
+            continue
+        for mode in MODES:
+            key = '%s %s' % (title, mode)
+            result = results[key] = measure(title, mode, options)
+            line = "%-76s %8.1f req/s %8.1f ms p50 %8.1f ms p99 %7s KB" % (
+                key, result['requests_per_second'], result['p50'],
+                result['p99'], result['peak'])
+            if not baseline is None and key in baseline['results']:
+                base = baseline['results'][key]
+                change = (result['requests_per_second'] /
+                          base['requests_per_second'] - 1) * 100
+                line += " %+6.1f%%" % change
+                worse = get_regressions(result, base, options.tolerance)
+                if worse:
+                    regressions += 1
+                    line += " REGRESSION %s" % ', '.join(worse)
+            print line
+            sys.stdout.flush()
+    if not options.save is None:
+        if not os.path.exists(BASELINES):
+            os.makedirs(BASELINES)
+        content = {'options': dict([(name, getattr(options, name))
+                                    for name in FORWARDED]),
+                   'results': results}
+        filename = os.path.join(BASELINES, options.save + '.json')
+        json.dump(content, open(filename, 'w'), indent=1, sort_keys=True)
+    if regressions:
+        print "%s regressions" % regressions
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
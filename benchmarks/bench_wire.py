@@ -0,0 +1,113 @@
+"""Benchmark of decoding experiment tables from the Restish server.
+
+Compares pickle.loads, as done for text/x-python-pickled-dict, with the
+columnar format of wire.py, both when only the description is used and when
+all rows are. Peak memory is measured in a separate process per decoding, so
+that one decoding does not hide the peak of the next (Linux only).
+
+    bin/python benchmarks/bench_wire.py
+"""
+
+import os
+import sys
+import pickle
+import timeit
+import tempfile
+import subprocess
+from raisin.restyler import wire
+
+NUMBER = 5
+SIZES = [1000, 20000, 100000]
+
+
+def get_table(rows):
+    """Return a table like the ones of the experiments of a project"""
+    description = [('Project Id', 'string'),
+                   ('Accession', 'string'),
+                   ('Cell Type', 'string'),
+                   ('RNA Type', 'string'),
+                   ('Read Length', 'number'),
+                   ('Mapped Reads', 'number'),
+                   ('Percent Mapped', 'number')]
+    data = []
+    for row in range(rows):
+        data.append(('ENCODE',
+                     'LID%06d' % row,
+                     ['K562', 'GM12878', 'HeLa-S3', 'HepG2'][row % 4],
+                     ['LONGPOLYA', 'TOTAL', 'SHORT'][row % 3],
+                     [36, 76, 100][row % 3],
+                     row * 1013 % 50000000,
+                     (row % 1000) / 10.0))
+    return {'table_description': description, 'table_data': data}
+
+
+def decode_pickled(body):
+    """Decode a pickled table"""
+    return pickle.loads(body)['table_data']
+
+
+def decode_columnar(body):
+    """Decode the description of a columnar table"""
+    return wire.decode_table(body)['table_description']
+
+
+def decode_columnar_rows(body):
+    """Decode a columnar table including all rows"""
+    return wire.decode_table(body)['table_data'].get_rows()
+
+METHODS = [('pickle', decode_pickled),
+           ('columnar lazy', decode_columnar),
+           ('columnar rows', decode_columnar_rows)]
+
+
+def get_high_water_mark():
+    """Get the peak resident set size of this process in KB.
+
+    Unlike ru_maxrss, it is not inherited from the parent process.
+    """
+    for line in open('/proc/self/status'):
+        if line.startswith('VmHWM:'):
+            return int(line.split()[1])
+
+
+def measure(title, path):
+    """Print the peak memory in KB needed to decode the body in path"""
+    body = open(path, 'rb').read()
+    before = get_high_water_mark()
+    dict(METHODS)[title](body)
+    print get_high_water_mark() - before
+
+
+def get_peak_memory(title, path):
+    """Get the peak memory in KB needed to decode the body in path"""
+    output = subprocess.check_output([sys.executable, __file__, 'measure',
+                                      title, path])
+    return int(output)
+
+
+def main():
+    """Print the size, time and peak memory of decoding for every size"""
+    for size in SIZES:
+        table = get_table(size)
+        bodies = {'pickle': pickle.dumps(table),
+                  'columnar': wire.encode_table(table)}
+        assert decode_columnar_rows(bodies['columnar']) == table['table_data']
+        for title, function in METHODS:
+            body = bodies[title.split()[0]]
+            descriptor, path = tempfile.mkstemp()
+            try:
+                os.write(descriptor, body)
+                os.close(descriptor)
+                peak = get_peak_memory(title, path)
+            finally:
+                os.remove(path)
+            seconds = min(timeit.Timer(lambda: function(body)).repeat(
+                3, NUMBER)) / NUMBER
+            print "%6s rows %-13s %8s KB body %10.2f ms %8s KB peak" % (
+                size, title, len(body) / 1024, seconds * 1000, peak)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['measure']:
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main()
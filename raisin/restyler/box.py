@@ -1,15 +1,25 @@
 """Box Base factory"""
 
 import os
+import time
 from config import JSON
 from config import CSV
-from renderers import render_javascript
+from config import PICKLED
+from config import MAX_PAGE_SIZE
 from renderers import render_chartoptions
 from renderers import render_description
-from raisin.box import RESOURCES_REGISTRY
 from page import Restyler
-from raisin.restkit import ResourceProvider
+from page import get_rendered_size
 from resource import Resource
+from cache import get_cache
+from cache import NEGATIVES
+from registry import REGISTRY_INDEX
+from registry import resolve_resources
+from conditional import Conditional
+from conditional import get_request_parts
+from timing import Timings
+from timing import RENDER
+from gvizapi import gviz_api
 
 
 class Cells(object):
@@ -23,6 +33,10 @@ class Cells(object):
         """Get the cells"""
         return [self.chart_name]
 
+    def get_resources(self):
+        """Get the resources referenced from the cells"""
+        return resolve_resources(self.get_cells())
+
 
 class Layout(object):
     """Provides information on the layout and its cells."""
@@ -39,13 +53,80 @@ class Layout(object):
 class BoxRestyler(Restyler):
     """Gets a resource and renders it as a chart"""
 
-    def __init__(self, request, cells):
+    # A box shows a single chart, so its data is always in the JavaScript
+    lazy = False
+    paged = False
+
+    def __init__(self, request, cells, render=True, timings=None):
         """Box Restyler"""
-        Restyler.__init__(self, request, cells)
+        Restyler.__init__(self, request, cells, render=render,
+                          timings=timings)
 
     def get_charts(self, request):
-        """Get the charts"""
-        return []
+        """Get the charts, fetched and rendered in a single pass"""
+        charts = []
+        for chart in self.get_chart_infos(request):
+            started = time.time()
+            self.render_chart(request, chart, None)
+            self.record(RENDER, chart['id'], started,
+                        get_rendered_size(chart))
+            # Use the chart id without a postfix as we do for boxes on a page
+            chart['div_id'] = chart['id']
+            charts.append(chart)
+        return charts
+
+    def render_chart(self, request, chart, url):
+        """Render the chart options and description of a chart, using the
+        width and height given in the request.
+        """
+        # Render the chart to JSon
+        if not JSON in chart or chart[JSON] is None:
+            pass
+        elif not 'charttype' in chart:
+            pass
+        else:
+            # The data is set once the width and height are known
+            chart['data'] = None
+            chart['chartoptions']['is3D'] = False
+
+        rendered = render_description(request,
+                                      chart.get('description', ''),
+                                      chart.get('description_type', ''))
+        chart['description_rendered'] = rendered
+
+        if 'chartoptions' in chart:
+            # Sometimes it is necessary to override the width and height
+            # completely from the outside by just passing the width and height
+            # through the url. This is useful when doing screenshots.
+            if 'width' in request.GET:
+                # width can be overridden from the request query
+                width = int(request.GET['width'])
+                chart['chartoptions']['width'] = width
+            if 'height' in request.GET:
+                # height can be overridden from the request query
+                height = int(request.GET['height'])
+                chart['chartoptions']['height'] = height
+
+            # Render the chart options only once, with the final values
+            rendered = render_chartoptions(chart['chartoptions'])
+            chart['chartoptions_rendered'] = rendered
+
+        if 'data' in chart:
+            chart['data'] = self.get_data(chart)
+
+    def get_packages(self):
+        """Get the packages needed by the google chart tools"""
+        packages = set(['corechart'])
+        for chart in self.charts:
+            if not 'data' in chart:
+                continue
+            if chart['charttype'] == 'Table':
+                packages.add(chart['charttype'].lower())
+            if chart['charttype'] == 'ImageSparkLine':
+                # Box uses CSS from table, so we have to add it here
+                packages.add('table')
+                packages.add(chart['charttype'].lower())
+        return packages
 
     def get_module_id(self, chart):
         """Get the module id"""
@@ -56,92 +137,125 @@ class BoxRestyler(Restyler):
         return Restyler.get_chart_infos(self, request)
 
 
-class Box:
-    """Shows one box on the page"""
+class Box(Conditional):
+    """Shows one box on the page.
+
+    Nothing is rendered when the request has the ETag of the box already,
+    and not_modified is set instead. The time spent in every stage is kept
+    in timings.
+    """
 
     def __init__(self, request):
         """Box"""
-        resource_provider = ResourceProvider()
-        resource = Resource(resource_provider)
+        self.timings = Timings()
+        try:
+            self.build(request)
+        finally:
+            self.timings.finish(request.url)
+
+    def build(self, request):
+        """Fetch the resource and render the box in the requested format"""
+        resource = Resource(cache=get_cache(), negatives=get_cache(NEGATIVES),
+                            timings=self.timings)
         self.charts = []
         self.chart_type = None
         self.layout = Layout(request)
-        self.body = ''
+        self.app_iter = None
+        self._body = ''
         self.javascript = ''
         self.chart_name = request.matchdict['box_name']
         chart_format = os.path.splitext(request.environ['PATH_INFO'])[1]
-        # Go through the registry, and find the resource for this box
-        # XXX This should be a dictionary
-        for res in RESOURCES_REGISTRY:
-            if res[0] == self.chart_name:
-                self.resources = [res]
+        self.resources = []
+        resource_info = REGISTRY_INDEX.get(self.chart_name)
+        if not resource_info is None:
+            self.resources = [resource_info]
 
         if chart_format == '.html':
             self.render_html(request)
         elif chart_format == '.csv':
-            self.body = resource.get(self.chart_name, CSV, request.matchdict)
+            self.stream(request, resource, CSV)
         elif chart_format == '.json':
-            self.body = resource.get(self.chart_name, JSON, request.matchdict)
+            if 'offset' in request.GET or 'limit' in request.GET:
+                self.render_window(request, resource)
+            else:
+                self.stream(request, resource, JSON)
         else:
             print "Format not supported %s" % chart_format
             raise AttributeError
 
-    def render_html(self, request):
-        """Render a resource as HTML"""
-        cells = self.layout.get_cells()
-        restyler = BoxRestyler(request, cells)
-        packages = set(['corechart'])
-        chart = restyler.get_chart_infos(request)[0]
-        if 'charttype' in chart and 'data' in chart:
-            if chart['charttype'] in ['Table', 'ImageSparkLine']:
-                packages.add(chart['charttype'].lower())
-            self.javascript = render_javascript([chart, ], packages)
+    def stream(self, request, resource, content_type):
+        """Pass the body of the resource through in chunks"""
+        self.app_iter = resource.stream(self.chart_name, content_type,
+                                        request.matchdict)
+        if self.app_iter is None:
+            # Resource not available
+            self._body = None
+            return
+        # Bodies streamed from the provider have no digest before they have
+        # been read, so only cached ones get an ETag
+        digest = resource.get_digest(self.chart_name, content_type,
+                                     request.matchdict)
+        parts = get_request_parts(request) + [digest]
+        if self.check_etag(request, parts):
+            self.app_iter = None
 
-        # Render the chart to JSon
-        if not JSON in chart or chart[JSON] is None:
-            pass
-        elif not 'charttype' in chart:
-            pass
-        else:
-            chart['data'] = chart[JSON]
-            # Prepare the packages are needed by the google chart tools
-            if chart['charttype'] == 'Table':
-                packages.add(chart['charttype'].lower())
-            if chart['charttype'] == 'ImageSparkLine':
-                # Box uses CSS from table, so we have to add it here
-                packages.add('table')
-                packages.add(chart['charttype'].lower())
-            chart['chartoptions']['is3D'] = False
-            rendered = render_chartoptions(chart['chartoptions'])
-            chart['chartoptions_rendered'] = rendered
+    def render_window(self, request, resource):
+        """Render a window of the rows of a table as JSON, with the offset,
+        limit and total number of rows as table properties.
+        """
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = int(request.GET.get('limit', MAX_PAGE_SIZE))
+        limit = min(max(limit, 0), MAX_PAGE_SIZE)
+        window = resource.get_window(self.chart_name, request.matchdict,
+                                     offset, limit)
+        if window is None:
+            # Resource not available
+            self._body = None
+            return
+        digest = resource.get_digest(self.chart_name, PICKLED,
+                                     request.matchdict)
+        if self.check_etag(request, get_request_parts(request) + [digest]):
+            return
+        properties = {'offset': offset,
+                      'limit': limit,
+                      'total': window['total']}
+        table = gviz_api.DataTable(window['table_description'],
+                                   window['table_data'],
+                                   custom_properties=properties)
+        self._body = table.ToJSon()
 
-        rendered = render_description(request,
-                                      chart.get('description', ''),
-                                      chart.get('description_type', ''))
-        chart['description_rendered'] = rendered
+    def get_body(self):
+        """Get the body, joining the chunks of a streamed download if
+        necessary.
 
-        if 'chartoptions' in chart:
-            # Depending on the chart type different JavaScript libraries
-            # need to be used
-            self.chart_type = chart['charttype']
+        Views able to pass an iterator to the response should use app_iter
+        instead, so that the download is never held in memory as a whole.
+        """
+        if not self.app_iter is None:
+            self._body = ''.join(self.app_iter)
+            self.app_iter = None
+        return self._body
 
-            # Sometimes it is necessary to override the width and height
-            # completely from the outside by just passing the width and height
-            # through the url. This is useful when doing screenshots.
-            if 'width' in request.GET:
-                # width can be overridden from the request query
-                width = int(request.GET['width'])
-                chart['chartoptions']['width'] = width
-            if 'height' in request.GET:
-                # height can be overridden from the request query
-                height = int(request.GET['height'])
-                chart['chartoptions']['height'] = height
+    def set_body(self, body):
+        """Set the body"""
+        self.app_iter = None
+        self._body = body
 
-            # Now render the chart options with the new values
-            rendered = render_chartoptions(chart['chartoptions'])
-            chart['chartoptions_rendered'] = rendered
+    body = property(get_body, set_body)
 
-        # Use the chart id without a postfix as we do for boxes on a page
-        chart['div_id'] = chart['id']
-        self.charts = [chart]
-        self.javascript = render_javascript(self.charts, packages)
+    def render_html(self, request):
+        """Render a resource as HTML"""
+        cells = self.layout.get_cells()
+        restyler = BoxRestyler(request, cells, render=False,
+                               timings=self.timings)
+        restyler.fetch_resources(request)
+        if self.check_etag(request, restyler.get_etag_parts(request)):
+            return
+        restyler.render(request)
+        self.charts = restyler.charts
+        for chart in self.charts:
+            if 'chartoptions' in chart:
+                # Depending on the chart type different JavaScript libraries
+                # need to be used
+                self.chart_type = chart.get('charttype', None)
+        self.javascript = restyler.javascript
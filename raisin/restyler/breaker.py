@@ -0,0 +1,144 @@
+"""Circuit breakers for the backend hosts of the Restish server.
+
+After BREAKER_THRESHOLD failed fetches in a row from the same host, the
+breaker of the host opens and fetches fail right away instead of waiting
+for the backend. After BREAKER_RESET_TIMEOUT seconds one fetch is let
+through as probe: when it succeeds the breaker closes again, otherwise it
+stays open for another BREAKER_RESET_TIMEOUT seconds.
+"""
+
+import time
+import threading
+import urlparse
+from config import BREAKER_THRESHOLD
+from config import BREAKER_RESET_TIMEOUT
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failures, probing for recovery"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        """Start closed, letting every fetch through"""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        # Number of failures in a row, and since when the breaker is open
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        self.trips = 0
+        self.rejections = 0
+        self.probes = 0
+        self.recoveries = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Tell whether a fetch may go to the backend"""
+        self.lock.acquire()
+        try:
+            if self.opened is None:
+                return True
+            if not self.probing and \
+               self.opened + self.reset_timeout <= time.time():
+                self.probing = True
+                self.probes += 1
+                return True
+            self.rejections += 1
+            return False
+        finally:
+            self.lock.release()
+
+    def succeed(self):
+        """Record a successful fetch, closing the breaker"""
+        self.lock.acquire()
+        try:
+            self.failures = 0
+            if not self.opened is None:
+                self.recoveries += 1
+            self.opened = None
+            self.probing = False
+        finally:
+            self.lock.release()
+
+    def fail(self):
+        """Record a failed fetch, opening the breaker when there were too
+        many in a row or when the probe failed.
+        """
+        self.lock.acquire()
+        try:
+            self.failures += 1
+            if self.probing or \
+               (self.opened is None and self.failures >= self.threshold):
+                self.opened = time.time()
+                self.probing = False
+                self.trips += 1
+        finally:
+            self.lock.release()
+
+    def cancel(self):
+        """Record a fetch that failed for another reason than its host.
+        When it was the probe, the next fetch is let through as probe.
+        """
+        self.lock.acquire()
+        try:
+            self.probing = False
+        finally:
+            self.lock.release()
+
+    def is_open(self):
+        """Tell whether fetches are failing fast"""
+        return not self.opened is None
+
+    def stats(self):
+        """Return the counters of the breaker"""
+        return {'open': self.is_open(),
+                'failures': self.failures,
+                'trips': self.trips,
+                'rejections': self.rejections,
+                'probes': self.probes,
+                'recoveries': self.recoveries}
+
+
+class Breakers:
+    """Circuit breakers by backend host"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        """Start without breakers"""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, uri):
+        """Get the breaker of the host of the uri"""
+        host = urlparse.urlparse(uri).netloc
+        self.lock.acquire()
+        try:
+            if not host in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.threshold,
+                                                     self.reset_timeout)
+            return self.breakers[host]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Forget all breakers, closing them"""
+        self.lock.acquire()
+        try:
+            self.breakers.clear()
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return the counters of the breaker of every host"""
+        self.lock.acquire()
+        try:
+            return dict([(host, breaker.stats())
+                         for host, breaker in self.breakers.items()])
+        finally:
+            self.lock.release()
+
+
+# Shared by all resources of the process
+BREAKERS = Breakers()
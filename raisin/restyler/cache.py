@@ -0,0 +1,127 @@
+"""In-process caches for the resources fetched from the Restish server, for
+the charts rendered from them, for the fetches that failed and for the
+compressed bodies of pages and boxes.
+
+Entries are kept in least recently used order and expire after a number of
+seconds. The size of the cache is bounded by the number of bytes of the
+bodies the entries were decoded from, or rendered to. The cached objects are
+shared between all requests of the process, so they must not be modified.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from config import CACHE_MAX_BYTES
+from config import FRAGMENT_CACHE_MAX_BYTES
+from config import NEGATIVE_CACHE_MAX_BYTES
+from config import ENCODED_CACHE_MAX_BYTES
+
+# The names of the caches
+RESOURCES = 'resources'
+FRAGMENTS = 'fragments'
+NEGATIVES = 'negatives'
+ENCODED = 'encoded'
+
+MAX_BYTES = {RESOURCES: CACHE_MAX_BYTES,
+             FRAGMENTS: FRAGMENT_CACHE_MAX_BYTES,
+             NEGATIVES: NEGATIVE_CACHE_MAX_BYTES,
+             ENCODED: ENCODED_CACHE_MAX_BYTES}
+
+_CACHES = {}
+_CACHE_LOCK = threading.Lock()
+
+
+class ResourceCache:
+    """Least recently used cache with expiry times and a limit in bytes"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        """Start with an empty cache"""
+        self.max_bytes = max_bytes
+        # Maps the key to a tuple (value, size, expires)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Get the value stored for the key, or None when there is none"""
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires = entry
+            if expires <= time.time():
+                self.size -= size
+                self.misses += 1
+                return None
+            # Put the entry back as the most recently used one
+            self.entries[key] = entry
+            self.hits += 1
+            return value
+        finally:
+            self.lock.release()
+
+    def store(self, key, value, size, ttl):
+        """Store the value for ttl seconds, evicting the least recently used
+        entries until its size fits into the cache.
+        """
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        self.lock.acquire()
+        try:
+            old = self.entries.pop(key, None)
+            if not old is None:
+                self.size -= old[1]
+            while self.entries and self.size + size > self.max_bytes:
+                evicted_size = self.entries.popitem(last=False)[1][1]
+                self.size -= evicted_size
+                self.evictions += 1
+            self.entries[key] = (value, size, time.time() + ttl)
+            self.size += size
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Remove all entries"""
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return the counters of the cache"""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size}
+
+
+def get_cache(name=RESOURCES):
+    """Get the cache of the given name shared by the whole process"""
+    _CACHE_LOCK.acquire()
+    try:
+        if _CACHES.get(name, None) is None:
+            _CACHES[name] = ResourceCache(MAX_BYTES[name])
+        return _CACHES[name]
+    finally:
+        _CACHE_LOCK.release()
+
+
+def set_cache(cache, name=RESOURCES):
+    """Register the cache of the given name shared by the whole process.
+
+    Passing None drops the current cache, so that a new empty cache is
+    created when it is needed next time.
+    """
+    _CACHE_LOCK.acquire()
+    try:
+        _CACHES[name] = cache
+    finally:
+        _CACHE_LOCK.release()
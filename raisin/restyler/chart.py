@@ -0,0 +1,178 @@
+"""Copy-on-write view of the box configuration of a chart.
+
+The boxes in BOXES are shared by all requests and threads. A chart view
+reads through to the box, but keeps everything written to it, including
+writes to nested dictionaries like the chart options, in the view itself.
+"""
+
+from collections import Mapping
+from collections import MutableMapping
+
+
+class ChartView(object):
+    """Dictionary layered over an underlying mapping that is never changed"""
+
+    __slots__ = ('base', 'local', 'added', 'deleted')
+
+    # Mutable like a dictionary, so not hashable
+    __hash__ = None
+
+    def __init__(self, base):
+        """Start without any changes to the base"""
+        self.base = base
+        # Values written or copied from the base
+        self.local = {}
+        # Keys not in the base, in the order they have been added
+        self.added = []
+        # Keys of the base that have been deleted
+        self.deleted = None
+
+    def __getitem__(self, key):
+        """Get the value from the view, or else from the base.
+
+        Dictionaries and lists of the base are only given out as views or
+        copies, so that changing them leaves the base untouched.
+        """
+        if key in self.local:
+            return self.local[key]
+        if not self.deleted is None and key in self.deleted:
+            raise KeyError(key)
+        value = self.base[key]
+        if isinstance(value, Mapping):
+            value = ChartView(value)
+            self.local[key] = value
+        elif isinstance(value, list):
+            value = list(value)
+            self.local[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        """Set the value in the view"""
+        if not key in self:
+            if not self.deleted is None and key in self.deleted:
+                self.deleted.remove(key)
+            else:
+                self.added.append(key)
+        self.local[key] = value
+
+    def __delitem__(self, key):
+        """Delete the value from the view"""
+        if not key in self:
+            raise KeyError(key)
+        self.local.pop(key, None)
+        if key in self.base:
+            if self.deleted is None:
+                self.deleted = set()
+            self.deleted.add(key)
+        else:
+            self.added.remove(key)
+
+    def __contains__(self, key):
+        """Check whether the view has the key"""
+        if key in self.local:
+            return True
+        if not self.deleted is None and key in self.deleted:
+            return False
+        return key in self.base
+
+    def __iter__(self):
+        """Iterate over the keys of the base followed by the added keys"""
+        for key in self.base:
+            if self.deleted is None or not key in self.deleted:
+                yield key
+        for key in self.added:
+            yield key
+
+    def __len__(self):
+        """Return the number of keys"""
+        deleted = 0
+        if not self.deleted is None:
+            deleted = len(self.deleted)
+        return len(self.base) - deleted + len(self.added)
+
+    def __eq__(self, other):
+        """Compare with other mappings like dictionaries do"""
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.items())
+
+    def __ne__(self, other):
+        """Compare with other mappings like dictionaries do"""
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __repr__(self):
+        """Show the view like a dictionary"""
+        return repr(dict(self.iteritems()))
+
+    def get(self, key, default=None):
+        """Get the value for the key, or the default if there is none"""
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        """Get the value for the key, setting it to the default first if
+        there is none.
+        """
+        if not key in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        """Remove the key and return its value"""
+        if not key in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def update(self, other=(), **kwargs):
+        """Set the values of another mapping or sequence of pairs"""
+        if isinstance(other, Mapping):
+            other = other.items()
+        for key, value in other:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def has_key(self, key):
+        """Check whether the view has the key"""
+        return key in self
+
+    def iterkeys(self):
+        """Iterate over the keys"""
+        return iter(self)
+
+    def itervalues(self):
+        """Iterate over the values"""
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        """Iterate over the keys and values"""
+        for key in self:
+            yield (key, self[key])
+
+    def keys(self):
+        """Return a list of the keys"""
+        return list(self)
+
+    def values(self):
+        """Return a list of the values"""
+        return list(self.itervalues())
+
+    def items(self):
+        """Return a list of the keys and values"""
+        return list(self.iteritems())
+
+    def copy(self):
+        """Return a new view on top of this one"""
+        return ChartView(self)
+
+
+MutableMapping.register(ChartView)
@@ -0,0 +1,144 @@
+"""ETags and compressed bodies for pages and boxes.
+
+Pages and boxes render the same output for the same resources, so their
+ETag is a fingerprint of the digests of their resources, the url and
+TEMPLATE_VERSION. A request already having the ETag is answered without
+rendering anything. Bodies compressed with gzip or deflate are kept in the
+encoded cache by ETag, so that every body is compressed only once.
+"""
+
+import gzip
+import zlib
+import urllib
+from hashlib import md5
+from cStringIO import StringIO
+from config import TEMPLATE_VERSION
+from config import COMPRESS_LEVEL
+from config import COMPRESS_MIN_BYTES
+from config import ENCODED_TTL
+from cache import get_cache
+from cache import ENCODED
+
+# The content codings bodies are compressed with, the preferred one first
+ENCODINGS = ['gzip', 'deflate']
+
+
+def get_etag(parts):
+    """Get a strong ETag from the parts a body was rendered from, or None
+    when not all of them are known.
+    """
+    fingerprint = md5(TEMPLATE_VERSION)
+    for part in parts:
+        if part is None:
+            return None
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        fingerprint.update('\0' + part)
+    return '"%s"' % fingerprint.hexdigest()
+
+
+def get_request_parts(request):
+    """Get the parts of the request the output depends on: the url and the
+    parameters, like the width and height of a box.
+    """
+    parameters = sorted(getattr(request, 'GET', {}).items())
+    return [request.url, urllib.urlencode(parameters)]
+
+
+def get_header(request, name):
+    """Get a header of the request, or an empty string"""
+    headers = getattr(request, 'headers', None) or {}
+    return headers.get(name, '') or ''
+
+
+def is_not_modified(request, etag):
+    """Tell whether the If-None-Match header of the request has the ETag"""
+    if etag is None:
+        return False
+    for tag in get_header(request, 'If-None-Match').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+
+def get_encoding(request):
+    """Get the content coding of ENCODINGS the request accepts with the
+    highest quality, or None when it accepts none of them.
+    """
+    qualities = {}
+    for part in get_header(request, 'Accept-Encoding').split(','):
+        pieces = part.split(';')
+        coding = pieces[0].strip().lower()
+        quality = 1.0
+        for parameter in pieces[1:]:
+            parameter = parameter.strip()
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    best, best_quality = None, 0.0
+    for coding in ENCODINGS:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def encode(body, encoding):
+    """Compress a body with a content coding of ENCODINGS. The gzip header
+    has no time stamp, so the same body is always compressed the same way.
+    """
+    if encoding == 'gzip':
+        buffer = StringIO()
+        compressor = gzip.GzipFile(fileobj=buffer, mode='wb',
+                                   compresslevel=COMPRESS_LEVEL, mtime=0)
+        try:
+            compressor.write(body)
+        finally:
+            compressor.close()
+        return buffer.getvalue()
+    if encoding == 'deflate':
+        return zlib.compress(body, COMPRESS_LEVEL)
+    raise ValueError("Unknown content coding %s" % encoding)
+
+
+class Conditional(object):
+    """Answers conditional requests and compresses bodies by ETag"""
+
+    # ETag of the rendered output, None when it is not known
+    etag = None
+    # Whether the request has the ETag already, so nothing was rendered
+    not_modified = False
+
+    def check_etag(self, request, parts):
+        """Set the ETag from the parts the output is rendered from, and tell
+        whether the request has it already.
+        """
+        self.etag = get_etag(parts)
+        self.not_modified = is_not_modified(request, self.etag)
+        return self.not_modified
+
+    def encode_body(self, request, body):
+        """Get the content coding the request accepts and the body encoded
+        with it. The content coding is None for bodies sent as they are.
+        """
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        encoding = get_encoding(request)
+        if encoding is None or body is None or \
+                len(body) < COMPRESS_MIN_BYTES:
+            return None, body
+        if self.etag is None:
+            return encoding, encode(body, encoding)
+        encoded_cache = get_cache(ENCODED)
+        key = (self.etag, encoding)
+        encoded = encoded_cache.get(key)
+        if encoded is None:
+            encoded = encode(body, encoding)
+            encoded_cache.store(key, encoded, len(encoded), ENCODED_TTL)
+        return encoding, encoded
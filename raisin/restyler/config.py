@@ -1,6 +1,124 @@
-"""Define some mime type constants"""
+"""Define some mime type constants and settings"""
 
 
 JSON = 'application/json'
 PICKLED = 'text/x-python-pickled-dict'
 CSV = 'text/csv'
+COLUMNAR = 'application/x-raisin-columnar'
+
+# Maximum number of resources fetched at the same time for one page
+MAX_CONCURRENT_FETCHES = 8
+# Maximum number of threads helping the requests of the whole process with
+# fetching resources
+MAX_FETCH_THREADS = 32
+
+# Maximum number of keep-alive connections kept per backend host
+POOL_SIZE = 10
+# Seconds an unused keep-alive connection stays open
+POOL_IDLE_TIMEOUT = 60
+
+# Maximum number of bytes of resource bodies kept in the cache
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Seconds a resource stays in the cache, unless a ttl is given for it in
+# RESOURCE_TTLS or as ttl key of the resource in RESOURCES. 0 disables caching
+CACHE_TTL = 300
+RESOURCE_TTLS = {'project_projects': 3600}
+# Seconds after which a cached resource is refreshed in the background while
+# it is still served from the cache, unless a soft_ttl is given for it in
+# RESOURCE_SOFT_TTLS or as soft_ttl key of the resource in RESOURCES. None
+# disables refreshing in the background
+CACHE_SOFT_TTL = 60
+RESOURCE_SOFT_TTLS = {'project_projects': 600}
+# Key the cached resources of every project on a version token of its data
+# and keep them for VERSIONED_TTL seconds instead. The token changes with
+# VERSIONS.bump(project_name), and when VERSION_RESOURCE names a resource in
+# RESOURCES, with its body, fetched again every VERSION_CHECK_INTERVAL
+# seconds
+VERSION_TOKENS = False
+VERSION_RESOURCE = None
+VERSION_CHECK_INTERVAL = 10
+VERSIONED_TTL = 30 * 24 * 3600
+
+# Build the JavaScript of the charts with plain strings instead of rendering
+# templates/javascript.pt. Both give exactly the same output
+JAVASCRIPT_FAST_PATH = True
+
+# Let the browser load the data of the charts of a page from the .json urls
+# of their boxes once they are scrolled into view, instead of putting all
+# data into the JavaScript of the page
+LAZY_CHART_DATA = False
+
+# Let the browser load the rows of paged Table charts one page at a time
+# from the .json urls of their boxes, asking for offset and limit. Pages of
+# boxes have at most MAX_PAGE_SIZE rows
+PAGED_TABLES = False
+MAX_PAGE_SIZE = 1000
+
+# Downsample the data of series charts to DOWNSAMPLE_POINTS_PER_PIXEL points
+# per pixel of their width, and HeatMap charts with a height to cells of
+# HEATMAP_CELL_SIZE pixels. Charts without a width are taken to be
+# DOWNSAMPLE_WIDTH pixels wide
+DOWNSAMPLE_CHARTS = False
+DOWNSAMPLE_POINTS_PER_PIXEL = 2
+DOWNSAMPLE_WIDTH = 900
+HEATMAP_CELL_SIZE = 8
+
+# Maximum number of bytes of rendered charts kept in the cache, and the
+# seconds they stay there. Rendered charts are looked up by a fingerprint of
+# their resources, so they never get out of date
+FRAGMENT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+FRAGMENT_TTL = 3600
+
+# Part of the ETags of pages and boxes. Change it whenever the rendered
+# output changes for the same resources, so that browsers fetch it again
+TEMPLATE_VERSION = '1'
+# Maximum number of bytes of compressed bodies kept in the cache, and the
+# seconds they stay there. Bodies smaller than COMPRESS_MIN_BYTES are not
+# compressed
+ENCODED_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ENCODED_TTL = 3600
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_BYTES = 512
+
+# Maximum number of bytes of a chunk when streaming bodies of resources
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Ask the Restish server for tables in the columnar format of wire.py
+# instead of pickles. Servers not knowing the format keep sending pickles
+NEGOTIATE_COLUMNAR = False
+ACCEPT_COLUMNAR = '%s, %s;q=0.5' % (COLUMNAR, PICKLED)
+
+# Seconds a failed fetch is remembered, so that it is not tried again by
+# every request, and the maximum number of bytes of uris remembered
+NEGATIVE_TTL = 10
+NEGATIVE_CACHE_MAX_BYTES = 1024 * 1024
+
+# Failed fetches in a row after which fetches from a backend host fail fast,
+# and seconds to wait before trying the backend host again
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Fetch the resources of the other tabs of a page and of the pages of its
+# first PREFETCH_REPLICATES replicates into the cache in the background.
+# PREFETCH_WORKERS threads start at most PREFETCH_RATE prefetches per second,
+# and drop new ones when PREFETCH_QUEUE_SIZE are waiting
+PREFETCH = False
+PREFETCH_REPLICATES = 5
+PREFETCH_WORKERS = 2
+PREFETCH_RATE = 10
+PREFETCH_QUEUE_SIZE = 100
+
+# Pages whose resources are fetched into the cache at the same time when
+# warming the cache
+WARMUP_CONCURRENCY = 4
+
+# Record the time and bytes of the stages of building pages and boxes, and
+# keep histograms of them
+TIMINGS = True
+# Fraction of the requests run under cProfile. The profiles of the last
+# PROFILE_KEEP requests taking at least PROFILE_SLOW_SECONDS are kept, and
+# written to PROFILE_DIRECTORY unless it is None
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_SLOW_SECONDS = 1.0
+PROFILE_KEEP = 10
+PROFILE_DIRECTORY = None
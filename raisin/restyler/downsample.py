@@ -0,0 +1,226 @@
+"""Downsample the data of charts to the number of points they can show.
+
+Series charts keep the points chosen by largest-triangle-three-buckets for
+each series, which keeps peaks and dips visible. HeatMap charts with a
+height average buckets of neighbouring rows and columns, so that every cell
+is at least HEATMAP_CELL_SIZE pixels high and wide.
+
+The transforms work on the columns of the decoded gviz JSON data, and give
+back the JSON unchanged when there is nothing to downsample. Tables holding
+several series one after the other, like the ones of the ImageSparkLine
+charts drawing one sparkline per lane, are left as they are, as the points
+of one series can't be told from the others.
+"""
+
+import json
+from config import DOWNSAMPLE_POINTS_PER_PIXEL
+from config import DOWNSAMPLE_WIDTH
+from config import HEATMAP_CELL_SIZE
+
+# Charts plotting the rows as points of series, with the x values in the
+# first column
+SERIES_CHARTS = ['LineChart', 'AreaChart', 'ScatterChart']
+NUMBER_TYPES = ['number']
+
+
+def get_value(cell):
+    """Get the value of a cell of a gviz JSON row"""
+    if cell is None:
+        return None
+    return cell.get('v', None)
+
+
+def get_column(rows, index):
+    """Get the values of a column of gviz JSON rows"""
+    return [get_value(row['c'][index]) if index < len(row['c']) else None
+            for row in rows]
+
+
+def to_numbers(values):
+    """Get the values as floats, with missing values as 0"""
+    return [float(value) if not value is None else 0.0 for value in values]
+
+
+def lttb(xs, ys, threshold):
+    """Get the indices of the points kept by largest-triangle-three-buckets.
+
+    The first and the last point are always kept. Of the points in between,
+    split into threshold - 2 buckets, the one forming the largest triangle
+    with the point kept before and the average of the next bucket is kept.
+    """
+    count = len(ys)
+    if threshold >= count or threshold < 3:
+        return range(count)
+    every = float(count - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in xrange(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        next_count = next_end - end
+        average_x = sum(xs[end:next_end]) / next_count
+        average_y = sum(ys[end:next_end]) / next_count
+        x, y = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for index in xrange(start, end):
+            area = abs((x - average_x) * (ys[index] - y) -
+                       (x - xs[index]) * (average_y - y))
+            if area > best_area:
+                best, best_area = index, area
+        selected.append(best)
+        previous = best
+    selected.append(count - 1)
+    return selected
+
+
+def is_sorted(values):
+    """Tell whether the values never decrease"""
+    for index in xrange(1, len(values)):
+        if values[index] < values[index - 1]:
+            return False
+    return True
+
+
+def downsample_series(data, threshold):
+    """Keep at most threshold rows of the series of gviz JSON data.
+
+    Data with columns other than the first that are not numbers, or with x
+    values that start again, holds several series one after the other and
+    is left as it is.
+    """
+    rows = data['rows']
+    if len(rows) <= threshold:
+        return data
+    cols = data['cols']
+    if not cols:
+        return data
+    for col in cols[1:]:
+        if col.get('type', None) not in NUMBER_TYPES:
+            return data
+    if cols[0].get('type', None) not in NUMBER_TYPES:
+        xs = [float(index) for index in xrange(len(rows))]
+    else:
+        xs = to_numbers(get_column(rows, 0))
+        if not is_sorted(xs):
+            return data
+    series = range(1, len(cols))
+    if not series:
+        return data
+    # Share the points between the series, keeping the peaks of each
+    kept = set()
+    per_series = max(threshold // len(series), 3)
+    for index in series:
+        kept.update(lttb(xs, to_numbers(get_column(rows, index)),
+                         per_series))
+    downsampled = dict(data)
+    downsampled['rows'] = [rows[index] for index in sorted(kept)]
+    return downsampled
+
+
+def get_buckets(count, limit):
+    """Split count items into at most limit buckets of neighbours"""
+    size = -(-count // limit)
+    return [(start, min(start + size, count))
+            for start in xrange(0, count, size)]
+
+
+def get_label(labels):
+    """Get the label of a bucket from the labels of its first and last
+    items.
+    """
+    labels = [unicode(label) for label in labels if not label is None]
+    if not labels:
+        return None
+    if len(labels) == 1 or labels[0] == labels[-1]:
+        return labels[0]
+    return u'%s - %s' % (labels[0], labels[-1])
+
+
+def get_mean(values):
+    """Get the mean of the values, ignoring missing ones"""
+    values = [float(value) for value in values if not value is None]
+    if not values:
+        return None
+    return sum(values) / len(values)
+
+
+def downsample_matrix(data, max_rows, max_columns):
+    """Average buckets of neighbouring rows and value columns of the gviz
+    JSON data of a heat map. The first column holds the names of the rows.
+    Data with value columns that are not numbers is left as it is.
+    """
+    cols = data['cols']
+    rows = data['rows']
+    if len(rows) <= max_rows and len(cols) - 1 <= max_columns:
+        return data
+    for col in cols[1:]:
+        if col.get('type', None) not in NUMBER_TYPES:
+            return data
+    names = get_column(rows, 0)
+    columns = [get_column(rows, index) for index in xrange(1, len(cols))]
+    row_buckets = get_buckets(len(rows), max(max_rows, 1))
+    column_buckets = get_buckets(len(columns), max(max_columns, 1))
+    new_cols = [cols[0]]
+    new_columns = []
+    for start, end in column_buckets:
+        col = dict(cols[start + 1])
+        col['id'] = get_label([cols[index + 1].get('id', None)
+                               for index in (start, end - 1)])
+        col['label'] = get_label([cols[index + 1].get('label', None)
+                                  for index in (start, end - 1)])
+        new_cols.append(col)
+        new_columns.append([get_mean([value
+                                      for column in columns[start:end]
+                                      for value in column[first:last]])
+                            for first, last in row_buckets])
+    new_rows = []
+    for position, (first, last) in enumerate(row_buckets):
+        cells = [{'v': get_label([names[first], names[last - 1]])}]
+        cells.extend([{'v': column[position]} for column in new_columns])
+        new_rows.append({'c': cells})
+    downsampled = dict(data)
+    downsampled['cols'] = new_cols
+    downsampled['rows'] = new_rows
+    return downsampled
+
+
+def get_size(chartoptions, key, default):
+    """Get the rendered width or height of a chart in pixels"""
+    try:
+        return int(chartoptions[key])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+def downsample_chart(body, charttype, chartoptions):
+    """Downsample the gviz JSON data of a chart to the width and height it
+    is rendered with. Returns the body unchanged when the chart type is not
+    downsampled, a HeatMap has no height, the data is not valid JSON or it
+    is small enough already.
+    """
+    if not charttype in SERIES_CHARTS and charttype != 'HeatMap':
+        return body
+    height = get_size(chartoptions, 'height', None)
+    if charttype == 'HeatMap' and height is None:
+        # The rows of heat maps are genes, which are only averaged when
+        # they are too many for the height the chart is given
+        return body
+    try:
+        data = json.loads(body)
+    except (ValueError, TypeError):
+        return body
+    if not isinstance(data, dict) or not 'cols' in data or \
+       not 'rows' in data:
+        # Not gviz data
+        return body
+    width = get_size(chartoptions, 'width', DOWNSAMPLE_WIDTH)
+    if charttype == 'HeatMap':
+        downsampled = downsample_matrix(data, height // HEATMAP_CELL_SIZE,
+                                        width // HEATMAP_CELL_SIZE)
+    else:
+        downsampled = downsample_series(data,
+                                        width * DOWNSAMPLE_POINTS_PER_PIXEL)
+    if downsampled is data:
+        return body
+    return json.dumps(downsampled, separators=(',', ':'))
@@ -0,0 +1,98 @@
+"""Run resource fetches concurrently with a bounded number of threads.
+
+The calling thread works through the jobs itself, helped by at most
+concurrency - 1 helper threads. Helper threads are shared by the whole
+process through a semaphore of MAX_FETCH_THREADS, so that nested and
+concurrent callers do not multiply the number of requests to the Restish
+server. When no helper is free, the calling thread does the jobs alone,
+which can't deadlock.
+"""
+
+import sys
+import threading
+from config import MAX_CONCURRENT_FETCHES
+from config import MAX_FETCH_THREADS
+
+# Helper threads that may be running in the whole process
+HELPERS = threading.BoundedSemaphore(MAX_FETCH_THREADS)
+
+
+class Jobs(object):
+    """Hands out the jobs of one call to the threads working on them"""
+
+    def __init__(self, function, jobs):
+        """Start with no results"""
+        self.function = function
+        self.jobs = jobs
+        self.results = [None] * len(jobs)
+        self.next = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Get the index of the next job, or None when all are taken or one
+        has failed.
+        """
+        self.lock.acquire()
+        try:
+            if self.next >= len(self.jobs) or not self.error is None:
+                return None
+            index = self.next
+            self.next += 1
+            return index
+        finally:
+            self.lock.release()
+
+    def work(self):
+        """Do jobs until none is left"""
+        while True:
+            index = self.take()
+            if index is None:
+                return
+            try:
+                self.results[index] = self.function(*self.jobs[index])
+            except:
+                self.lock.acquire()
+                if self.error is None:
+                    self.error = sys.exc_info()
+                self.lock.release()
+                return
+
+    def help(self):
+        """Do jobs in a helper thread, freeing the helper afterwards"""
+        try:
+            self.work()
+        finally:
+            HELPERS.release()
+
+
+def fetch_concurrently(function, jobs, concurrency=None):
+    """Call function(*job) for every job and return the results in the
+    order of the jobs.
+
+    At most concurrency calls are running at the same time, so that the
+    Restish server does not get flooded with requests. The first exception
+    raised by a call is raised again.
+    """
+    if concurrency is None:
+        concurrency = MAX_CONCURRENT_FETCHES
+    calls = Jobs(function, list(jobs))
+    helpers = []
+    while len(helpers) < min(concurrency, len(calls.jobs)) - 1:
+        if not HELPERS.acquire(False):
+            # All helpers are busy elsewhere
+            break
+        helper = threading.Thread(target=calls.help)
+        helper.setDaemon(True)
+        try:
+            helper.start()
+        except:
+            HELPERS.release()
+            raise
+        helpers.append(helper)
+    calls.work()
+    for helper in helpers:
+        helper.join()
+    if not calls.error is None:
+        raise calls.error[0], calls.error[1], calls.error[2]
+    return calls.results
@@ -0,0 +1,128 @@
+"""Collapse concurrent fetches of the same resource into a single fetch.
+
+When many requests ask for the same expanded uri at the same time, only the
+first one goes to the Restish server. The others wait for it and share its
+result, even when that result is None. Batches of resources fetched with
+one call only fetch the resources no other call is fetching already, and
+wait for the others. The calls made and collapsed are
+counted per resource name, so that the counters do not grow with every uri
+the process has fetched.
+"""
+
+import sys
+import threading
+
+
+class Flight:
+    """A call in progress, with the result waiting callers are given"""
+
+    def __init__(self):
+        """Prepare the event set when the call has finished"""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run only one call at a time per key, sharing its result"""
+
+    def __init__(self):
+        """Start without calls in progress"""
+        self.lock = threading.Lock()
+        self.flights = {}
+        # Number of calls made and number of calls collapsed per name
+        self.calls = {}
+        self.collapsed = {}
+
+    def do(self, name, key, function, *args):
+        """Return function(*args), or the result of the call in progress
+        for the same key. The call is counted for the name.
+        """
+        self.lock.acquire()
+        flight = self.flights.get(key, None)
+        if not flight is None:
+            self.collapsed[name] = self.collapsed.get(name, 0) + 1
+            self.lock.release()
+            flight.done.wait()
+            if not flight.error is None:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            return flight.result
+        flight = Flight()
+        self.flights[key] = flight
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.lock.release()
+        try:
+            flight.result = function(*args)
+        except:
+            flight.error = sys.exc_info()
+            raise
+        finally:
+            self.lock.acquire()
+            del self.flights[key]
+            self.lock.release()
+            flight.done.set()
+        return flight.result
+
+    def do_many(self, calls, function, *args):
+        """Return the results of function(items, *args) for the items whose
+        key has no call in progress, and of the calls in progress for the
+        others, as a dictionary mapping the items to the results.
+
+        calls is a list of (name, key, item), and function has to return a
+        dictionary mapping the items it is given to their results. Every
+        call is counted for its name.
+        """
+        led = []
+        joined = []
+        self.lock.acquire()
+        for name, key, item in calls:
+            flight = self.flights.get(key, None)
+            if flight is None:
+                flight = Flight()
+                self.flights[key] = flight
+                self.calls[name] = self.calls.get(name, 0) + 1
+                led.append((key, item, flight))
+            else:
+                self.collapsed[name] = self.collapsed.get(name, 0) + 1
+                joined.append((item, flight))
+        self.lock.release()
+        if led:
+            try:
+                loaded = function([item for key, item, flight in led], *args)
+                for key, item, flight in led:
+                    flight.result = loaded[item]
+            except:
+                error = sys.exc_info()
+                for key, item, flight in led:
+                    flight.error = error
+                raise
+            finally:
+                self.lock.acquire()
+                for key, item, flight in led:
+                    del self.flights[key]
+                self.lock.release()
+                for key, item, flight in led:
+                    flight.done.set()
+        results = dict([(item, flight.result) for key, item, flight in led])
+        for item, flight in joined:
+            flight.done.wait()
+            if not flight.error is None:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            results[item] = flight.result
+        return results
+
+    def stats(self):
+        """Return the number of calls made and collapsed for every name"""
+        self.lock.acquire()
+        try:
+            stats = {}
+            for name, calls in self.calls.items():
+                stats[name] = {'calls': calls,
+                               'collapsed': self.collapsed.get(name, 0)}
+            return stats
+        finally:
+            self.lock.release()
+
+
+# Shared by all resources of the process
+FLIGHTS = SingleFlight()
@@ -1,16 +1,44 @@
 """Page object rendered according to a layout"""
 
+import re
+import time
 import urlparse
+from hashlib import md5
 from config import JSON
 from config import PICKLED
+from config import FRAGMENT_TTL
+from config import LAZY_CHART_DATA
+from config import PAGED_TABLES
+from config import DOWNSAMPLE_CHARTS
+from config import PREFETCH
+from config import PREFETCH_REPLICATES
 from renderers import render_javascript
 from renderers import render_chartoptions
 from renderers import render_description
-from raisin.box import RESOURCES_REGISTRY
 from raisin.page import PAGES
 from raisin.box import BOXES
-from raisin.restkit import ResourceProvider
 from resource import Resource
+from cache import get_cache
+from cache import FRAGMENTS
+from cache import NEGATIVES
+from registry import resolve_resources
+from chart import ChartView
+from conditional import Conditional
+from conditional import get_request_parts
+from timing import Timings
+from timing import RENDER
+from timing import JAVASCRIPT
+from prefetch import PREFETCHER
+from downsample import downsample_chart
+
+
+def get_rendered_size(chart):
+    """Return the number of bytes of the strings in a rendered chart"""
+    size = 0
+    for value in chart.values():
+        if isinstance(value, basestring):
+            size += len(value)
+    return size
 
 
 def get_absolute_url(request):
@@ -25,8 +53,49 @@ def get_absolute_url(request):
     return absolute_url
 
 
+def compile_routes(pages):
+    """Compile the paths of the pages to regular expressions.
+
+    Returns a list of (regular expression, layout id), with the paths having
+    the most literal parts first.
+    """
+    routes = []
+    for layout_id, layout in pages.items():
+        pattern = ''
+        literals = 0
+        for part in layout['path'].split('/'):
+            if not part:
+                continue
+            if part.startswith('{') and part.endswith('}'):
+                pattern += '/(?P<%s>[^/]+)' % part[1:-1]
+            else:
+                pattern += '/' + re.escape(part)
+                literals += 1
+        routes.append((literals, re.compile('^%s/?$' % pattern), layout_id))
+    routes.sort(key=lambda route: route[0], reverse=True)
+    return [(regex, layout_id) for literals, regex, layout_id in routes]
+
+
+ROUTES = compile_routes(PAGES)
+
+
+def match_path(path):
+    """Get the layout id and the matchdict of a page path, or raise a
+    ValueError when no page has this path.
+    """
+    for regex, layout_id in ROUTES:
+        match = regex.match(path)
+        if not match is None:
+            return layout_id, match.groupdict()
+    raise ValueError("No page for path %s" % path)
+
+
 class Cells(object):
-    """Provides information on what cells charts are located in."""
+    """Provides information on what cells charts are located in.
+
+    The cells are compiled once from the view, and shared by all requests,
+    so they must not be modified.
+    """
 
     def __init__(self, view):
         # Remember which columns the cells occupy
@@ -34,14 +103,15 @@ class Cells(object):
         # For each cell, remember whether it starts a new row
         self.new_row_for_cells = {}
         # The names in the cells of the layout correspond to the charts
-        self.cells = []
-        if type(view['rows']) == type(''):
-            view['rows'] = [view['rows']]
-        for row in view['rows']:
+        cells = []
+        rows = view['rows']
+        if type(rows) == type(''):
+            rows = [rows]
+        for row in rows:
             # Check the number of cells in the row isn't too big
             columns = view[row]
             if type(columns['columns']) == type(''):
-                self.cells.append(columns['columns'])
+                cells.append(columns['columns'])
                 self.columns_for_cells[columns['columns']] = view['cols'][0]
             else:
                 if len(columns['columns']) > len(view['cols']):
@@ -55,18 +125,24 @@ class Cells(object):
                         self.new_row_for_cells[column] = True
                     else:
                         self.new_row_for_cells[column] = False
-                    self.cells.append(column)
+                    cells.append(column)
                     if column in self.columns_for_cells:
                         # There is already a column occupied by this item
                         self.columns_for_cells[column] += view['cols'][index]
                     else:
                         self.columns_for_cells[column] = view['cols'][index]
                     index += 1
+        self.cells = tuple(cells)
+        self.resources = resolve_resources(self.cells)
 
     def get_cells(self):
         """Get the cells"""
         return self.cells
 
+    def get_resources(self):
+        """Get the resources referenced from the cells"""
+        return self.resources
+
     def get_column_for_chart(self, chart_id):
         """Returns the column for a chart"""
         return self.columns_for_cells[chart_id]
@@ -76,6 +152,32 @@ class Cells(object):
         return self.new_row_for_cells[chart_id]
 
 
+def compile_layouts(pages):
+    """Compile the cells of every view in the pages once, so that errors in
+    the configuration show up at startup.
+
+    Returns a dictionary mapping the layout id and tab name to the cells.
+    Layouts without tabs use None as tab name.
+    """
+    layouts = {}
+    for layout_id, layout in pages.items():
+        if 'tabbed_views' in layout:
+            for tab_name in layout['tabbed_views']:
+                layouts[(layout_id, tab_name)] = Cells(layout[tab_name])
+        else:
+            layouts[(layout_id, None)] = Cells(layout)
+    return layouts
+
+
+LAYOUTS = compile_layouts(PAGES)
+
+
+def prefetch_cells(cells, matchdict):
+    """Fetch the resources of the charts in the cells into the cache"""
+    restyler = Restyler(None, cells, render=False)
+    restyler.resource.get_many(restyler.get_wanted(), matchdict)
+
+
 class Layout(object):
     """Provides information on the layout and its cells."""
 
@@ -85,17 +187,17 @@ class Layout(object):
             self.layout_id = self.layout_id[len('tab_'):]
         self.layout = PAGES[self.layout_id]
         if self.layout_id in ['homepage', 'experiment_subset']:
+            tab_name = None
             view = self.layout
         elif self.layout_id in ['project', 'experiment', 'replicate', 'lane']:
             tab_name = request.matchdict.get('tab_name', None)
-            if tab_name in self.layout:
-                view = self.layout[tab_name]
-            else:
-                view = self.layout[self.layout['tabbed_views'][0]]
+            if not tab_name in self.layout['tabbed_views']:
+                tab_name = self.layout['tabbed_views'][0]
+            view = self.layout[tab_name]
         else:
             raise AttributeError
         self.view = view
-        self.cells = Cells(self.view)
+        self.cells = LAYOUTS[(self.layout_id, tab_name)]
 
     def get_cells(self):
         """Get the cells"""
@@ -117,47 +219,129 @@ class Layout(object):
 class Restyler(object):
     """Gets resources and renders them as charts"""
 
-    def __init__(self, request, cells):
-        resource_provider = ResourceProvider()
-        self.resource = Resource(resource_provider)
+    # Let the browser load the data of the charts from their .json urls
+    lazy = LAZY_CHART_DATA
+    # Let the browser load paged tables one page at a time
+    paged = PAGED_TABLES
+    # Ship only as many points as the charts can show
+    downsample = DOWNSAMPLE_CHARTS
+
+    def __init__(self, request, cells, wanted=None, render=True,
+                 timings=None):
+        self.timings = timings
+        self.resource = Resource(cache=get_cache(),
+                                 negatives=get_cache(NEGATIVES),
+                                 timings=timings)
         self.cells = cells
+        # Other resources fetched together with the ones of the charts
+        self.wanted = wanted or []
+        self.fetched = None
         self.resources = self.get_resources()
+        self.charts = []
+        self.packages = set()
+        self.javascript = None
+        if render:
+            self.render(request)
+
+    def render(self, request):
+        """Render the charts and their JavaScript"""
         self.charts = self.get_charts(request)
         self.packages = self.get_packages()
+        started = time.time()
         self.javascript = render_javascript(self.charts, self.packages)
+        self.record(JAVASCRIPT, None, started, len(self.javascript or ''))
+
+    def record(self, stage, name, started, size):
+        """Record the time since started and the bytes of a stage"""
+        if not self.timings is None:
+            self.timings.record(stage, name, time.time() - started, size)
 
     def get_charts(self, request):
-        """Return the charts needed for rendering"""
+        """Return the charts needed for rendering.
+
+        Rendered charts are kept in the fragment cache, so that they are
+        only rendered again when their resources have changed.
+        """
         url = get_absolute_url(request)
+        fragments = get_cache(FRAGMENTS)
+        fetched = self.get_fetched(request)
         charts = []
-        for chart in self.get_chart_infos(request):
-            chart['chartoptions_rendered'] = ""
-            # Render the chart to JSon
-            if not JSON in chart or chart[JSON] is None:
-                pass
-            elif not 'charttype' in chart:
-                pass
-            else:
-                chart['data'] = chart[JSON]
-                chart['chartoptions']['is3D'] = False
-                rendered = render_chartoptions(chart['chartoptions'])
-                chart['chartoptions_rendered'] = rendered
-                chart['csv_download_url'] = url + "%s.csv" % chart['id']
-                chart['html_download_url'] = url + "%s.html" % chart['id']
+        for name, method, content_types in self.resources:
+            fingerprint = self.get_fingerprint(name, content_types, request)
+            if fingerprint is None:
+                # Not all resources needed for the chart are available
+                continue
+            key = (name, fingerprint, url)
+            chart = fragments.get(key)
+            if chart is None:
+                started = time.time()
+                chart = self.get_chart_info(name, method, content_types,
+                                            fetched)
+                self.render_chart(request, chart, url)
+                # Only the rendered strings are kept, the fetched resources
+                # stay in the resource cache alone
+                for ctype in self.get_content_types(name, content_types):
+                    del chart[ctype]
+                size = get_rendered_size(chart)
+                self.record(RENDER, name, started, size)
+                fragments.store(key, chart, size, FRAGMENT_TTL)
+            # The cached chart is shared, so only change a copy of it
+            chart = chart.copy()
             chart['module_id'] = self.get_module_id(chart)
             if self.cells.get_new_row_for_chart(chart['id']):
                 chart['module_style'] = "clear: both;"
             else:
                 chart['module_style'] = ""
-            rendered = render_description(request,
-                                          chart.get('description', ''),
-                                          chart.get('description_type', ''))
-            chart['description_rendered'] = rendered
             # Use an id with the postfox '_div' to make collisions unprobable
             chart['div_id'] = chart['id'] + '_div'
             charts.append(chart)
         return charts
 
+    def render_chart(self, request, chart, url):
+        """Render the chart options and description of a chart"""
+        chart['chartoptions_rendered'] = ""
+        # Render the chart to JSon
+        if not 'charttype' in chart:
+            pass
+        elif chart.get('lazy', False):
+            # The browser loads the data from the JSON download of the box
+            chart['data_url'] = url + "%s.json" % chart['id']
+        elif not JSON in chart or chart[JSON] is None:
+            pass
+        else:
+            chart['data'] = self.get_data(chart)
+        if 'data' in chart or 'data_url' in chart:
+            chart['chartoptions']['is3D'] = False
+            rendered = render_chartoptions(chart['chartoptions'])
+            chart['chartoptions_rendered'] = rendered
+            chart['csv_download_url'] = url + "%s.csv" % chart['id']
+            chart['html_download_url'] = url + "%s.html" % chart['id']
+        rendered = render_description(request,
+                                      chart.get('description', ''),
+                                      chart.get('description_type', ''))
+        chart['description_rendered'] = rendered
+
+    def get_data(self, chart):
+        """Get the JSON data of a chart, downsampled to its width and
+        height.
+        """
+        if not self.downsample:
+            return chart[JSON]
+        return downsample_chart(chart[JSON], chart['charttype'],
+                                chart.get('chartoptions', {}))
+
+    def get_fingerprint(self, name, content_types, request):
+        """Return a fingerprint of the resources of a chart, or None when
+        not all of them have been got.
+        """
+        fingerprint = md5(name)
+        for ctype in self.get_content_types(name, content_types):
+            digest = self.resource.get_digest(name, ctype, request.matchdict)
+            if digest is None:
+                return None
+            fingerprint.update(digest)
+        return fingerprint.hexdigest()
+
     def get_module_id(self, chart):
         """Return the HTML id attribute value for the chart."""
         return self.cells.get_column_for_chart(chart['id'])
@@ -173,61 +357,167 @@ class Restyler(object):
                 packages.add(chart['charttype'].lower())
         return packages
 
+    def get_content_types(self, name, content_types):
+        """Get the content types fetched for a chart. In lazy mode and for
+        paged tables, the JSON data is loaded by the browser instead.
+        """
+        if self.lazy or self.is_paged(name):
+            return [ctype for ctype in content_types if ctype != JSON]
+        return content_types
+
+    def is_paged(self, name):
+        """Tell whether the rows of a chart are loaded one page at a time"""
+        if not self.paged:
+            return False
+        box = BOXES[name]
+        chartoptions = box.get('chartoptions', {})
+        return box.get('charttype', None) == 'Table' and \
+            chartoptions.get('page', None) == 'enable' and \
+            'pageSize' in chartoptions
+
     def get_resources(self):
         """Get a list of all resources"""
-        resources = []
-        # And keep track of any that were not found
-        unknown = set(self.cells.get_cells())
-        # Go through the registry, and take only the resources that are
-        # referenced from the cells of the layout
-        for resource in RESOURCES_REGISTRY:
-            if resource[0] in self.cells.get_cells():
-                if resource[0] in unknown:
-                    # This is a known resource, so remove it from the unknown
-                    unknown.remove(resource[0])
-                # Avoid duplicates
-                if not resource in resources:
-                    resources.append(resource[:])
-        if len(unknown) > 0:
-            print "Unknown resources: %s" % unknown
-            raise AttributeError
-        return resources
+        return self.cells.get_resources()
+
+    def get_wanted(self):
+        """Get the names and content types of all resources fetched"""
+        wanted = list(self.wanted)
+        for name, method, content_types in self.resources:
+            for ctype in self.get_content_types(name, content_types):
+                wanted.append((name, ctype))
+        return wanted
+
+    def fetch_resources(self, request):
+        """Fetch the wanted content types of all resources, and the other
+        wanted resources, in one batch.
+
+        Returns a dictionary mapping (name, content type) to the result.
+        """
+        self.fetched = self.resource.get_many(self.get_wanted(),
+                                              request.matchdict)
+        return self.fetched
+
+    def get_fetched(self, request):
+        """Get the fetched resources, fetching them if not done yet"""
+        if self.fetched is None:
+            self.fetch_resources(request)
+        return self.fetched
+
+    def get_etag_parts(self, request):
+        """Get the parts the rendered charts depend on: the url, the modes
+        and the digests of the fetched resources. Resources not available
+        are left out of the charts, so they are marked as such.
+        """
+        parts = get_request_parts(request)
+        parts.append('%s %s %s' % (self.lazy, self.paged, self.downsample))
+        for name, ctype in self.get_wanted():
+            digest = self.resource.get_digest(name, ctype, request.matchdict)
+            parts.append(digest or '-')
+        return parts
+
+    def get_chart_info(self, name, method, content_types, fetched):
+        """Get a chart augmented with the fetched resources, or None when
+        not all of them are available.
+        """
+        # Fill an empty chart with the statistics resources based on the
+        # wanted content types
+        chart = ChartView(BOXES[name])
+        if not 'id' in chart:
+            # At least put in a default id
+            chart['id'] = name
+        for ctype in self.get_content_types(name, content_types):
+            result = fetched[(name, ctype)]
+            if result is None:
+                return None
+            chart[ctype] = result
+        if JSON in content_types and (self.lazy or self.is_paged(name)):
+            chart['lazy'] = True
+        if JSON in content_types and self.is_paged(name):
+            chart['page_size'] = int(chart['chartoptions']['pageSize'])
+        # Call the method on the current context
+        method(self, chart)
+        return chart
 
     def get_chart_infos(self, request):
         """Get all augmented charts from the resources in the context."""
+        fetched = self.get_fetched(request)
         charts = []
+        # The methods are called in the order of the registry, so the output
+        # does not depend on the order in which the fetches finished
         for name, method, content_types in self.resources:
-            # Fill an empty chart with the statistics resources based on the
-            # wanted content types
-            chart = BOXES[name].copy()
-            if not 'id' in chart:
-                # At least put in a default id
-                chart['id'] = name
-            success = True
-            for ctype in content_types:
-                result = self.resource.get(name, ctype, request.matchdict)
-                if result is None:
-                    success = False
-                else:
-                    chart[ctype] = result
-            if success:
-                # Call the method on the current context
-                method(self, chart)
+            chart = self.get_chart_info(name, method, content_types, fetched)
+            if not chart is None:
                 charts.append(chart)
         return charts
 
 
-class Page(object):
-    """Renders a page with boxes in a layout."""
+class Page(Conditional):
+    """Renders a page with boxes in a layout.
+
+    Nothing is rendered when the request has the ETag of the page already,
+    and not_modified is set instead. The time spent in every stage is kept
+    in timings.
+    """
+
+    # Fetches the pages likely to be visited next, None to not prefetch
+    prefetcher = PREFETCH and PREFETCHER or None
 
     def __init__(self, request):
+        self.timings = Timings()
+        try:
+            self.build(request)
+        finally:
+            self.timings.finish(request.url)
+        if not self.prefetcher is None:
+            self.prefetch(request)
+
+    def build(self, request):
+        """Fetch the resources and render the page"""
         self.layout = Layout(request)
         cells = self.layout.get_cells()
-        self.restyler = Restyler(request, cells)
+        self.restyler = Restyler(request, cells, self.get_item_resources(),
+                                 render=False, timings=self.timings)
+        self.breadcrumbs = None
+        self.items = None
+        self.tabs = None
+        self.restyler.fetch_resources(request)
+        if self.check_etag(request, self.restyler.get_etag_parts(request)):
+            return
+        self.restyler.render(request)
         self.breadcrumbs = self.get_breadcrumbs(request)
         self.items = self.get_items(request)
         self.tabs = self.get_tabs(request)
 
+    def prefetch(self, request):
+        """Prefetch the resources of the other tabs of the page and of the
+        first tab of its first replicates.
+        """
+        layout_id = self.layout.get_layout_id()
+        layout = self.layout.get_layout()
+        for tab_name in layout.get('tabbed_views', []):
+            cells = LAYOUTS[(layout_id, tab_name)]
+            if not cells is self.layout.get_cells():
+                self.schedule_prefetch(layout_id, tab_name,
+                                       request.matchdict)
+        resource = ('experiment_replicates', PICKLED)
+        replicates = (self.restyler.fetched or {}).get(resource, None)
+        if layout_id != 'experiment' or replicates is None:
+            return
+        tab_name = PAGES['replicate']['tabbed_views'][0]
+        for item in replicates['table_data'][:PREFETCH_REPLICATES]:
+            try:
+                matchdict = match_path(item[4])[1]
+            except ValueError:
+                continue
+            self.schedule_prefetch('replicate', tab_name, matchdict)
+
+    def schedule_prefetch(self, layout_id, tab_name, matchdict):
+        """Prefetch the resources of a tab of a page in the background"""
+        key = (layout_id, tab_name, tuple(sorted(matchdict.items())))
+        self.prefetcher.schedule(key, prefetch_cells,
+                                 LAYOUTS[(layout_id, tab_name)],
+                                 dict(matchdict))
+
     def title(self, request):
         """Returns the title of the page depending on the layout"""
         matchdict = request.matchdict
@@ -255,8 +545,9 @@ class Page(object):
         if not 'breadcrumbs' in layout:
             return
 
-        if type(layout['breadcrumbs']) == type(''):
-            layout['breadcrumbs'] = [layout['breadcrumbs']]
+        breadcrumbs = layout['breadcrumbs']
+        if type(breadcrumbs) == type(''):
+            breadcrumbs = [breadcrumbs]
 
         _pro = '/project/%(project_name)s'
         _par = '/%(parameter_list)s/%(parameter_values)s'
@@ -279,13 +570,19 @@ class Page(object):
                     _pro + _par + _exp + _tab)
             }
 
-        breadcrumbs = []
-        for item in layout['breadcrumbs']:
+        crumbs = []
+        for item in breadcrumbs:
             title, url = mapping[item]
             crumb = {'title': title % request.matchdict,
                      'url': request.application_url + url % request.matchdict}
-            breadcrumbs.append(crumb)
-        return breadcrumbs
+            crumbs.append(crumb)
+        return crumbs
+
+    def get_item_resources(self):
+        """Returns the resources needed for the sub items"""
+        if self.layout.get_layout_id() == 'experiment':
+            return [('experiment_replicates', PICKLED)]
+        return []
 
     def get_items(self, request):
         """Returns a list of dictionaries of sub items"""
@@ -296,10 +593,9 @@ class Page(object):
             items['title'] = 'Replicates'
             items['level'] = 'Experiment'
             items['toggle'] = 'Show %(title)s for this %(level)s' % items
-            resource = 'experiment_replicates'
-            experiment_replicates = self.restyler.resource.get(resource,
-                                                               PICKLED,
-                                                               matchdict)
+            # Fetched together with the resources of the charts
+            resource = ('experiment_replicates', PICKLED)
+            experiment_replicates = self.restyler.fetched.get(resource, None)
             if experiment_replicates is None:
                 description = [('Project Id', 'string'),
                                ('Experiment Id', 'string'),
@@ -0,0 +1,112 @@
+"""Prefetch the resources of the pages users are likely to visit next.
+
+After a page has been built, the resources of its other tabs and of the
+pages of its first replicates are fetched into the cache in the background,
+so that the next click is served from the cache. Prefetches run in a small
+pool of worker threads, at most PREFETCH_RATE of them per second. A prefetch
+waiting to be run is not queued a second time, and prefetches are dropped
+when PREFETCH_QUEUE_SIZE of them are waiting already.
+"""
+
+import time
+import Queue
+import threading
+from config import PREFETCH_WORKERS
+from config import PREFETCH_RATE
+from config import PREFETCH_QUEUE_SIZE
+
+
+class Prefetcher:
+    """Run calls in a bounded pool of background threads at a limited
+    rate.
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS, rate=PREFETCH_RATE,
+                 queue_size=PREFETCH_QUEUE_SIZE):
+        """Start without workers, they are started with the first call"""
+        self.queue = Queue.Queue(queue_size)
+        self.size = workers
+        self.workers = []
+        self.pending = set()
+        self.lock = threading.Lock()
+        # Seconds between the starts of two calls, and the earliest time
+        # the next call may start
+        self.interval = 0.0
+        if rate:
+            self.interval = 1.0 / rate
+        self.next_start = 0.0
+        self.scheduled = 0
+        self.dropped = 0
+        self.prefetches = 0
+        self.failures = 0
+
+    def schedule(self, key, function, *args):
+        """Call function(*args) in the background, unless a call for the
+        same key is waiting already or the queue is full. Returns whether
+        the call was queued.
+        """
+        self.lock.acquire()
+        try:
+            if key in self.pending:
+                return False
+            try:
+                self.queue.put_nowait((key, function, args))
+            except Queue.Full:
+                self.dropped += 1
+                return False
+            self.pending.add(key)
+            self.scheduled += 1
+            while len(self.workers) < self.size:
+                worker = threading.Thread(target=self.run)
+                worker.setDaemon(True)
+                worker.start()
+                self.workers.append(worker)
+        finally:
+            self.lock.release()
+        return True
+
+    def wait_turn(self):
+        """Wait until the rate limit lets the next call start"""
+        self.lock.acquire()
+        try:
+            now = time.time()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        finally:
+            self.lock.release()
+        if start > now:
+            time.sleep(start - now)
+
+    def run(self):
+        """Make the queued calls, forever"""
+        while True:
+            key, function, args = self.queue.get()
+            try:
+                try:
+                    self.wait_turn()
+                    function(*args)
+                    self.prefetches += 1
+                except Exception:
+                    # The page is fetched when it is visited
+                    self.failures += 1
+            finally:
+                self.lock.acquire()
+                self.pending.discard(key)
+                self.lock.release()
+                self.queue.task_done()
+
+    def join(self):
+        """Wait until all queued calls have been made"""
+        self.queue.join()
+
+    def stats(self):
+        """Return the counters of the prefetcher"""
+        return {'scheduled': self.scheduled,
+                'dropped': self.dropped,
+                'prefetches': self.prefetches,
+                'failures': self.failures,
+                'pending': len(self.pending)}
+
+
+# Shared by all pages of the process
+PREFETCHER = Prefetcher()
@@ -0,0 +1,231 @@
+"""Process wide registry of the resource provider used by Resource.
+
+The default provider keeps a pool of keep-alive connections for every
+backend host, so that the many requests needed for a page do not each pay
+for setting up a new TCP connection. Tests can register a stand-in provider
+with set_provider.
+
+Providers return None for resources the backend does not have, and raise
+TransportError when the backend host could not be reached or sent a broken
+response. Only the latter count as failures of the host.
+"""
+
+import time
+import socket
+import threading
+import urlparse
+from restkit import request
+from restkit.conn import Connection
+from restkit.errors import ResourceNotFound
+from restkit.errors import Unauthorized
+from restkit.errors import RequestFailed
+from restkit.errors import RedirectLimit
+from restkit.errors import RequestError
+from restkit.errors import InvalidUrl
+from restkit.errors import ResponseError
+from restkit.errors import ProxyError
+from restkit.errors import BadStatusLine
+from restkit.errors import ParserError
+from restkit.errors import UnexpectedEOF
+from restkit.errors import NoMoreData as RestkitNoMoreData
+from http_parser.http import NoMoreData
+from socketpool import ConnectionPool
+from config import POOL_SIZE
+from config import POOL_IDLE_TIMEOUT
+from config import STREAM_CHUNK_SIZE
+
+_PROVIDER = None
+_PROVIDER_LOCK = threading.Lock()
+
+# Errors of the connection to the backend host, as opposed to the answers
+# for resources it does not have
+TRANSPORT_ERRORS = (RequestError,
+                    ResponseError,
+                    ProxyError,
+                    BadStatusLine,
+                    ParserError,
+                    UnexpectedEOF,
+                    RestkitNoMoreData,
+                    NoMoreData,
+                    socket.error)
+
+
+class TransportError(Exception):
+    """The backend host could not be reached or sent a broken response"""
+
+
+class KeepAliveConnection(Connection):
+    """Connection whose lifetime starts again every time it is given back
+    to the pool, so that the max_lifetime of the pool acts as idle timeout.
+    """
+
+    def release(self, should_close=False):
+        """Give the connection back to the pool"""
+        self._life = time.time()
+        Connection.release(self, should_close)
+
+
+def request_resource(path, content_type=None, pool=None):
+    """Request RESTful resource while nicely handling restkit exceptions.
+
+    Returns the response, or None when the resource is not available.
+    Raises TransportError when the backend host could not be reached.
+    """
+    if " " in path:
+        raise AttributeError
+    if content_type:
+        headers = {'Accept': content_type}
+    else:
+        headers = {}
+    try:
+        res = request(path, headers=headers, pool=pool)
+    except (ResourceNotFound,
+           Unauthorized,
+           RequestFailed,
+           RedirectLimit,
+           InvalidUrl):
+        return None
+    except TRANSPORT_ERRORS, error:
+        raise TransportError("%s: %s" % (path, error))
+    return res
+
+
+def get_content_length(res):
+    """Get the length of the body announced by a response, or None when it
+    is not announced.
+    """
+    if 'Content-Length' in res.headers:
+        return int(res.headers['Content-Length'])
+    if 'content-length' in res.headers:
+        return int(res.headers['content-length'])
+    return None
+
+
+def get_resource_by_uri(path, content_type=None, pool=None):
+    """Get RESTful resource while nicely handling restkit exceptions.
+
+    Returns the body, or None when the resource is not available. Raises
+    TransportError when the backend host could not be reached or the body
+    is shorter than announced.
+    """
+    res = request_resource(path, content_type, pool)
+    if res is None:
+        return None
+    body = None
+    if res.status == '200 OK':
+        # Reading the whole body gives the connection back to the pool
+        try:
+            body = res.body_string()
+        except TRANSPORT_ERRORS, error:
+            raise TransportError("%s: %s" % (path, error))
+        content_length = get_content_length(res)
+        if content_length is None:
+            print "Warning: Content length header not found!"
+            raise AttributeError
+        if not len(body) == content_length:
+            raise TransportError("%s: got %s of %s bytes" % (
+                path, len(body), content_length))
+    return body
+
+
+def stream_body(res, chunk_size, path=None):
+    """Iterate over the body of a response in chunks of at most chunk_size
+    bytes.
+
+    Raises TransportError when the connection fails, or the body ends
+    before the announced Content-Length, so that a truncated body is never
+    taken for a complete one.
+    """
+    content_length = get_content_length(res)
+    body = res.body_stream()
+    received = 0
+    finished = False
+    try:
+        while True:
+            try:
+                chunk = body.read(chunk_size)
+            except TRANSPORT_ERRORS, error:
+                raise TransportError("%s: %s" % (path, error))
+            if not chunk:
+                if not content_length is None and \
+                   received != content_length:
+                    raise TransportError("%s: got %s of %s bytes" % (
+                        path, received, content_length))
+                # Reading the end of the body gives the connection back
+                finished = True
+                break
+            received += len(chunk)
+            yield chunk
+    finally:
+        if not finished:
+            # The rest of the body has not been read, so the connection
+            # can't be used again
+            res.close()
+
+
+class PooledResourceProvider:
+    """Fetch resources by uri, keeping a connection pool per backend host"""
+
+    def __init__(self, pool_size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        """Store the pool settings"""
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get_pool(self, uri):
+        """Get the connection pool for the host of the uri"""
+        host = urlparse.urlparse(uri).netloc
+        self.lock.acquire()
+        try:
+            if not host in self.pools:
+                pool = ConnectionPool(factory=KeepAliveConnection,
+                                      max_size=self.pool_size,
+                                      max_lifetime=self.idle_timeout,
+                                      backend='thread')
+                self.pools[host] = pool
+            return self.pools[host]
+        finally:
+            self.lock.release()
+
+    def get(self, uri, content_type=None):
+        """Get a resource by uri"""
+        return get_resource_by_uri(uri, content_type, self.get_pool(uri))
+
+    def stream(self, uri, content_type=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Get a resource by uri as an iterator over chunks of its body, or
+        None when it is not available.
+        """
+        res = request_resource(uri, content_type, self.get_pool(uri))
+        if res is None:
+            return None
+        if res.status != '200 OK':
+            res.skip_body()
+            return None
+        return stream_body(res, chunk_size, uri)
+
+
+def get_provider():
+    """Get the provider shared by all resources of the process"""
+    global _PROVIDER
+    _PROVIDER_LOCK.acquire()
+    try:
+        if _PROVIDER is None:
+            _PROVIDER = PooledResourceProvider()
+        return _PROVIDER
+    finally:
+        _PROVIDER_LOCK.release()
+
+
+def set_provider(provider):
+    """Register the provider shared by all resources of the process.
+
+    Passing None drops the current provider, so that a new default provider
+    is created when it is needed next time.
+    """
+    global _PROVIDER
+    _PROVIDER_LOCK.acquire()
+    try:
+        _PROVIDER = provider
+    finally:
+        _PROVIDER_LOCK.release()
@@ -0,0 +1,71 @@
+"""Refresh stale resources in the background.
+
+Resources past their soft time to live are still served from the cache,
+while a single worker thread fetches them again one after the other. A
+resource waiting to be refreshed is not queued a second time.
+"""
+
+import Queue
+import threading
+
+
+class Refresher:
+    """Run calls one after the other in a background thread"""
+
+    def __init__(self):
+        """Start without a worker, it is started with the first call"""
+        self.queue = Queue.Queue()
+        self.pending = set()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.refreshes = 0
+        self.failures = 0
+
+    def schedule(self, key, function, *args):
+        """Call function(*args) in the background, unless a call for the
+        same key is waiting already. Returns whether the call was queued.
+        """
+        self.lock.acquire()
+        try:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.setDaemon(True)
+                self.worker.start()
+        finally:
+            self.lock.release()
+        self.queue.put((key, function, args))
+        return True
+
+    def run(self):
+        """Make the queued calls, forever"""
+        while True:
+            key, function, args = self.queue.get()
+            try:
+                try:
+                    function(*args)
+                    self.refreshes += 1
+                except Exception:
+                    # The stale resource is served until it expires
+                    self.failures += 1
+            finally:
+                self.lock.acquire()
+                self.pending.discard(key)
+                self.lock.release()
+                self.queue.task_done()
+
+    def join(self):
+        """Wait until all queued calls have been made"""
+        self.queue.join()
+
+    def stats(self):
+        """Return the counters of the refresher"""
+        return {'refreshes': self.refreshes,
+                'failures': self.failures,
+                'pending': len(self.pending)}
+
+
+# Shared by all resources of the process
+REFRESHER = Refresher()
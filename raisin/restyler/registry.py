@@ -0,0 +1,64 @@
+"""Index of the resources in RESOURCES_REGISTRY by name.
+
+When several resources are registered with the same name, the one registered
+last is used, as it overrides the earlier registrations.
+"""
+
+from raisin.box import RESOURCES_REGISTRY
+
+
+class RegistryIndex:
+    """Look up registered resources by name in constant time"""
+
+    def __init__(self, registry):
+        """Index the registry"""
+        self.registry = registry
+        self.size = None
+        self.positions = {}
+        self.update()
+
+    def update(self):
+        """Index the registry again if resources have been registered since
+        it was indexed last time.
+        """
+        if self.size == len(self.registry):
+            return
+        positions = {}
+        for position, resource in enumerate(self.registry):
+            positions[resource[0]] = position
+        self.positions = positions
+        self.size = len(self.registry)
+
+    def get(self, name, default=None):
+        """Get the resource registered with the name"""
+        self.update()
+        position = self.positions.get(name, None)
+        if position is None:
+            return default
+        return self.registry[position]
+
+    def resolve(self, cells):
+        """Get the resources referenced from the cells, without duplicates
+        and in the order of the registry.
+        """
+        self.update()
+        positions = set()
+        unknown = set()
+        for cell in cells:
+            position = self.positions.get(cell, None)
+            if position is None:
+                unknown.add(cell)
+            else:
+                positions.add(position)
+        if len(unknown) > 0:
+            raise AttributeError("Unknown resources: %s" % unknown)
+        return tuple([self.registry[position]
+                      for position in sorted(positions)])
+
+
+REGISTRY_INDEX = RegistryIndex(RESOURCES_REGISTRY)
+
+
+def resolve_resources(cells):
+    """Get the registered resources referenced from the cells"""
+    return REGISTRY_INDEX.resolve(cells)
@@ -1,20 +1,305 @@
 """Utility methods for rendering"""
 
+import json
 from zope.pagetemplate.pagetemplatefile import PageTemplateFile
+from config import JAVASCRIPT_FAST_PATH
+
+# Parsed only once, and reused for every page and box
+JAVASCRIPT_TEMPLATE = PageTemplateFile('templates/javascript.pt')
+
+# The static parts of templates/javascript.pt, used for building the same
+# JavaScript with plain strings
+JAVASCRIPT_HEADER = u"""
+google.load('visualization', '1', {packages:[%s]});
+
+google.setOnLoadCallback(drawTables);
+
+var done = false;
+
+function drawTables() {
+
+    var thousandsformatter = new google.visualization.NumberFormat(\
+{fractionDigits: 0, groupingSymbol:","});
+    var percentageformatter = new google.visualization.NumberFormat(\
+{suffix: "%%", fractionDigits: 1});
+        
+    """
+JAVASCRIPT_CHART = u"""
+            var data = new google.visualization.DataTable(%s, 0.6);
+            var view = new google.visualization.DataView(data);
+
+            """
+JAVASCRIPT_TABLE = u"""
+            var table = new google.visualization.%s(\
+document.getElementById('%s_div'));
+            """
+JAVASCRIPT_DRAW = u"""
+            table.draw(view,{%s});    
+            """
+JAVASCRIPT_HEATMAP = u"""
+            var data = new google.visualization.DataTable(%s, 0.6);
+            var view = new google.visualization.DataView(data);
+            var table = new org.systemsbiology.visualization.BioHeatMap(\
+document.getElementById('%s_div'));
+            table.draw(view, \
+{cellHeight: 8, cellWidth: 8, fontHeight: 7, drawBorder: false});
+
+        """
+JAVASCRIPT_FOOTER = u"""
+
+    google.visualization.events.addListener(table, 'ready', table_is_ready);
+
+}
+
+function table_is_ready() {
+     window.done = true;
+}
+"""
+
+# The JavaScript loading the data of the charts from their data urls once
+# they are scrolled into view. Paged tables load one page at a time
+JAVASCRIPT_LAZY_HEADER = u"""
+google.load('visualization', '1', {packages:[%s]});
+
+google.setOnLoadCallback(observeCharts);
+
+var done = false;
+var drawn = 0;
+var thousandsformatter;
+var percentageformatter;
+
+function observeCharts() {
+    thousandsformatter = new google.visualization.NumberFormat(\
+{fractionDigits: 0, groupingSymbol:","});
+    percentageformatter = new google.visualization.NumberFormat(\
+{suffix: "%%", fractionDigits: 1});
+    for (var index = 0; index < charts.length; index++) {
+        observeChart(charts[index]);
+    }
+}
+
+function observeChart(chart) {
+    var element = document.getElementById(chart.id + '_div');
+    if (!element || !window.IntersectionObserver) {
+        loadChart(chart, 0);
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+            observer.disconnect();
+            loadChart(chart, 0);
+        }
+    }, {rootMargin: '200px'});
+    observer.observe(element);
+}
+
+function loadChart(chart, page) {
+    if (chart.data) {
+        drawChart(chart, chart.data, page);
+        return;
+    }
+    var url = chart.url;
+    if (chart.pageSize) {
+        url += (url.indexOf('?') == -1 ? '?' : '&') +
+               'offset=' + page * chart.pageSize + '&limit=' + chart.pageSize;
+    }
+    var request = new XMLHttpRequest();
+    request.open('GET', url, true);
+    request.onreadystatechange = function () {
+        if (request.readyState == 4 && request.status == 200) {
+            drawChart(chart, JSON.parse(request.responseText), page);
+        }
+    };
+    request.send(null);
+}
+
+function drawChart(chart, data, page) {
+    var table = chart.draw(new google.visualization.DataTable(data, 0.6),
+                           page);
+    if (chart.pageSize && table) {
+        google.visualization.events.addListener(table, 'page',
+            function (properties) {
+                loadChart(chart, properties.page);
+            });
+    }
+    if (!chart.drawn) {
+        chart.drawn = true;
+        drawn += 1;
+        if (drawn == charts.length) {
+            window.done = true;
+        }
+    }
+}
+
+function pageOptions(options, data, page, pageSize) {
+    var total = data.getTableProperty('total');
+    var previous = page > 0;
+    var next = (page + 1) * pageSize < total;
+    options.page = 'event';
+    options.pageSize = pageSize;
+    options.startPage = page;
+    if (previous && next) {
+        options.pagingButtonsConfiguration = 'both';
+    } else if (previous) {
+        options.pagingButtonsConfiguration = 'prev';
+    } else if (next) {
+        options.pagingButtonsConfiguration = 'next';
+    } else {
+        options.pagingButtonsConfiguration = 'auto';
+    }
+    return options;
+}
+
+var charts = [
+"""
+JAVASCRIPT_LAZY_CHART = u"""    {id: %s, url: %s, data: %s, pageSize: %s,
+     draw: function (data, page) {
+        var view = new google.visualization.DataView(data);
+"""
+JAVASCRIPT_LAZY_TABLE = u"""\
+        var table = new google.visualization.%s(\
+document.getElementById(%s));
+"""
+JAVASCRIPT_LAZY_DRAW = u"""\
+        table.draw(view,{%s});
+"""
+JAVASCRIPT_LAZY_PAGED_DRAW = u"""\
+        table.draw(view, pageOptions({%s}, data, page, %s));
+"""
+JAVASCRIPT_LAZY_HEATMAP = u"""\
+        var table = new org.systemsbiology.visualization.BioHeatMap(\
+document.getElementById(%s));
+        table.draw(view, \
+{cellHeight: 8, cellWidth: 8, fontHeight: 7, drawBorder: false});
+"""
+JAVASCRIPT_LAZY_RETURN = u"""\
+        return table;
+"""
+JAVASCRIPT_LAZY_FOOTER = u"""
+];
+"""
 
 
 def render_javascript(charts, packages):
     """Render the javascript for the charts and packages"""
     render_charts = []
     for chart in charts:
-        if 'charttype' in chart and 'data' in chart:
+        if 'charttype' in chart and ('data' in chart or 'data_url' in chart):
             render_charts.append(chart)
     if len(render_charts) == 0:
         return None
-    pagetemplate = PageTemplateFile('templates/javascript.pt')
-    context = {'packages': "'%s'" % ','.join(packages),
-               'charts': render_charts}
-    return pagetemplate.pt_render(namespace=context)
+    packages = "'%s'" % ','.join(packages)
+    for chart in render_charts:
+        if 'data_url' in chart:
+            return render_javascript_lazy(render_charts, packages)
+    if JAVASCRIPT_FAST_PATH:
+        return render_javascript_strings(render_charts, packages)
+    return render_javascript_template(render_charts, packages)
+
+
+def render_javascript_template(charts, packages):
+    """Render the javascript with the page template"""
+    context = {'packages': packages,
+               'charts': charts}
+    return JAVASCRIPT_TEMPLATE.pt_render(namespace=context)
+
+
+def escape_text(value):
+    """Convert and escape a value the way TAL does for inserted text"""
+    if value is None:
+        return u''
+    if not isinstance(value, basestring):
+        value = unicode(value)
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">",
+                                                                    "&gt;")
+
+
+def render_javascript_strings(charts, packages):
+    """Render the same javascript as the page template, with plain strings"""
+    rendered = [JAVASCRIPT_HEADER % escape_text(packages)]
+    for index, chart in enumerate(charts):
+        charttype = chart.get('charttype', None)
+        if index > 0:
+            # TAL repeats the indentation of the block between the charts
+            rendered.append(u"\n    ")
+        rendered.append(u"\n      \n\n        ")
+        if charttype and charttype != 'HeatMap':
+            rendered.append(u"\n")
+            rendered.append(JAVASCRIPT_CHART % escape_text(chart.get('data',
+                                                                     '')))
+            if charttype != 'ImageSparkLine':
+                rendered.append(JAVASCRIPT_TABLE % (escape_text(charttype),
+                                                    escape_text(chart['id'])))
+            rendered.append(u"\n \n            ")
+            javascript = chart.get('javascript', '')
+            if not javascript is None:
+                rendered.append(unicode(javascript))
+            rendered.append(u"\n\n            ")
+            if charttype != 'ImageSparkLine':
+                options = chart['chartoptions_rendered']
+                rendered.append(JAVASCRIPT_DRAW % escape_text(options))
+            rendered.append(u"\n\n        ")
+        rendered.append(u"\n\n        ")
+        if charttype == 'HeatMap':
+            rendered.append(JAVASCRIPT_HEATMAP % (escape_text(chart.get('data',
+                                                                        '')),
+                                                  escape_text(chart['id'])))
+        rendered.append(u"\n        \n      \n    ")
+    rendered.append(JAVASCRIPT_FOOTER)
+    return u''.join(rendered)
+
+
+def quote_javascript(value):
+    """Quote a string for JavaScript, so that it can't end the script"""
+    return json.dumps(value).replace('</', '<\\/')
+
+
+def render_javascript_lazy(charts, packages):
+    """Render the javascript loading the data of the charts from their data
+    urls once they are scrolled into view. Charts without data url get their
+    data inline.
+    """
+    rendered = [JAVASCRIPT_LAZY_HEADER % escape_text(packages)]
+    charts = [chart for chart in charts
+              if chart['charttype'] and (chart.get('data', None) or
+                                         chart.get('data_url', None))]
+    for index, chart in enumerate(charts):
+        charttype = chart['charttype']
+        if index > 0:
+            rendered.append(u",\n")
+        data = chart.get('data', None)
+        if data is None:
+            data = u'null'
+        page_size = chart.get('page_size', None)
+        if page_size is None or not chart.get('data_url', None):
+            page_size = u'null'
+        element_id = quote_javascript(chart['id'] + '_div')
+        rendered.append(JAVASCRIPT_LAZY_CHART % (
+            quote_javascript(chart['id']),
+            quote_javascript(chart.get('data_url', None)),
+            escape_text(data),
+            page_size))
+        if charttype == 'HeatMap':
+            rendered.append(JAVASCRIPT_LAZY_HEATMAP % element_id)
+            rendered.append(JAVASCRIPT_LAZY_RETURN)
+        else:
+            if charttype != 'ImageSparkLine':
+                rendered.append(JAVASCRIPT_LAZY_TABLE % (
+                    escape_text(charttype), element_id))
+            javascript = chart.get('javascript', '')
+            if javascript:
+                rendered.append(u"        %s\n" % unicode(javascript))
+            if charttype != 'ImageSparkLine':
+                options = escape_text(chart['chartoptions_rendered'])
+                if page_size == u'null':
+                    rendered.append(JAVASCRIPT_LAZY_DRAW % options)
+                else:
+                    rendered.append(JAVASCRIPT_LAZY_PAGED_DRAW % (options,
+                                                                  page_size))
+                rendered.append(JAVASCRIPT_LAZY_RETURN)
+        rendered.append(u"    }}")
+    rendered.append(JAVASCRIPT_LAZY_FOOTER)
+    return u''.join(rendered)
 
 
 def render_chartoptions(chartoptions):
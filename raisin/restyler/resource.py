@@ -1,22 +1,128 @@
 """Resource class responsible for fetching resources from the Restish server
 by resource name.
 """
+import time
 import pickle
+import urlparse
+from hashlib import md5
 from raisin.box import RESOURCES
 from config import PICKLED
+from config import COLUMNAR
+from config import NEGOTIATE_COLUMNAR
+from config import ACCEPT_COLUMNAR
+from config import CACHE_TTL
+from config import RESOURCE_TTLS
+from config import CACHE_SOFT_TTL
+from config import RESOURCE_SOFT_TTLS
+from config import STREAM_CHUNK_SIZE
+from config import NEGATIVE_TTL
+from config import VERSION_TOKENS
+from config import VERSIONED_TTL
 from http_parser.http import NoMoreData
+from provider import get_provider
+from provider import TransportError
+from flight import FLIGHTS
+from breaker import BREAKERS
+from fetcher import fetch_concurrently
+from refresher import REFRESHER
+from versions import VERSIONS
+from versions import get_project_name
+from wire import is_columnar
+from wire import decode_table
+from timing import FETCH
+from timing import DECODE
+
+
+def get_ttl(name):
+    """Return the number of seconds a resource may be cached.
+
+    A ttl key given for the resource in RESOURCES wins over the one
+    configured in RESOURCE_TTLS, which wins over the default CACHE_TTL.
+    """
+    resource = RESOURCES[name]
+    if 'ttl' in resource:
+        return int(resource['ttl'])
+    return RESOURCE_TTLS.get(name, CACHE_TTL)
+
+
+def get_soft_ttl(name):
+    """Return the number of seconds a cached resource is served before it
+    is refreshed in the background, or None when it is served until it
+    expires.
+
+    A soft_ttl key given for the resource in RESOURCES wins over the one
+    configured in RESOURCE_SOFT_TTLS, which wins over CACHE_SOFT_TTL.
+    """
+    resource = RESOURCES[name]
+    if 'soft_ttl' in resource:
+        return int(resource['soft_ttl'])
+    return RESOURCE_SOFT_TTLS.get(name, CACHE_SOFT_TTL)
+
+
+def iter_chunks(body, chunk_size=STREAM_CHUNK_SIZE):
+    """Iterate over a body in chunks of at most chunk_size bytes"""
+    for start in xrange(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+def continue_stream(first, chunks, breaker):
+    """Iterate over the first chunk and the remaining chunks of a body.
+
+    When the connection fails in the middle of the body, the breaker of the
+    backend host is told and TransportError is raised, which aborts the
+    response instead of ending it as if the body was complete.
+    """
+    yield first
+    try:
+        for chunk in chunks:
+            yield chunk
+    except (TransportError, NoMoreData), error:
+        breaker.fail()
+        raise TransportError(str(error))
+
 
 class Resource:
     """Fetch RESTful resource using a provider implementing the method:
     def get(uri, content_type)
+
+    Providers can also implement a bulk endpoint, used by get_many:
+    def get_many(requests)
+    taking a list of (uri, content_type) of the same backend host and
+    returning the bodies in the same order.
     """
 
-    def __init__(self, provider):
-        """Store the provider used to fetch the resources."""
+    # Version tokens of the data of the projects, None to expire cached
+    # resources by time only
+    versions = VERSION_TOKENS and VERSIONS or None
+
+    def __init__(self, provider=None, cache=None, flights=FLIGHTS,
+                 negatives=None, breakers=BREAKERS, refresher=REFRESHER,
+                 timings=None):
+        """Store the provider used to fetch the resources.
+
+        Without a provider, the one shared by the whole process is used.
+        When a cache is given, decoded resources are kept in it, and when
+        negatives are given, failed fetches are kept there for NEGATIVE_TTL
+        seconds. Concurrent fetches of the same resource are collapsed by the
+        flights, and the breakers stop fetching from failing backend hosts.
+        Stale resources are refreshed in the background by the refresher.
+        The time and bytes of fetching and decoding are recorded in the
+        timings when they are given.
+        """
+        if provider is None:
+            provider = get_provider()
         self.provider = provider
+        self.cache = cache
+        self.flights = flights
+        self.negatives = negatives
+        self.breakers = breakers
+        self.refresher = refresher
+        self.timings = timings
+        # Digests of the bodies of the resources got, by uri and content type
+        self.digests = {}
 
-    def get(self, name, content_type=PICKLED, kwargs=None):
-        """Get a resource from a resource provider"""
+    def get_uri(self, name, kwargs=None):
+        """Get the uri of a resource expanded with the keyword arguments"""
         try:
             resource = RESOURCES[name]
         except KeyError:
@@ -24,16 +130,337 @@ class Resource:
         uri = resource['uri']
         if not kwargs is None:
             uri = uri % kwargs
-        result = None
-        try:
-            result = self.provider.get(uri, content_type)
-        except NoMoreData:
-            # Catch the following exception:
-            # http_parser-0.7.5-py2.6-linux-x86_64.egg/http_parser/http.py'
-            # line 70 in _check_headers_complete
-            # raise NoMoreData("Can't parse headers")
-            # NoMoreData: Can't parse headers
-            pass
-        if not result is None and content_type == PICKLED:
-            result = pickle.loads(result)
+        return uri
+
+    def get(self, name, content_type=PICKLED, kwargs=None):
+        """Get a resource from a resource provider"""
+        uri = self.get_uri(name, kwargs)
+        key = (uri, content_type)
+        version = self.get_version(uri)
+        entry = self.lookup(key, version)
+        if entry is None:
+            entry = self.flights.do(name, self.get_cache_key(key, version),
+                                    self.load, name, uri, content_type,
+                                    version)
+        return self.use(name, key, entry)
+
+    def get_many(self, wanted, kwargs=None, refresh=False, concurrency=None):
+        """Get many resources at once from a resource provider.
+
+        wanted is a list of (name, content type). Resources with the same
+        expanded uri are fetched only once. The missing resources of every
+        backend host are fetched with one call to the bulk endpoint of the
+        provider if it has one, or else one by one, at most concurrency at
+        the same time. With refresh, resources in the cache are fetched
+        again.
+
+        Returns a dictionary mapping (name, content type) to the result.
+        """
+        keys = {}
+        names = {}
+        for name, content_type in wanted:
+            key = (self.get_uri(name, kwargs), content_type)
+            keys[(name, content_type)] = key
+            names.setdefault(key, name)
+        # Taken before fetching, so that resources fetched while the version
+        # changes are not kept under the new version
+        versions = dict([(key, self.get_version(key[0])) for key in names])
+        entries = {}
+        missing = []
+        for key in names:
+            entry = None
+            if not refresh:
+                entry = self.lookup(key, versions[key])
+            if entry is None:
+                missing.append(key)
+            else:
+                entries[key] = entry
+        if hasattr(self.provider, 'get_many'):
+            hosts = {}
+            for key in missing:
+                host = urlparse.urlparse(key[0]).netloc
+                hosts.setdefault(host, []).append(key)
+            # Resources another request is fetching already are waited for
+            jobs = [([(names[key], self.get_cache_key(key, versions[key]), key)
+                      for key in host_keys], self.load_many, names, versions)
+                    for host_keys in hosts.values()]
+            for loaded in fetch_concurrently(self.flights.do_many, jobs,
+                                             concurrency):
+                entries.update(loaded)
+        else:
+            jobs = [(names[key], self.get_cache_key(key, versions[key]),
+                     self.load, names[key], key[0], key[1], versions[key])
+                    for key in missing]
+            entries.update(zip(missing, fetch_concurrently(self.flights.do,
+                                                           jobs,
+                                                           concurrency)))
+        results = {}
+        for wanted_key, key in keys.items():
+            results[wanted_key] = self.use(names[key], key, entries[key])
+        return results
+
+    def get_window(self, name, kwargs=None, offset=0, limit=None):
+        """Get a window of the rows of a table, or None when the table is
+        not available.
+
+        Returns the table with only the rows of the window, and the total
+        number of rows of the table.
+        """
+        table = self.get(name, PICKLED, kwargs)
+        if table is None:
+            return None
+        rows = table['table_data']
+        end = len(rows)
+        if not limit is None:
+            end = min(offset + limit, end)
+        return {'table_description': table['table_description'],
+                'table_data': [rows[index] for index in xrange(offset, end)],
+                'total': len(rows)}
+
+    def lookup(self, key, version=None):
+        """Look up the entry of a resource of a version in the cache, or
+        None when it has to be fetched.
+        """
+        entry = None
+        if not self.cache is None:
+            entry = self.cache.get(self.get_cache_key(key, version))
+        if entry is None and self.has_failed(key):
+            entry = (None, None, None)
+        return entry
+
+    def get_version(self, uri):
+        """Get the version token of the data of the project of a resource,
+        or None when it is not versioned.
+        """
+        if self.versions is None:
+            return None
+        project_name = get_project_name(uri)
+        if project_name is None:
+            return None
+        return self.versions.get(project_name)
+
+    def get_cache_key(self, key, version):
+        """Get the key of a resource in the cache"""
+        if version is None:
+            return key
+        return key + (version, )
+
+    def use(self, name, key, entry):
+        """Return the resource of an entry, refreshing it in the background
+        when it is stale.
+        """
+        result, digest, stale = entry
+        if not stale is None and stale <= time.time() and \
+           self.may_refresh(key):
+            # Serve the stale resource while it is refreshed
+            uri, content_type = key
+            self.refresher.schedule(key, self.flights.do, name, key,
+                                    self.load, name, uri, content_type)
+        if not digest is None:
+            self.digests[key] = digest
         return result
+
+    def get_digest(self, name, content_type=PICKLED, kwargs=None):
+        """Get the digest of the body a resource was decoded from, or None
+        when the resource has not been got successfully.
+        """
+        return self.digests.get((self.get_uri(name, kwargs), content_type))
+
+    def may_refresh(self, key):
+        """Tell whether a stale resource may be fetched again. While its
+        fetch is failing or its backend host is failing, it is served stale
+        without asking the backend again.
+        """
+        if self.has_failed(key):
+            return False
+        return not self.breakers.get(key[0]).is_open()
+
+    def has_failed(self, key):
+        """Tell whether fetching the resource failed a short while ago"""
+        if self.negatives is None:
+            return False
+        return not self.negatives.get(key) is None
+
+    def stream(self, name, content_type, kwargs=None,
+               chunk_size=STREAM_CHUNK_SIZE):
+        """Get a resource as an iterator over chunks of its body, or None
+        when it is not available.
+
+        Bodies are streamed from providers supporting it, so that large
+        tables never need to be held in memory as a whole. The bodies are
+        passed through as they are, so they are not decoded.
+        """
+        uri = self.get_uri(name, kwargs)
+        version = self.get_version(uri)
+        entry = self.lookup((uri, content_type), version)
+        if entry is None and not hasattr(self.provider, 'stream'):
+            entry = self.flights.do(name,
+                                    self.get_cache_key((uri, content_type),
+                                                       version),
+                                    self.load, name, uri, content_type,
+                                    version)
+        if not entry is None:
+            body = self.use(name, (uri, content_type), entry)
+            if body is None:
+                return None
+            return iter_chunks(body, chunk_size)
+        breaker = self.breakers.get(uri)
+        if not breaker.allow():
+            return None
+        try:
+            chunks = self.provider.stream(uri, content_type, chunk_size)
+            first = None
+            if not chunks is None:
+                # Read the first chunk, so that failing requests are known
+                # before the body is handed out
+                first = next(chunks, '')
+        except (TransportError, NoMoreData):
+            breaker.fail()
+            self.remember_failure(uri, content_type)
+            return None
+        except:
+            # Not the fault of the backend host
+            breaker.cancel()
+            raise
+        breaker.succeed()
+        if chunks is None:
+            self.remember_failure(uri, content_type)
+            return None
+        if not first:
+            return iter([])
+        return continue_stream(first, chunks, breaker)
+
+    def load(self, name, uri, content_type, version=None):
+        """Fetch and decode a resource, and keep it in the cache under the
+        version taken before fetching it.
+
+        Returns the decoded resource, the digest of its body and the time it
+        gets stale, which is None when it does not get stale before it
+        expires.
+        """
+        started = time.time()
+        body = self.fetch(uri, content_type)
+        self.record(FETCH, name, started, len(body or ''))
+        return self.keep(name, uri, content_type, body, version)
+
+    def load_many(self, keys, names, versions=None):
+        """Fetch and decode resources of the same backend host with one call
+        to the bulk endpoint of the provider, and keep them in the cache.
+
+        Returns a dictionary mapping the keys to the entries, which are
+        kept under the versions taken before fetching them.
+        """
+        if versions is None:
+            versions = {}
+        started = time.time()
+        bodies = self.fetch_many(keys)
+        # One call for all resources, so it is not recorded by name
+        self.record(FETCH, None, started,
+                    sum([len(body or '') for body in bodies]))
+        entries = {}
+        for key, body in zip(keys, bodies):
+            uri, content_type = key
+            entries[key] = self.keep(names[key], uri, content_type, body,
+                                     versions.get(key, None))
+        return entries
+
+    def keep(self, name, uri, content_type, body, version=None):
+        """Decode a fetched body and keep it in the cache under the version,
+        or remember that the fetch failed when there is no body.
+        """
+        if body is None:
+            self.remember_failure(uri, content_type)
+            return None, None, None
+        started = time.time()
+        result = self.decode(body, content_type)
+        self.record(DECODE, name, started, len(body))
+        stale = None
+        if version is None:
+            ttl = get_ttl(name)
+            soft_ttl = get_soft_ttl(name)
+            if not soft_ttl is None and soft_ttl < ttl:
+                stale = time.time() + soft_ttl
+        else:
+            # Kept until the version of the data of the project changes
+            ttl = VERSIONED_TTL
+        entry = (result, md5(body).hexdigest(), stale)
+        if not self.cache is None:
+            self.cache.store(self.get_cache_key((uri, content_type), version),
+                             entry, len(body), ttl)
+        return entry
+
+    def record(self, stage, name, started, size):
+        """Record the time since started and the bytes of a stage"""
+        if not self.timings is None:
+            self.timings.record(stage, name, time.time() - started, size)
+
+    def remember_failure(self, uri, content_type):
+        """Keep a failed fetch for NEGATIVE_TTL seconds"""
+        if not self.negatives is None:
+            self.negatives.store((uri, content_type), True, len(uri),
+                                 NEGATIVE_TTL)
+
+    def decode(self, body, content_type):
+        """Decode the body of a table, sniffing the columnar format so that
+        pickles keep working with servers not knowing it.
+        """
+        if not content_type in (PICKLED, COLUMNAR):
+            return body
+        if is_columnar(body):
+            return decode_table(body)
+        if content_type == PICKLED:
+            return pickle.loads(body)
+        raise ValueError("Body is not in the columnar format")
+
+    def get_accept(self, content_type):
+        """Get the content type asked from the Restish server"""
+        if content_type == PICKLED and NEGOTIATE_COLUMNAR:
+            return ACCEPT_COLUMNAR
+        return content_type
+
+    def fetch(self, uri, content_type):
+        """Fetch the body of a resource from the provider, unless the
+        breaker of its backend host is open.
+
+        Only failures to reach the backend host count for its breaker. A
+        missing resource comes from a host that answers.
+        """
+        breaker = self.breakers.get(uri)
+        if not breaker.allow():
+            return None
+        try:
+            body = self.provider.get(uri, self.get_accept(content_type))
+        except (TransportError, NoMoreData):
+            # NoMoreData is raised by http_parser when the connection is
+            # closed before the headers are complete
+            breaker.fail()
+            return None
+        except:
+            # Not the fault of the backend host
+            breaker.cancel()
+            raise
+        breaker.succeed()
+        return body
+
+    def fetch_many(self, keys):
+        """Fetch the bodies of resources of the same backend host from the
+        bulk endpoint of the provider, unless the breaker of the host is
+        open.
+        """
+        bodies = [None] * len(keys)
+        breaker = self.breakers.get(keys[0][0])
+        if not breaker.allow():
+            return bodies
+        requests = [(uri, self.get_accept(content_type))
+                    for uri, content_type in keys]
+        try:
+            bodies = list(self.provider.get_many(requests))
+        except (TransportError, NoMoreData):
+            breaker.fail()
+            return bodies
+        except:
+            # Not the fault of the backend host
+            breaker.cancel()
+            raise
+        breaker.succeed()
+        return bodies
@@ -0,0 +1,367 @@
+"""Build a static snapshot of pages and boxes that can be served without
+the Python tier, for example straight from nginx.
+
+For every page path given, all tabs are rendered, and for every box on them
+the .csv and .json downloads and the JavaScript of the .html view are
+written next to the page:
+
+    <page path>/page.json       title, breadcrumbs, items, tabs and charts
+    <page path>/javascript.js   JavaScript drawing the charts
+    <page path>/<box>.csv       CSV download of the box
+    <page path>/<box>.json      JSON download of the box
+    <page path>/<box>.js        JavaScript of the .html view of the box
+
+The fingerprints of the resources every file was built from are kept in
+MANIFEST in the output directory, so that a new run only writes the files
+whose resources have changed.
+
+    bin/raisin_snapshot -o snapshot -u http://raisin.example.org \\
+        / /project/ENCODE/ /project/ENCODE/cell/K562/
+"""
+
+import os
+import sys
+import json
+import tempfile
+import optparse
+import multiprocessing
+from hashlib import md5
+from raisin.page import PAGES
+from config import JSON
+from config import CSV
+from config import PICKLED
+from page import Page
+from page import LAYOUTS
+from page import match_path
+from box import Box
+from resource import Resource
+from cache import get_cache
+from cache import NEGATIVES
+
+# Name of the file keeping the fingerprints of the files of a snapshot
+MANIFEST = 'snapshot.json'
+# Changing the version rebuilds all files of existing snapshots
+VERSION = '1'
+
+# The keys of the rendered charts written to page.json
+CHART_KEYS = ['id',
+              'div_id',
+              'module_id',
+              'module_style',
+              'title',
+              'charttype',
+              'description_rendered',
+              'chartoptions_rendered',
+              'csv_download_url',
+              'html_download_url']
+
+
+class SnapshotRequest(object):
+    """The parts of a request used for rendering pages and boxes"""
+
+    def __init__(self, application_url, path, route_name, matchdict):
+        """Snapshot Request"""
+        self.application_url = application_url
+        self.url = application_url + path
+        self.environ = {'PATH_INFO': path}
+        self.matched_route = SnapshotRoute(route_name)
+        self.matchdict = matchdict
+        self.GET = {}
+
+
+class SnapshotRoute(object):
+    """The matched route of a snapshot request"""
+
+    def __init__(self, name):
+        """Snapshot Route"""
+        self.name = name
+
+
+def get_page_jobs(paths, application_url, output, manifest, force):
+    """Get the jobs rendering every tab of the pages of the paths"""
+    jobs = []
+    for path in paths:
+        path = '/' + path.strip('/')
+        if path != '/':
+            path += '/'
+        layout_id, matchdict = match_path(path)
+        layout = PAGES[layout_id]
+        if not 'tabbed_views' in layout:
+            jobs.append((application_url, output, manifest, force,
+                         path, 'p1_' + layout_id, matchdict))
+            continue
+        for tab_name in layout['tabbed_views']:
+            tab_matchdict = dict(matchdict)
+            tab_matchdict['tab_name'] = tab_name
+            if tab_name == layout['tabbed_views'][0]:
+                # The first tab does not need to be specified
+                tab_path = path
+                route_name = 'p1_' + layout_id
+            else:
+                tab_path = path + 'tab/%s/' % tab_name
+                route_name = 'p1_tab_' + layout_id
+            jobs.append((application_url, output, manifest, force,
+                         tab_path, route_name, tab_matchdict))
+    return jobs
+
+
+def get_fingerprint(resource, keys, kwargs):
+    """Get the fingerprint of resources, or None when not all of them have
+    been got.
+    """
+    fingerprint = md5(VERSION)
+    for name, content_type in sorted(keys):
+        digest = resource.get_digest(name, content_type, kwargs)
+        if digest is None:
+            return None
+        fingerprint.update(digest)
+    return fingerprint.hexdigest()
+
+
+def write_file(output, path, content):
+    """Write a file of the snapshot, replacing the old one only when the new
+    one is complete.
+    """
+    filename = os.path.join(output, path.lstrip('/'))
+    folder = os.path.dirname(filename)
+    if not os.path.exists(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # Created by another process in the meantime
+            if not os.path.isdir(folder):
+                raise
+    descriptor, temporary = tempfile.mkstemp(dir=folder)
+    try:
+        os.write(descriptor, content)
+    finally:
+        os.close(descriptor)
+    os.chmod(temporary, 0644)
+    os.rename(temporary, filename)
+
+
+class Builder(object):
+    """Builds the files of one page of a snapshot"""
+
+    def __init__(self, application_url, output, manifest, force):
+        """Builder"""
+        self.application_url = application_url
+        self.output = output
+        self.manifest = manifest
+        self.force = force
+        self.resource = Resource(cache=get_cache(),
+                                 negatives=get_cache(NEGATIVES))
+        # Fingerprints of the files built by path, None when not all of
+        # their resources were available
+        self.fingerprints = {}
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def is_current(self, path, fingerprint):
+        """Tell whether the file has been built from the same resources"""
+        if self.force or fingerprint is None:
+            return False
+        if self.manifest.get(path, None) != fingerprint:
+            return False
+        return os.path.exists(os.path.join(self.output, path.lstrip('/')))
+
+    def build(self, fingerprint, render):
+        """Write the files rendered by render() unless they are current"""
+        if all([self.is_current(path, fingerprint) for path in render.paths]):
+            self.skipped += len(render.paths)
+        else:
+            for path, content in render():
+                write_file(self.output, path, content)
+                self.written += 1
+        for path in render.paths:
+            self.fingerprints[path] = fingerprint
+
+    def build_page(self, path, route_name, matchdict):
+        """Build the files of the page and of its boxes"""
+        request = SnapshotRequest(self.application_url, path, route_name,
+                                  matchdict)
+        layout_id = route_name[len('p1_'):]
+        if layout_id.startswith('tab_'):
+            layout_id = layout_id[len('tab_'):]
+        cells = LAYOUTS[(layout_id, matchdict.get('tab_name', None))]
+        keys = [(name, content_type)
+                for name, method, content_types in cells.get_resources()
+                for content_type in content_types]
+        if layout_id == 'experiment':
+            keys.append(('experiment_replicates', PICKLED))
+        self.resource.get_many(keys, matchdict)
+        fingerprint = get_fingerprint(self.resource, keys, matchdict)
+        self.build(fingerprint, PageRender(request, path))
+        for name, method, content_types in cells.get_resources():
+            self.build_box(path, name, content_types, matchdict)
+
+    def build_box(self, path, name, content_types, matchdict):
+        """Build the downloads and the JavaScript of a box"""
+        box_matchdict = dict(matchdict)
+        box_matchdict['box_name'] = name
+        for extension, content_type in [('.csv', CSV), ('.json', JSON)]:
+            box_path = path + name + extension
+            body = self.resource.get(name, content_type, matchdict)
+            if body is None:
+                self.failed += 1
+                continue
+            fingerprint = get_fingerprint(self.resource,
+                                          [(name, content_type)], matchdict)
+            self.build(fingerprint, BodyRender(box_path, body))
+        request = SnapshotRequest(self.application_url, path + name + '.html',
+                                  None, box_matchdict)
+        fingerprint = get_fingerprint(self.resource,
+                                      [(name, content_type)
+                                       for content_type in content_types],
+                                      matchdict)
+        self.build(fingerprint,
+                   BoxRender(request, path + name + '.js'))
+
+
+class PageRender(object):
+    """Renders the files of a page"""
+
+    def __init__(self, request, path):
+        """Page Render"""
+        self.request = request
+        self.paths = [path + 'page.json', path + 'javascript.js']
+
+    def __call__(self):
+        """Return the paths and contents of the files of the page"""
+        page = Page(self.request)
+        charts = [dict([(key, chart[key]) for key in CHART_KEYS
+                        if key in chart])
+                  for chart in page.get_charts()]
+        try:
+            title = page.title(self.request)
+        except KeyError:
+            # The homepage has no title
+            title = None
+        content = {'title': title,
+                   'breadcrumbs': page.breadcrumbs,
+                   'items': page.items,
+                   'tabs': page.tabs,
+                   'charts': charts}
+        return [(self.paths[0], json.dumps(content)),
+                (self.paths[1], page.get_javascript() or '')]
+
+
+class BoxRender(object):
+    """Renders the JavaScript of the .html view of a box"""
+
+    def __init__(self, request, path):
+        """Box Render"""
+        self.request = request
+        self.paths = [path]
+
+    def __call__(self):
+        """Return the path and content of the JavaScript of the box"""
+        # Boxes without chart have no JavaScript
+        return [(self.paths[0], Box(self.request).javascript or '')]
+
+
+class BodyRender(object):
+    """Gives back a body fetched already"""
+
+    def __init__(self, path, body):
+        """Body Render"""
+        self.body = body
+        self.paths = [path]
+
+    def __call__(self):
+        """Return the path and the body"""
+        return [(self.paths[0], self.body)]
+
+
+def build_page(job):
+    """Build the files of one page in a process of the pool.
+
+    Returns the fingerprints of the files, and the number of files written,
+    skipped and failed.
+    """
+    application_url, output, manifest, force, path, route_name, matchdict = \
+        job
+    builder = Builder(application_url, output, manifest, force)
+    builder.build_page(path, route_name, matchdict)
+    return (builder.fingerprints, builder.written, builder.skipped,
+            builder.failed)
+
+
+def read_manifest(output):
+    """Read the fingerprints of the files of an existing snapshot"""
+    filename = os.path.join(output, MANIFEST)
+    if not os.path.exists(filename):
+        return {}
+    return json.load(open(filename))
+
+
+def build_snapshot(paths, application_url, output, processes=None,
+                   force=False):
+    """Build the snapshot of the pages of the paths.
+
+    Returns the number of files written, skipped and failed.
+    """
+    manifest = read_manifest(output)
+    jobs = get_page_jobs(paths, application_url, output, manifest, force)
+    if processes == 1:
+        results = [build_page(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(build_page, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    fingerprints = dict(manifest)
+    written = skipped = failed = 0
+    for result in results:
+        for path, fingerprint in result[0].items():
+            if fingerprint is None:
+                # Build the file again next time
+                fingerprints.pop(path, None)
+            else:
+                fingerprints[path] = fingerprint
+        written += result[1]
+        skipped += result[2]
+        failed += result[3]
+    write_file(output, MANIFEST, json.dumps(fingerprints, indent=1,
+                                            sort_keys=True))
+    return written, skipped, failed
+
+
+def main(argv=None):
+    """Build a snapshot from the command line"""
+    parser = optparse.OptionParser(usage="%prog [options] PAGE_PATH...")
+    parser.add_option('-o', '--output', default='snapshot',
+                      help="folder the snapshot is written to")
+    parser.add_option('-u', '--application-url', default='',
+                      help="url the snapshot is served from")
+    parser.add_option('-p', '--processes', type='int', default=None,
+                      help="number of processes, by default one per CPU")
+    parser.add_option('-f', '--paths-file', default=None,
+                      help="file with one page path per line")
+    parser.add_option('--force', action='store_true', default=False,
+                      help="write all files, even the ones not changed")
+    options, paths = parser.parse_args(argv)
+    if not options.paths_file is None:
+        for line in open(options.paths_file):
+            if line.strip():
+                paths.append(line.strip())
+    if not paths:
+        parser.error("No page paths given")
+    try:
+        written, skipped, failed = build_snapshot(paths,
+                                                  options.application_url,
+                                                  options.output,
+                                                  options.processes,
+                                                  options.force)
+    except ValueError, error:
+        parser.error(str(error))
+    print "%s files written, %s not changed, %s not available" % (written,
+                                                                 skipped,
+                                                                 failed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Stand-ins and clean-up shared by the test modules"""
+
+import pickle
+from raisin.restyler import provider
+from raisin.restyler import cache
+from raisin.restyler import breaker
+from raisin.restyler.config import PICKLED
+
+
+class DataResourceProvider:
+    """Returns the same small table for every resource, keeping the uri and
+    content type of every call.
+    """
+
+    def __init__(self, description='RNA-Seq'):
+        self.description = description
+        self.calls = []
+
+    def get(self, uri, content_type):
+        self.calls.append((uri, content_type))
+        if content_type == PICKLED:
+            table = {'table_description': [('Project Description',
+                                            'string')],
+                     'table_data': [(self.description, )]}
+            return pickle.dumps(table)
+        return '{"cols": [{"type": "string"}], "rows": [["%s"]]}' % \
+            self.description
+
+
+def reset_caches():
+    """Drop the provider, the caches and the breakers shared by the process,
+    so that every test starts from scratch.
+    """
+    provider.set_provider(None)
+    for name in cache.MAX_BYTES:
+        cache.set_cache(None, name)
+    breaker.BREAKERS.clear()
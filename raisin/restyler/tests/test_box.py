@@ -1,17 +1,126 @@
 import sys
+import json
 import unittest
+from pyramid.testing import DummyRequest
+from raisin.restyler import box
+from raisin.restyler import provider
+from raisin.restyler import cache
+from raisin.restyler.config import PICKLED
+from raisin.restyler.config import MAX_PAGE_SIZE
+from fixtures import DataResourceProvider
+from fixtures import reset_caches
+
+
+def box_request(extension, params=None):
+    path = '/project/ENCODE/project_experimentstable' + extension
+    request = DummyRequest(environ={'PATH_INFO': path}, params=params)
+    request.matchdict = {'project_name': 'ENCODE',
+                         'box_name': 'project_experimentstable'}
+    return request
 
 
 class BoxTest(unittest.TestCase):
 
     def setUp(self):
         unittest.TestCase.setUp(self)
+        self.provider = DataResourceProvider('ENCODE')
+        provider.set_provider(self.provider)
 
     def tearDown(self):
+        reset_caches()
         unittest.TestCase.tearDown(self)
 
     def test_box(self):
-        pass
+        context = box.Box(box_request('.html'))
+        self.failUnless(context.chart_type == 'Table')
+        chart = context.charts[0]
+        self.failUnless(chart['div_id'] == 'project_experimentstable')
+        self.failUnless("table.draw(view,{" in context.javascript)
+        self.failUnless("{packages:['" in context.javascript)
+
+    def test_html_fetches_every_resource_once(self):
+        # Without caching, every fetch reaches the provider
+        cache.set_cache(cache.ResourceCache(0))
+        box.Box(box_request('.html'))
+        self.failUnless(len(self.provider.calls) == 2, self.provider.calls)
+
+    def test_width_and_height_override(self):
+        params = {'width': '400', 'height': '300'}
+        context = box.Box(box_request('.html', params))
+        rendered = context.charts[0]['chartoptions_rendered']
+        self.failUnless('width: 400' in rendered, rendered)
+        self.failUnless('height: 300' in rendered, rendered)
+        self.failUnless('width: 400' in context.javascript)
+
+    def test_csv(self):
+        context = box.Box(box_request('.csv'))
+        self.failUnless(context.body.startswith('{"cols"'))
+
+    def test_csv_is_streamed(self):
+        cache.set_cache(cache.ResourceCache(0))
+        self.provider.stream = lambda uri, content_type, chunk_size: \
+            iter(['{"cols"', ': []}'])
+        context = box.Box(box_request('.csv'))
+        self.failUnless(list(context.app_iter) == ['{"cols"', ': []}'])
+        self.failUnless(self.provider.calls == [])
+
+    def test_streamed_body(self):
+        cache.set_cache(cache.ResourceCache(0))
+        self.provider.stream = lambda uri, content_type, chunk_size: \
+            iter(['{"cols"', ': []}'])
+        context = box.Box(box_request('.json'))
+        self.failUnless(context.body == '{"cols": []}')
+        self.failUnless(context.app_iter is None)
+
+    def test_missing_download(self):
+        cache.set_cache(cache.ResourceCache(0))
+        self.provider.stream = lambda uri, content_type, chunk_size: None
+        context = box.Box(box_request('.csv'))
+        self.failUnless(context.body is None)
+
+    def test_json_window(self):
+        params = {'offset': '0', 'limit': '100000'}
+        context = box.Box(box_request('.json', params))
+        body = json.loads(context.body)
+        self.failUnless(body['p'] == {'offset': 0,
+                                      'limit': MAX_PAGE_SIZE,
+                                      'total': 1}, body['p'])
+        self.failUnless(body['rows'] == [{'c': [{'v': 'ENCODE'}]}])
+        self.failUnless(self.provider.calls[-1][1] == PICKLED)
+
+    def test_json_window_past_the_end(self):
+        context = box.Box(box_request('.json', {'offset': '20'}))
+        body = json.loads(context.body)
+        self.failUnless(body['rows'] == [])
+        self.failUnless(body['p']['total'] == 1)
+
+    def test_not_modified_download(self):
+        first = box.Box(box_request('.csv'))
+        first.body
+        # The body is cached now, so it gets an ETag
+        second = box.Box(box_request('.csv'))
+        self.failUnless(second.etag)
+        request = box_request('.csv')
+        request.headers['If-None-Match'] = second.etag
+        third = box.Box(request)
+        self.failUnless(third.not_modified)
+        self.failUnless(third.app_iter is None)
+
+    def test_not_modified_html(self):
+        etag = box.Box(box_request('.html')).etag
+        request = box_request('.html')
+        request.headers['If-None-Match'] = etag
+        context = box.Box(request)
+        self.failUnless(context.not_modified)
+        self.failUnless(context.charts == [])
+        self.failUnless(context.javascript == '')
+        # Other widths are rendered again
+        request = box_request('.html', {'width': '400'})
+        request.headers['If-None-Match'] = etag
+        self.failIf(box.Box(request).not_modified)
+
+    def test_unsupported_format(self):
+        self.failUnlessRaises(AttributeError, box.Box, box_request('.xml'))
 
 
 # make the test suite.
@@ -0,0 +1,81 @@
+import sys
+import time
+import unittest
+from raisin.restyler.breaker import CircuitBreaker
+from raisin.restyler.breaker import Breakers
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_failures_in_a_row(self):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+        breaker.fail()
+        breaker.fail()
+        breaker.succeed()
+        breaker.fail()
+        breaker.fail()
+        self.failUnless(breaker.allow())
+        breaker.fail()
+        self.failUnless(breaker.is_open())
+        self.failIf(breaker.allow())
+        self.failUnless(breaker.stats()['trips'] == 1)
+        self.failUnless(breaker.stats()['rejections'] == 1)
+
+    def test_probe_closes_breaker(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        breaker.fail()
+        breaker.opened = time.time() - 61
+        # Only one fetch is let through as probe
+        self.failUnless(breaker.allow())
+        self.failIf(breaker.allow())
+        breaker.succeed()
+        self.failIf(breaker.is_open())
+        self.failUnless(breaker.allow())
+        self.failUnless(breaker.stats()['probes'] == 1)
+        self.failUnless(breaker.stats()['recoveries'] == 1)
+
+    def test_failed_probe_opens_breaker_again(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        breaker.fail()
+        breaker.opened = time.time() - 61
+        self.failUnless(breaker.allow())
+        breaker.fail()
+        self.failIf(breaker.allow())
+        self.failUnless(breaker.stats()['trips'] == 2)
+
+    def test_cancelled_probe_lets_next_probe_through(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        breaker.fail()
+        breaker.opened = time.time() - 61
+        self.failUnless(breaker.allow())
+        breaker.cancel()
+        self.failUnless(breaker.is_open())
+        self.failUnless(breaker.allow())
+        self.failUnless(breaker.stats()['failures'] == 1)
+
+    def test_one_breaker_per_host(self):
+        breakers = Breakers()
+        first = breakers.get("http://127.0.0.1:6464/projects")
+        second = breakers.get("http://127.0.0.1:6464/project/ENCODE")
+        other = breakers.get("http://localhost:6464/projects")
+        self.failUnless(first is second)
+        self.failIf(first is other)
+        breakers.clear()
+        self.failUnless(breakers.stats() == {})
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(CircuitBreakerTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
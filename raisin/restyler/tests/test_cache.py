@@ -0,0 +1,73 @@
+import sys
+import time
+import unittest
+from raisin.restyler.cache import ResourceCache
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def test_hit_and_miss(self):
+        cache = ResourceCache(100)
+        self.failUnless(cache.get('a') is None)
+        cache.store('a', {'value': 1}, 10, 60)
+        self.failUnless(cache.get('a') == {'value': 1})
+        stats = cache.stats()
+        self.failUnless(stats['hits'] == 1)
+        self.failUnless(stats['misses'] == 1)
+        self.failUnless(stats['bytes'] == 10)
+
+    def test_expiry(self):
+        cache = ResourceCache(100)
+        cache.store('a', 'value', 10, 0.01)
+        time.sleep(0.02)
+        self.failUnless(cache.get('a') is None)
+        self.failUnless(cache.stats()['bytes'] == 0)
+
+    def test_zero_ttl_is_not_stored(self):
+        cache = ResourceCache(100)
+        cache.store('a', 'value', 10, 0)
+        self.failUnless(cache.get('a') is None)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResourceCache(30)
+        cache.store('a', 'A', 10, 60)
+        cache.store('b', 'B', 10, 60)
+        cache.store('c', 'C', 10, 60)
+        # Use a, so that b becomes the least recently used entry
+        cache.get('a')
+        cache.store('d', 'D', 10, 60)
+        self.failUnless(cache.get('b') is None)
+        self.failUnless(cache.get('a') == 'A')
+        self.failUnless(cache.get('d') == 'D')
+        self.failUnless(cache.stats()['evictions'] == 1)
+        self.failUnless(cache.stats()['bytes'] == 30)
+
+    def test_too_big_is_not_stored(self):
+        cache = ResourceCache(30)
+        cache.store('a', 'A', 10, 60)
+        cache.store('b', 'B', 31, 60)
+        self.failUnless(cache.get('b') is None)
+        self.failUnless(cache.get('a') == 'A')
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(CacheTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,90 @@
+import sys
+import unittest
+from raisin.restyler.chart import ChartView
+
+
+def get_box():
+    return {'title': 'Top Genes',
+            'charttype': 'Table',
+            'description': ['first line'],
+            'chartoptions': {'width': '900', 'allowHtml': True}}
+
+
+class ChartViewTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def test_read_through(self):
+        box = get_box()
+        chart = ChartView(box)
+        self.failUnless(chart['title'] == 'Top Genes')
+        self.failUnless(chart.get('UNKNOWN', 'default') == 'default')
+        self.failUnless('charttype' in chart)
+        self.failUnless(chart == box)
+        self.failUnless(len(chart) == 4)
+
+    def test_nested_writes_leave_base_untouched(self):
+        box = get_box()
+        chart = ChartView(box)
+        chart['id'] = 'top_genes'
+        chart['chartoptions']['width'] = 400
+        chart['chartoptions']['is3D'] = False
+        chart['description'].append('second line')
+        self.failUnless(box == get_box())
+        self.failUnless(chart['id'] == 'top_genes')
+        self.failUnless(chart['chartoptions']['width'] == 400)
+        self.failUnless(chart['description'] == ['first line',
+                                                 'second line'])
+
+    def test_added_keys_come_last(self):
+        chart = ChartView(get_box())
+        chart['chartoptions']['is3D'] = False
+        keys = chart['chartoptions'].keys()
+        self.failUnless(keys[-1] == 'is3D')
+        self.failUnless(sorted(keys) == ['allowHtml', 'is3D', 'width'])
+
+    def test_delete(self):
+        box = get_box()
+        chart = ChartView(box)
+        del chart['title']
+        self.failIf('title' in chart)
+        self.failUnless('title' in box)
+        self.failUnlessRaises(KeyError, chart.__getitem__, 'title')
+        chart['title'] = 'Changed'
+        self.failUnless(chart.pop('title') == 'Changed')
+        self.failUnless(len(chart) == 3)
+
+    def test_copy_is_layered(self):
+        box = get_box()
+        chart = ChartView(box)
+        chart['chartoptions']['width'] = 400
+        copy = chart.copy()
+        copy['chartoptions']['height'] = 300
+        self.failIf('height' in chart['chartoptions'])
+        self.failUnless(copy['chartoptions']['width'] == 400)
+        self.failUnless(box == get_box())
+
+    def test_slots(self):
+        chart = ChartView(get_box())
+        self.failIf(hasattr(chart, '__dict__'))
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(ChartViewTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
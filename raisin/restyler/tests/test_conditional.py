@@ -0,0 +1,98 @@
+import sys
+import gzip
+import zlib
+import unittest
+from cStringIO import StringIO
+from pyramid.testing import DummyRequest
+from raisin.restyler import conditional
+from raisin.restyler import cache
+from fixtures import reset_caches
+
+BODY = 'var charts = [];\n' * 100
+
+
+def conditional_request(headers):
+    request = DummyRequest()
+    request.headers = headers
+    return request
+
+
+class ConditionalTest(unittest.TestCase):
+
+    def tearDown(self):
+        reset_caches()
+        unittest.TestCase.tearDown(self)
+
+    def test_get_etag(self):
+        etag = conditional.get_etag(['http://example.com/', 'abc'])
+        self.failUnless(etag.startswith('"') and etag.endswith('"'))
+        self.failUnless(etag == conditional.get_etag([u'http://example.com/',
+                                                      'abc']))
+        self.failIf(etag == conditional.get_etag(['http://example.com/',
+                                                  'abd']))
+        self.failUnless(conditional.get_etag(['abc', None]) is None)
+
+    def test_is_not_modified(self):
+        request = conditional_request({'If-None-Match': 'W/"b", "a"'})
+        self.failUnless(conditional.is_not_modified(request, '"a"'))
+        self.failUnless(conditional.is_not_modified(request, '"b"'))
+        self.failIf(conditional.is_not_modified(request, '"c"'))
+        self.failIf(conditional.is_not_modified(request, None))
+        request = conditional_request({'If-None-Match': '*'})
+        self.failUnless(conditional.is_not_modified(request, '"c"'))
+        self.failIf(conditional.is_not_modified(DummyRequest(), '"c"'))
+
+    def test_get_encoding(self):
+        get_encoding = conditional.get_encoding
+        request = conditional_request({'Accept-Encoding': 'deflate, gzip'})
+        self.failUnless(get_encoding(request) == 'gzip')
+        request = conditional_request({'Accept-Encoding':
+                                       'gzip;q=0.5, deflate'})
+        self.failUnless(get_encoding(request) == 'deflate')
+        request = conditional_request({'Accept-Encoding': 'gzip;q=0, br'})
+        self.failUnless(get_encoding(request) is None)
+        request = conditional_request({'Accept-Encoding': '*'})
+        self.failUnless(get_encoding(request) == 'gzip')
+        self.failUnless(get_encoding(DummyRequest()) is None)
+
+    def test_encode(self):
+        encoded = conditional.encode(BODY, 'gzip')
+        self.failUnless(encoded == conditional.encode(BODY, 'gzip'))
+        self.failUnless(gzip.GzipFile(fileobj=StringIO(encoded)).read() ==
+                        BODY)
+        encoded = conditional.encode(BODY, 'deflate')
+        self.failUnless(zlib.decompress(encoded) == BODY)
+        self.failUnlessRaises(ValueError, conditional.encode, BODY, 'br')
+
+    def test_encode_body_is_cached_by_etag(self):
+        context = conditional.Conditional()
+        request = conditional_request({'Accept-Encoding': 'gzip'})
+        context.check_etag(request, ['http://example.com/', 'abc'])
+        encoding, encoded = context.encode_body(request, BODY)
+        self.failUnless(encoding == 'gzip')
+        # The body is not compressed again for the same ETag
+        encoding, again = context.encode_body(request, 'ignored' * 100)
+        self.failUnless(again == encoded)
+        self.failUnless(cache.get_cache(cache.ENCODED).stats()['hits'] == 1)
+
+    def test_encode_small_body(self):
+        context = conditional.Conditional()
+        request = conditional_request({'Accept-Encoding': 'gzip'})
+        self.failUnless(context.encode_body(request, u'{}') == (None, '{}'))
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(ConditionalTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
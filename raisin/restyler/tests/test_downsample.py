@@ -0,0 +1,131 @@
+import sys
+import json
+import unittest
+from raisin.restyler import downsample
+
+
+def series(count, spike=None):
+    rows = []
+    for position in range(count):
+        value = 1
+        if position == spike:
+            value = 100
+        rows.append({'c': [{'v': position}, {'v': value}]})
+    return {'cols': [{'id': 'x', 'label': 'Position', 'type': 'number'},
+                     {'id': 'y', 'label': 'Quality', 'type': 'number'}],
+            'rows': rows}
+
+
+def matrix(count, columns):
+    cols = [{'id': 'gene', 'label': 'Gene', 'type': 'string'}]
+    for column in range(columns):
+        cols.append({'id': 's%s' % column, 'label': 'S%s' % column,
+                     'type': 'number'})
+    rows = [{'c': [{'v': 'G%s' % row}] +
+                  [{'v': row * columns + column}
+                   for column in range(columns)]}
+            for row in range(count)]
+    return {'cols': cols, 'rows': rows}
+
+
+class DownsampleTest(unittest.TestCase):
+
+    def test_lttb_keeps_first_last_and_peak(self):
+        xs = [float(x) for x in range(100)]
+        ys = [0.0] * 100
+        ys[42] = 10.0
+        kept = downsample.lttb(xs, ys, 10)
+        self.failUnless(len(kept) == 10, kept)
+        self.failUnless(kept[0] == 0 and kept[-1] == 99)
+        self.failUnless(42 in kept)
+        self.failUnless(kept == sorted(kept))
+
+    def test_lttb_small_series(self):
+        self.failUnless(downsample.lttb([0, 1], [0, 1], 10) == [0, 1])
+
+    def test_downsample_series(self):
+        data = series(1000, spike=500)
+        downsampled = downsample.downsample_series(data, 50)
+        self.failUnless(len(downsampled['rows']) == 50)
+        self.failUnless({'c': [{'v': 500}, {'v': 100}]} in
+                        downsampled['rows'])
+        # The data is left untouched
+        self.failUnless(len(data['rows']) == 1000)
+
+    def test_downsample_grouped_series(self):
+        # Lanes one after the other, with positions starting again
+        data = series(1000)
+        data['rows'] = data['rows'] + data['rows']
+        self.failUnless(downsample.downsample_series(data, 50) is data)
+        data = series(1000)
+        data['cols'].append({'id': 'lane', 'label': 'Lane',
+                             'type': 'string'})
+        self.failUnless(downsample.downsample_series(data, 50) is data)
+
+    def test_downsample_series_small_enough(self):
+        data = series(10)
+        self.failUnless(downsample.downsample_series(data, 50) is data)
+
+    def test_downsample_matrix(self):
+        data = matrix(10, 4)
+        downsampled = downsample.downsample_matrix(data, 5, 2)
+        self.failUnless(len(downsampled['rows']) == 5)
+        self.failUnless(len(downsampled['cols']) == 3)
+        self.failUnless(downsampled['cols'][1]['label'] == 'S0 - S1')
+        first = downsampled['rows'][0]['c']
+        self.failUnless(first[0] == {'v': 'G0 - G1'}, first)
+        # The mean of 0, 1, 4 and 5
+        self.failUnless(first[1] == {'v': 2.5}, first)
+
+    def test_downsample_matrix_with_strings(self):
+        data = matrix(10, 4)
+        data['cols'][2]['type'] = 'string'
+        self.failUnless(downsample.downsample_matrix(data, 5, 2) is data)
+
+    def test_downsample_chart(self):
+        body = json.dumps(series(5000))
+        downsampled = downsample.downsample_chart(body, 'ScatterChart',
+                                                  {'width': '100'})
+        self.failUnless(len(json.loads(downsampled)['rows']) == 200)
+        heatmap = json.dumps(matrix(100, 10))
+        downsampled = downsample.downsample_chart(heatmap, 'HeatMap',
+                                                  {'width': 40,
+                                                   'height': 80})
+        data = json.loads(downsampled)
+        self.failUnless(len(data['rows']) == 10)
+        self.failUnless(len(data['cols']) == 6)
+
+    def test_downsample_chart_unchanged(self):
+        body = json.dumps(series(5000))
+        self.failUnless(downsample.downsample_chart(body, 'Table', {}) is
+                        body)
+        self.failUnless(downsample.downsample_chart('new Date(', 'LineChart',
+                                                    {}) == 'new Date(')
+        for other in ['[1, 2]', '{"rows": []}']:
+            self.failUnless(downsample.downsample_chart(other, 'LineChart',
+                                                        {}) is other)
+        self.failUnless(downsample.downsample_chart(body, 'ImageSparkLine',
+                                                    {'width': '100'}) is
+                        body)
+        # Heat maps without a height are left alone
+        heatmap = json.dumps(matrix(1000, 10))
+        self.failUnless(downsample.downsample_chart(heatmap, 'HeatMap',
+                                                    {'width': 40}) is
+                        heatmap)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(DownsampleTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
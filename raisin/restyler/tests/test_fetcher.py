@@ -0,0 +1,100 @@
+import sys
+import time
+import threading
+import unittest
+from raisin.restyler import fetcher
+from raisin.restyler.fetcher import fetch_concurrently
+
+
+class FetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def test_results_in_job_order(self):
+        def slow(delay, value):
+            time.sleep(delay)
+            return value
+        jobs = [(0.03, 'a'), (0.01, 'b'), (0.02, 'c')]
+        self.failUnless(fetch_concurrently(slow, jobs) == ['a', 'b', 'c'])
+
+    def test_concurrency_cap(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def count(value):
+            lock.acquire()
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return value
+        jobs = [(i, ) for i in range(12)]
+        results = fetch_concurrently(count, jobs, 3)
+        self.failUnless(results == range(12))
+        self.failUnless(peak[0] <= 3)
+
+    def test_nested_calls_share_the_helpers(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def count(value):
+            lock.acquire()
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return value
+
+        def nested(value):
+            return fetch_concurrently(count, [(i, ) for i in range(4)], 4)
+        helpers = fetcher.HELPERS
+        fetcher.HELPERS = threading.BoundedSemaphore(2)
+        try:
+            results = fetch_concurrently(nested, [(i, ) for i in range(4)],
+                                         4)
+        finally:
+            fetcher.HELPERS = helpers
+        self.failUnless(results == [range(4)] * 4)
+        # The calling thread and two helpers
+        self.failUnless(peak[0] <= 3, peak)
+
+    def test_no_pool_overhead(self):
+        started = time.time()
+        for index in range(10):
+            fetch_concurrently(lambda value: value, [(1, ), (2, )])
+        self.failUnless(time.time() - started < 0.5)
+
+    def test_exception_is_raised(self):
+        def fail(value):
+            raise KeyError(value)
+        self.failUnlessRaises(KeyError, fetch_concurrently, fail,
+                              [('a', ), ('b', )])
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(FetcherTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,125 @@
+import sys
+import time
+import threading
+import unittest
+from raisin.restyler.flight import SingleFlight
+
+
+def run_concurrently(function, count):
+    """Call function from count threads at the same time"""
+    results = []
+    threads = []
+    for index in range(count):
+        thread = threading.Thread(target=lambda: results.append(function()))
+        threads.append(thread)
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.calls = 0
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def slow(self, result):
+        self.calls += 1
+        time.sleep(0.1)
+        return result
+
+    def test_concurrent_calls_are_collapsed(self):
+        flights = SingleFlight()
+        results = run_concurrently(lambda: flights.do('name', 'key',
+                                                      self.slow, 'R'), 5)
+        self.failUnless(results == ['R'] * 5)
+        self.failUnless(self.calls == 1)
+        stats = flights.stats()['name']
+        self.failUnless(stats == {'calls': 1, 'collapsed': 4}, stats)
+
+    def test_none_result_is_shared(self):
+        flights = SingleFlight()
+        results = run_concurrently(lambda: flights.do('name', 'key',
+                                                      self.slow, None), 3)
+        self.failUnless(results == [None] * 3)
+        self.failUnless(self.calls == 1)
+
+    def test_different_keys_are_not_collapsed(self):
+        flights = SingleFlight()
+        flights.do('name', 'a', self.slow, 'A')
+        flights.do('name', 'b', self.slow, 'B')
+        flights.do('other', 'a', self.slow, 'A')
+        self.failUnless(self.calls == 3)
+        # Counted per name, not per key
+        stats = flights.stats()
+        self.failUnless(stats == {'name': {'calls': 2, 'collapsed': 0},
+                                  'other': {'calls': 1, 'collapsed': 0}},
+                        stats)
+
+    def slow_many(self, items):
+        self.calls += 1
+        time.sleep(0.1)
+        return dict([(item, item.upper()) for item in items])
+
+    def test_batches_join_calls_in_progress(self):
+        flights = SingleFlight()
+        batch = [('name', 'a', 'a'), ('name', 'b', 'b')]
+        results = run_concurrently(lambda: flights.do_many(batch,
+                                                           self.slow_many), 3)
+        self.failUnless(results == [{'a': 'A', 'b': 'B'}] * 3)
+        self.failUnless(self.calls == 1)
+        self.failUnless(flights.stats()['name'] == {'calls': 2,
+                                                     'collapsed': 4})
+        # Only the items without a call in progress are given to the call
+        started = []
+
+        def fetch(items):
+            started.extend(items)
+            return dict([(item, item) for item in items])
+        thread = threading.Thread(target=flights.do, args=('name', 'a',
+                                                           self.slow, 'A'))
+        thread.start()
+        time.sleep(0.05)
+        results = flights.do_many(batch, fetch)
+        thread.join()
+        self.failUnless(started == ['b'])
+        self.failUnless(results == {'a': 'A', 'b': 'b'})
+
+    def test_batch_error_is_raised(self):
+        flights = SingleFlight()
+
+        def fail(items):
+            raise KeyError('key')
+        self.failUnlessRaises(KeyError, flights.do_many,
+                              [('name', 'key', 'item')], fail)
+        self.failUnless(flights.flights == {})
+
+    def test_error_is_raised(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise KeyError('key')
+        self.failUnlessRaises(KeyError, flights.do, 'name', 'key', fail)
+        self.failUnless(flights.flights == {})
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(SingleFlightTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -1,18 +1,69 @@
 import sys
+import pickle
 import unittest
 from raisin.restyler import page
+from raisin.restyler import provider
+from raisin.restyler import cache
+from raisin.restyler import prefetch
+from raisin.restyler.config import PICKLED
+from raisin.restyler.config import JSON
+from raisin.box import BOXES
 from pyramid.testing import DummyRequest
+from fixtures import DataResourceProvider
+from fixtures import reset_caches
 
 
 class MatchedRoute(object):
     pass
 
 
+class OfflineResourceProvider:
+    """Behaves like a provider without a Restish server to talk to"""
+
+    def get(self, uri, content_type):
+        return None
+
+
+class BulkResourceProvider(DataResourceProvider):
+    """Has a bulk endpoint, and counts the calls to it"""
+
+    def __init__(self):
+        DataResourceProvider.__init__(self)
+        self.bulk_calls = []
+
+    def get(self, uri, content_type):
+        raise AssertionError("Single get for %s" % uri)
+
+    def get_many(self, requests):
+        self.bulk_calls.append(requests)
+        bodies = []
+        for uri, content_type in requests:
+            if uri.endswith('/replicates'):
+                replicate = ('ENCODE', 'K562', 'Rep1', 'Replicate 1',
+                             '/project/ENCODE/cell/K562/replicate/Rep1')
+                bodies.append(pickle.dumps({'table_description': [],
+                                            'table_data': [replicate]}))
+            else:
+                bodies.append(DataResourceProvider.get(self, uri,
+                                                       content_type))
+        return bodies
+
+
+def project_request():
+    request = DummyRequest()
+    request.matched_route = MatchedRoute()
+    request.matched_route.name = 'p1_project'
+    request.matchdict = {'project_name': 'ENCODE'}
+    return request
+
+
 class ResourceTest(unittest.TestCase):
     def setUp(self):
         unittest.TestCase.setUp(self)
+        provider.set_provider(OfflineResourceProvider())
 
     def tearDown(self):
+        reset_caches()
         unittest.TestCase.tearDown(self)
 
     def test_page(self):
@@ -61,6 +112,216 @@ class ResourceTest(unittest.TestCase):
         print p.get_breadcrumbs(request)
         self.failUnless(p.get_breadcrumbs(request) == bcr, p.get_breadcrumbs(request))
 
+    def test_experiment_page_fetches_in_one_batch(self):
+        bulk = BulkResourceProvider()
+        provider.set_provider(bulk)
+        request = DummyRequest()
+        request.matched_route = MatchedRoute()
+        request.matched_route.name = 'p1_experiment'
+        request.matchdict = {'project_name': 'ENCODE',
+                             'parameter_list': 'cell',
+                             'parameter_values': 'K562'}
+        p = page.Page(request)
+        # All resources including the replicates come from the same host
+        self.failUnless(len(bulk.bulk_calls) == 1, bulk.bulk_calls)
+        uris = [uri for uri, content_type in bulk.bulk_calls[0]]
+        self.failUnless(len(uris) == len(set(bulk.bulk_calls[0])))
+        url = 'http://example.com/project/ENCODE/cell/K562/replicate/Rep1'
+        self.failUnless(p.items['list'] == [{'title': 'Replicate 1',
+                                             'url': url}], p.items)
+
+    def test_layouts_are_compiled_once(self):
+        request = DummyRequest()
+        request.matched_route = MatchedRoute()
+        request.matched_route.name = 'p1_experiment'
+        request.matchdict = {'tab_name': 'read'}
+        first = page.Layout(request)
+        second = page.Layout(request)
+        self.failUnless(first.get_cells() is second.get_cells())
+        self.failUnless(first.get_cells() is page.LAYOUTS[('experiment',
+                                                           'read')])
+
+    def test_unknown_tab_falls_back_to_first_tab(self):
+        request = DummyRequest()
+        request.matched_route = MatchedRoute()
+        request.matched_route.name = 'p1_tab_experiment'
+        request.matchdict = {'tab_name': 'title'}
+        layout = page.Layout(request)
+        self.failUnless(layout.get_cells() is page.LAYOUTS[('experiment',
+                                                            'experiments')])
+
+    def test_compile_layouts(self):
+        view = {'rows': 'row1',
+                'cols': ['col1', 'col2'],
+                'row1': {'columns': ['project_about', 'project_meta']}}
+        layouts = page.compile_layouts({'homepage': view})
+        cells = layouts[('homepage', None)]
+        self.failUnless(cells.get_cells() == ('project_about',
+                                              'project_meta'))
+        self.failUnless(cells.get_column_for_chart('project_meta') == 'col2')
+        self.failUnless(cells.get_new_row_for_chart('project_about'))
+        names = [resource[0] for resource in cells.get_resources()]
+        self.failUnless(sorted(names) == ['project_about', 'project_meta'])
+        # The configuration is left untouched
+        self.failUnless(view['rows'] == 'row1')
+
+    def test_compile_layouts_too_many_columns(self):
+        view = {'rows': ['row1'],
+                'cols': ['col1'],
+                'row1': {'columns': ['project_about', 'project_meta']}}
+        self.failUnlessRaises(AttributeError, page.compile_layouts,
+                              {'homepage': view})
+
+    def test_compile_layouts_unknown_resource(self):
+        view = {'rows': ['row1'],
+                'cols': ['col1'],
+                'row1': {'columns': ['UNKNOWN']}}
+        self.failUnlessRaises(AttributeError, page.compile_layouts,
+                              {'homepage': view})
+
+    def test_rendered_charts_are_cached(self):
+        provider.set_provider(DataResourceProvider())
+        first = page.Page(project_request())
+        fragments = cache.get_cache(cache.FRAGMENTS)
+        self.failUnless(fragments.stats()['entries'] == 2)
+        second = page.Page(project_request())
+        self.failUnless(fragments.stats()['hits'] == 2)
+        self.failUnless(first.get_charts() == second.get_charts())
+        self.failUnless(first.get_javascript() == second.get_javascript())
+
+    def test_cached_charts_leave_resources_out(self):
+        provider.set_provider(DataResourceProvider())
+        page.Page(project_request())
+        fragments = cache.get_cache(cache.FRAGMENTS)
+        resources = cache.get_cache()
+        # Entries hold the decoded result, its digest and the stale time
+        tables = [entry[0][0] for entry in resources.entries.values()
+                  if isinstance(entry[0][0], dict)]
+        self.failUnless(tables)
+        for chart, size, expires in fragments.entries.values():
+            self.failIf(PICKLED in chart or JSON in chart, chart)
+            for value in chart.values():
+                self.failIf([table for table in tables if table is value])
+
+    def test_boxes_are_left_untouched(self):
+        provider.set_provider(DataResourceProvider())
+        chartoptions = dict(BOXES['project_experimentstable']['chartoptions'])
+        charts = page.Page(project_request()).get_charts()
+        self.failUnless(charts[1]['chartoptions']['is3D'] == False)
+        self.failUnless(BOXES['project_experimentstable']['chartoptions'] ==
+                        chartoptions)
+
+    def test_changed_resources_are_rendered_again(self):
+        provider.set_provider(DataResourceProvider())
+        page.Page(project_request())
+        # Drop the resources, so that they are fetched again
+        cache.set_cache(None)
+        provider.set_provider(DataResourceProvider('Changed'))
+        charts = page.Page(project_request()).get_charts()
+        fragments = cache.get_cache(cache.FRAGMENTS)
+        self.failUnless(fragments.stats()['hits'] == 0)
+        about = [chart for chart in charts if chart['id'] == 'project_about']
+        self.failUnless('Changed' in about[0]['description_rendered'])
+
+    def test_timings(self):
+        provider.set_provider(DataResourceProvider())
+        cache.set_cache(cache.ResourceCache(0))
+        timings = page.Page(project_request()).timings
+        stages = timings.get_stages()
+        for stage in ['fetch', 'decode', 'render', 'javascript']:
+            self.failUnless(stage in stages, stages)
+        about = timings.get_resources()['project_about']
+        self.failUnless(about['decode'][1] > 0, about)
+        self.failUnless('total;dur=' in timings.get_header())
+
+    def test_not_modified(self):
+        provider.set_provider(DataResourceProvider())
+        first = page.Page(project_request())
+        self.failUnless(first.etag)
+        self.failIf(first.not_modified)
+        request = project_request()
+        request.headers['If-None-Match'] = first.etag
+        fragments = cache.get_cache(cache.FRAGMENTS)
+        lookups = fragments.stats()['hits'] + fragments.stats()['misses']
+        second = page.Page(request)
+        self.failUnless(second.not_modified)
+        self.failUnless(second.get_charts() == [])
+        # Nothing has been rendered
+        self.failUnless(fragments.stats()['hits'] +
+                        fragments.stats()['misses'] == lookups)
+
+    def test_etag_changes_with_resources(self):
+        provider.set_provider(DataResourceProvider())
+        etag = page.Page(project_request()).etag
+        cache.set_cache(None)
+        provider.set_provider(DataResourceProvider('Changed'))
+        request = project_request()
+        request.headers['If-None-Match'] = etag
+        changed = page.Page(request)
+        self.failIf(changed.not_modified)
+        self.failIf(changed.etag == etag)
+        self.failUnless(len(changed.get_charts()) == 2)
+
+    def test_lazy_chart_data(self):
+        bulk = BulkResourceProvider()
+        provider.set_provider(bulk)
+        page.Restyler.lazy = True
+        try:
+            p = page.Page(project_request())
+        finally:
+            page.Restyler.lazy = False
+        # The data is left to the browser
+        content_types = set([content_type
+                             for uri, content_type in bulk.bulk_calls[0]])
+        self.failIf(JSON in content_types)
+        table = [chart for chart in p.get_charts()
+                 if chart['id'] == 'project_experimentstable'][0]
+        url = 'http://example.com/project_experimentstable.json'
+        self.failUnless(table['data_url'] == url, table['data_url'])
+        self.failIf('data' in table)
+        self.failUnless('url: "%s"' % url in p.get_javascript())
+
+    def test_paged_tables(self):
+        cells = page.LAYOUTS[('project', 'experiments')]
+        restyler = page.Restyler(project_request(), cells)
+        self.failIf(restyler.is_paged('experiment_detected_genes'))
+        restyler.paged = True
+        self.failUnless(restyler.is_paged('experiment_detected_genes'))
+        self.failIf(restyler.is_paged('project_experimentstable'))
+        content_types = restyler.get_content_types('experiment_detected_genes',
+                                                   [PICKLED, JSON])
+        self.failUnless(content_types == [PICKLED])
+
+    def test_prefetch(self):
+        bulk = BulkResourceProvider()
+        provider.set_provider(bulk)
+        prefetcher = prefetch.Prefetcher(rate=0)
+        page.Page.prefetcher = prefetcher
+        request = DummyRequest()
+        request.matched_route = MatchedRoute()
+        request.matched_route.name = 'p1_experiment'
+        request.matchdict = {'project_name': 'ENCODE',
+                             'parameter_list': 'cell',
+                             'parameter_values': 'K562'}
+        try:
+            page.Page(request)
+            prefetcher.join()
+        finally:
+            page.Page.prefetcher = None
+        stats = prefetcher.stats()
+        # The other tabs of the experiment and the first tab of its replicate
+        tabs = len(page.PAGES['experiment']['tabbed_views'])
+        self.failUnless(stats['prefetches'] == tabs, stats)
+        self.failUnless(stats['failures'] == 0, stats)
+        uris = [uri for call in bulk.bulk_calls[1:] for uri, content_type in call]
+        self.failUnless([uri for uri in uris if '/Rep1' in uri], uris)
+        # The prefetched tab is served from the cache
+        calls = len(bulk.bulk_calls)
+        request.matchdict['tab_name'] = page.PAGES['experiment'][
+            'tabbed_views'][1]
+        page.Page(request)
+        self.failUnless(len(bulk.bulk_calls) == calls, bulk.bulk_calls[calls:])
+
 
 # make the test suite.
 def suite():
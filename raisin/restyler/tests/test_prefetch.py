@@ -0,0 +1,103 @@
+import sys
+import time
+import threading
+import unittest
+from raisin.restyler import prefetch
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.calls = []
+
+    def call(self, name):
+        self.calls.append(name)
+
+    def fail_call(self):
+        raise IOError("Unreachable")
+
+    def test_schedule(self):
+        prefetcher = prefetch.Prefetcher(workers=2, rate=0)
+        self.failUnless(prefetcher.schedule('a', self.call, 'a'))
+        self.failUnless(prefetcher.schedule('b', self.call, 'b'))
+        prefetcher.join()
+        self.failUnless(sorted(self.calls) == ['a', 'b'], self.calls)
+        self.failUnless(len(prefetcher.workers) == 2)
+        stats = prefetcher.stats()
+        self.failUnless(stats['prefetches'] == 2, stats)
+        self.failUnless(stats['pending'] == 0, stats)
+
+    def test_pending_calls_are_not_queued_again(self):
+        prefetcher = prefetch.Prefetcher(workers=1, rate=0)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+        prefetcher.schedule('block', block)
+        started.wait()
+        self.failUnless(prefetcher.schedule('a', self.call, 'a'))
+        self.failIf(prefetcher.schedule('a', self.call, 'a'))
+        release.set()
+        prefetcher.join()
+        self.failUnless(self.calls == ['a'], self.calls)
+        # Done calls may be queued again
+        self.failUnless(prefetcher.schedule('a', self.call, 'a'))
+        prefetcher.join()
+        self.failUnless(self.calls == ['a', 'a'], self.calls)
+
+    def test_full_queue_drops_calls(self):
+        prefetcher = prefetch.Prefetcher(workers=1, rate=0, queue_size=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+        prefetcher.schedule('block', block)
+        started.wait()
+        self.failUnless(prefetcher.schedule('a', self.call, 'a'))
+        self.failIf(prefetcher.schedule('b', self.call, 'b'))
+        release.set()
+        prefetcher.join()
+        self.failUnless(self.calls == ['a'], self.calls)
+        self.failUnless(prefetcher.stats()['dropped'] == 1)
+
+    def test_rate(self):
+        prefetcher = prefetch.Prefetcher(workers=3, rate=50)
+        started = time.time()
+        for name in range(6):
+            prefetcher.schedule(name, self.call, name)
+        prefetcher.join()
+        # The first call starts at once, the others 20 ms apart
+        self.failUnless(time.time() - started >= 0.09)
+        self.failUnless(len(self.calls) == 6)
+
+    def test_failures(self):
+        prefetcher = prefetch.Prefetcher(workers=1, rate=0)
+        prefetcher.schedule('fail', self.fail_call)
+        prefetcher.schedule('a', self.call, 'a')
+        prefetcher.join()
+        self.failUnless(self.calls == ['a'])
+        stats = prefetcher.stats()
+        self.failUnless(stats['failures'] == 1, stats)
+        self.failUnless(stats['prefetches'] == 1, stats)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(PrefetchTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
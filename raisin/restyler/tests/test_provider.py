@@ -0,0 +1,132 @@
+import sys
+import unittest
+from raisin.restyler import provider
+from raisin.restyler.provider import PooledResourceProvider
+from raisin.restyler.resource import Resource
+from raisin.restyler.config import CSV
+from restkit.errors import RequestError
+from restkit.errors import ResourceNotFound
+from fixtures import reset_caches
+MARKER = "ABCDEFGHIFKLMNOPQRSTUVWXYZ"
+
+
+class DummyResourceProvider:
+
+    def get(self, uri, content_type):
+        return MARKER
+
+
+class DummyBody:
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, size):
+        chunk, self.body = self.body[:size], self.body[size:]
+        return chunk
+
+
+class DummyResponse:
+
+    def __init__(self, body, content_length=None):
+        self.body = DummyBody(body)
+        if content_length is None:
+            content_length = len(body)
+        self.headers = {'Content-Length': str(content_length)}
+        self.closed = False
+
+    def body_stream(self):
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+
+class ProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        reset_caches()
+        unittest.TestCase.tearDown(self)
+
+    def test_default_provider_is_shared(self):
+        self.failUnless(provider.get_provider() is provider.get_provider())
+        self.failUnless(isinstance(provider.get_provider(),
+                                   PooledResourceProvider))
+
+    def test_resource_uses_registered_provider(self):
+        dummyresourceprovider = DummyResourceProvider()
+        provider.set_provider(dummyresourceprovider)
+        resource = Resource()
+        self.failUnless(resource.provider is dummyresourceprovider)
+        self.failUnless(resource.get("project_projects", CSV) == MARKER)
+
+    def test_one_pool_per_host(self):
+        pooled = PooledResourceProvider(pool_size=2, idle_timeout=5)
+        first = pooled.get_pool("http://127.0.0.1:6464/projects")
+        second = pooled.get_pool("http://127.0.0.1:6464/project/ENCODE")
+        other = pooled.get_pool("http://localhost:6464/projects")
+        self.failUnless(first is second)
+        self.failIf(first is other)
+        self.failUnless(first.max_size == 2)
+        self.failUnless(first.max_lifetime == 5)
+
+    def test_transport_errors(self):
+        def refuse(path, headers=None, pool=None):
+            raise RequestError("Connection refused")
+
+        def not_found(path, headers=None, pool=None):
+            raise ResourceNotFound("Not found")
+        request = provider.request
+        try:
+            provider.request = refuse
+            self.failUnlessRaises(provider.TransportError,
+                                  provider.get_resource_by_uri,
+                                  "http://127.0.0.1:6464/projects")
+            provider.request = not_found
+            self.failUnless(provider.get_resource_by_uri(
+                "http://127.0.0.1:6464/projects") is None)
+        finally:
+            provider.request = request
+
+    def test_stream_body(self):
+        response = DummyResponse(MARKER)
+        chunks = list(provider.stream_body(response, 10))
+        self.failUnless(chunks == [MARKER[:10], MARKER[10:20], MARKER[20:]])
+        self.failIf(response.closed)
+
+    def test_stream_body_truncated(self):
+        response = DummyResponse(MARKER, len(MARKER) + 10)
+        chunks = provider.stream_body(response, 10)
+        self.failUnless(chunks.next() == MARKER[:10])
+        self.failUnless(chunks.next() == MARKER[10:20])
+        self.failUnless(chunks.next() == MARKER[20:])
+        self.failUnlessRaises(provider.TransportError, chunks.next)
+        self.failUnless(response.closed)
+
+    def test_stream_body_closed_early(self):
+        response = DummyResponse(MARKER)
+        chunks = provider.stream_body(response, 10)
+        chunks.next()
+        chunks.close()
+        # The connection can't be reused with the body half read
+        self.failUnless(response.closed)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(ProviderTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
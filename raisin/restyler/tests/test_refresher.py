@@ -0,0 +1,62 @@
+import sys
+import threading
+import unittest
+from raisin.restyler.refresher import Refresher
+
+
+class RefresherTest(unittest.TestCase):
+
+    def test_calls_are_made_in_background(self):
+        refresher = Refresher()
+        calls = []
+        refresher.schedule('key', calls.append, 'value')
+        refresher.join()
+        self.failUnless(calls == ['value'])
+        self.failUnless(refresher.stats()['refreshes'] == 1)
+
+    def test_pending_key_is_queued_once(self):
+        refresher = Refresher()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        refresher.schedule('block', block)
+        started.wait()
+        self.failUnless(refresher.schedule('key', calls.append, 1))
+        self.failIf(refresher.schedule('key', calls.append, 2))
+        release.set()
+        refresher.join()
+        self.failUnless(calls == [1])
+        # Once refreshed, the key can be queued again
+        self.failUnless(refresher.schedule('key', calls.append, 3))
+        refresher.join()
+        self.failUnless(calls == [1, 3])
+
+    def test_failures_are_counted(self):
+        refresher = Refresher()
+        refresher.schedule('key', int, 'not a number')
+        refresher.join()
+        self.failUnless(refresher.stats() == {'refreshes': 0,
+                                              'failures': 1,
+                                              'pending': 0})
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(RefresherTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
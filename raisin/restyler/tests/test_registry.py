@@ -0,0 +1,65 @@
+import sys
+import unittest
+from raisin.restyler.registry import RegistryIndex
+
+
+def method(context, box):
+    return box
+
+
+def other_method(context, box):
+    return box
+
+
+class RegistryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.registry = [('a', method, ('json', )),
+                         ('b', method, ('json', )),
+                         ('c', method, ('json', ))]
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def test_get(self):
+        index = RegistryIndex(self.registry)
+        self.failUnless(index.get('b') is self.registry[1])
+        self.failUnless(index.get('UNKNOWN') is None)
+
+    def test_last_registration_wins(self):
+        self.registry.append(('a', other_method, ('json', )))
+        index = RegistryIndex(self.registry)
+        self.failUnless(index.get('a')[1] is other_method)
+        self.failUnless(index.resolve(['a']) == (self.registry[3], ))
+
+    def test_resolve_in_registry_order(self):
+        index = RegistryIndex(self.registry)
+        resources = index.resolve(['c', 'a', 'c', 'a'])
+        self.failUnless(resources == (self.registry[0], self.registry[2]))
+
+    def test_resolve_unknown(self):
+        index = RegistryIndex(self.registry)
+        self.failUnlessRaises(AttributeError, index.resolve, ['a', 'UNKNOWN'])
+
+    def test_registered_later(self):
+        index = RegistryIndex(self.registry)
+        self.registry.append(('d', method, ('json', )))
+        self.failUnless(index.get('d') is self.registry[3])
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(RegistryIndexTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,105 @@
+import sys
+import unittest
+from raisin.restyler import renderers
+
+PACKAGES = "'corechart,table'"
+
+CHARTS = [{'id': 'experiment_top_genes',
+           'charttype': 'Table',
+           'data': '{"cols": [{"label": "<b>Gene</b> & id"}], "rows": []}',
+           'chartoptions_rendered': "width: 900, title: 'Top & Genes'",
+           'javascript': 'thousandsformatter.format(data, 1);\n'},
+          {'id': 'experiment_read_summary',
+           'charttype': 'ImageSparkLine',
+           'data': '{"cols": [], "rows": []}',
+           'chartoptions_rendered': 'width: 120'},
+          {'id': 'experiment_gene_expression_profile',
+           'charttype': 'HeatMap',
+           'data': '{"cols": [], "rows": []}',
+           'chartoptions_rendered': ''},
+          {'id': 'experiment_mapping_info',
+           'charttype': None,
+           'data': None},
+          {'id': 'experiment_detected_genes',
+           'charttype': 'LineChart',
+           'data': None,
+           'chartoptions_rendered': None,
+           'javascript': None}]
+
+
+class RenderersTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def test_strings_identical_to_template(self):
+        for charts in [CHARTS, CHARTS[:1], CHARTS[1:2], CHARTS[2:3],
+                       CHARTS[3:]]:
+            template = renderers.render_javascript_template(charts, PACKAGES)
+            strings = renderers.render_javascript_strings(charts, PACKAGES)
+            self.failUnless(type(template) == type(strings))
+            self.failUnless(template == strings, (template, strings))
+
+    def test_render_javascript_without_data(self):
+        charts = [{'id': 'project_about', 'charttype': 'Table'}]
+        self.failUnless(renderers.render_javascript(charts, ['table']) is None)
+
+    def test_render_javascript(self):
+        rendered = renderers.render_javascript(CHARTS, ['corechart'])
+        self.failUnless("{packages:['corechart']}" in rendered)
+        self.failUnless("'Top &amp; Genes'" in rendered)
+
+    def test_render_javascript_lazy(self):
+        charts = [dict(chart) for chart in CHARTS]
+        del charts[0]['data']
+        charts[0]['data_url'] = 'http://example.com/experiment_top_genes.json'
+        rendered = renderers.render_javascript(charts, ['corechart'])
+        self.failUnless("google.setOnLoadCallback(observeCharts);" in rendered)
+        self.failUnless('url: "http://example.com/experiment_top_genes.json"'
+                        in rendered)
+        self.failUnless('document.getElementById("experiment_top_genes_div")'
+                        in rendered)
+        self.failUnless("thousandsformatter.format(data, 1);" in rendered)
+        self.failUnless("table.draw(view,{width: 900, title: 'Top &amp; "
+                        "Genes'});" in rendered)
+        # Charts with data get it inline, charts without data are left out
+        self.failUnless('data: {"cols": [], "rows": []}' in rendered)
+        self.failUnless(rendered.count("draw: function (data, page)") == 3)
+        self.failUnless(rendered.count("pageSize: null") == 3)
+        self.failIf("experiment_detected_genes" in rendered)
+
+    def test_render_javascript_paged(self):
+        charts = [{'id': 'experiment_detected_genes',
+                   'charttype': 'Table',
+                   'chartoptions_rendered': 'page: \'enable\'',
+                   'data_url': 'http://example.com/d.json',
+                   'page_size': 20}]
+        rendered = renderers.render_javascript(charts, ['table'])
+        self.failUnless("pageSize: 20," in rendered)
+        self.failUnless("pageOptions({page: 'enable'}, data, page, 20)"
+                        in rendered)
+        self.failUnless("'offset=' + page * chart.pageSize" in rendered)
+
+    def test_quote_javascript(self):
+        quoted = renderers.quote_javascript("</script><script>")
+        self.failUnless(quoted == '"<\\/script><script>"', quoted)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(RenderersTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -1,9 +1,21 @@
 import sys
 import unittest
+import time
 import pickle
+import threading
 from raisin.restyler.resource import Resource
+from raisin.restyler.cache import ResourceCache
+from raisin.restyler.breaker import Breakers
+from raisin.restyler.refresher import Refresher
+from raisin.restyler.flight import SingleFlight
+from raisin.restyler.versions import Versions
 from raisin.restyler.config import PICKLED
 from raisin.restyler.config import CSV
+from raisin.restyler.config import COLUMNAR
+from raisin.restyler.wire import encode_table
+from raisin.restyler.provider import TransportError
+from http_parser.http import NoMoreData
+from fixtures import reset_caches
 MARKER = "ABCDEFGHIFKLMNOPQRSTUVWXYZ"
 
 
@@ -16,12 +28,104 @@ class DummyResourceProvider:
             return MARKER
 
 
+class CountingResourceProvider(DummyResourceProvider):
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, uri, content_type):
+        self.calls += 1
+        return DummyResourceProvider.get(self, uri, content_type)
+
+
+class BulkResourceProvider(CountingResourceProvider):
+
+    def __init__(self):
+        CountingResourceProvider.__init__(self)
+        self.bulk_calls = []
+
+    def get_many(self, requests):
+        self.bulk_calls.append(requests)
+        return [DummyResourceProvider.get(self, uri, content_type)
+                for uri, content_type in requests]
+
+
+class SlowBulkResourceProvider(BulkResourceProvider):
+
+    def get_many(self, requests):
+        time.sleep(0.1)
+        return BulkResourceProvider.get_many(self, requests)
+
+
+class TableResourceProvider:
+
+    def get(self, uri, content_type):
+        table = {'table_description': [('Gene', 'string')],
+                 'table_data': [('Gene%s' % index, ) for index in range(5)]}
+        return pickle.dumps(table)
+
+
+class FailingResourceProvider:
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, uri, content_type):
+        self.calls += 1
+        return None
+
+
+class UnreachableResourceProvider(FailingResourceProvider):
+
+    def get(self, uri, content_type):
+        self.calls += 1
+        raise TransportError("Connection refused")
+
+
+class BrokenResourceProvider(FailingResourceProvider):
+
+    def get(self, uri, content_type):
+        self.calls += 1
+        raise AttributeError("Content-Length")
+
+    def get_many(self, requests):
+        return self.get(None, None)
+
+    def stream(self, uri, content_type, chunk_size):
+        return self.get(uri, content_type)
+
+
+class ColumnarResourceProvider:
+
+    def get(self, uri, content_type):
+        return encode_table({'table_description': [('Name', 'string')],
+                             'table_data': [(MARKER, )]})
+
+
+class StreamingResourceProvider(DummyResourceProvider):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, uri, content_type, chunk_size):
+        if self.chunks is None:
+            return None
+        return self.iter_chunks()
+
+    def iter_chunks(self):
+        for chunk in self.chunks:
+            if chunk is NoMoreData:
+                raise NoMoreData()
+            yield chunk
+
+
 class ResourceTest(unittest.TestCase):
 
     def setUp(self):
         unittest.TestCase.setUp(self)
 
     def tearDown(self):
+        reset_caches()
         unittest.TestCase.tearDown(self)
 
     def test_get_unknown_resource(self):
@@ -41,6 +145,277 @@ class ResourceTest(unittest.TestCase):
         projects = resource.get("project_projects", CSV)
         self.failUnless(projects == MARKER)
 
+    def test_get_cached_resource(self):
+        countingresourceprovider = CountingResourceProvider()
+        resource = Resource(countingresourceprovider, ResourceCache())
+        first = resource.get("project_projects")
+        second = resource.get("project_projects")
+        self.failUnless(first == MARKER)
+        # The decoded object is reused without fetching it again
+        self.failUnless(second is first)
+        self.failUnless(countingresourceprovider.calls == 1)
+        self.failUnless(resource.cache.stats()['hits'] == 1)
+
+    def test_cache_key_includes_content_type(self):
+        countingresourceprovider = CountingResourceProvider()
+        resource = Resource(countingresourceprovider, ResourceCache())
+        resource.get("project_projects")
+        resource.get("project_projects", CSV)
+        self.failUnless(countingresourceprovider.calls == 2)
+
+    def test_get_columnar_resource(self):
+        resource = Resource(ColumnarResourceProvider())
+        # The format is sniffed, so it is decoded when asking for pickles too
+        for content_type in [PICKLED, COLUMNAR]:
+            table = resource.get("project_projects", content_type)
+            self.failUnless(table['table_data'] == [(MARKER, )])
+
+    def test_get_columnar_resource_without_columnar_body(self):
+        resource = Resource(DummyResourceProvider())
+        self.failUnlessRaises(ValueError, resource.get, "project_projects",
+                              COLUMNAR)
+
+    def test_stale_resource_is_refreshed_in_background(self):
+        countingresourceprovider = CountingResourceProvider()
+        refresher = Refresher()
+        resource = Resource(countingresourceprovider, ResourceCache(),
+                            refresher=refresher)
+        first = resource.get("project_projects")
+        key = (resource.get_uri("project_projects"), PICKLED)
+        # Make the cached resource stale
+        value, size, expires = resource.cache.entries[key]
+        stale = (value[0], value[1], time.time() - 1)
+        resource.cache.entries[key] = (stale, size, expires)
+        second = resource.get("project_projects")
+        self.failUnless(second is first)
+        refresher.join()
+        self.failUnless(countingresourceprovider.calls == 2)
+        self.failUnless(refresher.stats()['refreshes'] == 1)
+        third = resource.get("project_projects")
+        self.failUnless(third == MARKER)
+        self.failIf(third is first)
+
+    def test_concurrent_batches_are_collapsed(self):
+        slowbulkresourceprovider = SlowBulkResourceProvider()
+        resource = Resource(slowbulkresourceprovider, flights=SingleFlight())
+        wanted = [("project_projects", PICKLED), ("project_projects", CSV)]
+        results = []
+        threads = [threading.Thread(target=lambda:
+                                    results.append(resource.get_many(wanted)))
+                   for index in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.failUnless(len(slowbulkresourceprovider.bulk_calls) == 1)
+        self.failUnless(results == [{("project_projects", PICKLED): MARKER,
+                                     ("project_projects", CSV): MARKER}] * 3)
+        stats = resource.flights.stats()["project_projects"]
+        self.failUnless(stats == {'calls': 2, 'collapsed': 4}, stats)
+
+    def test_failing_stale_resource_is_not_refreshed(self):
+        countingresourceprovider = CountingResourceProvider()
+        refresher = Refresher()
+        breakers = Breakers(threshold=1, reset_timeout=60)
+        resource = Resource(countingresourceprovider, ResourceCache(),
+                            negatives=ResourceCache(), breakers=breakers,
+                            refresher=refresher)
+        first = resource.get("project_projects")
+        key = (resource.get_uri("project_projects"), PICKLED)
+        value, size, expires = resource.cache.entries[key]
+        stale = (value[0], value[1], time.time() - 1)
+        resource.cache.entries[key] = (stale, size, expires)
+        # The last fetch of the resource failed
+        resource.remember_failure(*key)
+        self.failUnless(resource.get("project_projects") is first)
+        # The backend host is failing
+        resource.negatives.clear()
+        breakers.get(key[0]).fail()
+        self.failUnless(resource.get("project_projects") is first)
+        refresher.join()
+        self.failUnless(countingresourceprovider.calls == 1)
+        self.failUnless(refresher.stats()['refreshes'] == 0)
+
+    def test_versioned_resources(self):
+        countingresourceprovider = CountingResourceProvider()
+        resource = Resource(countingresourceprovider, ResourceCache())
+        resource.versions = Versions()
+        encode = {'project_name': 'ENCODE'}
+        other = {'project_name': 'Other'}
+        resource.get("project_about", kwargs=encode)
+        resource.get("project_about", kwargs=other)
+        resource.get("project_projects")
+        key = (resource.get_uri("project_about", encode), PICKLED, (0, None))
+        value, size, expires = resource.cache.entries[key]
+        # Kept until the version changes, and never refreshed
+        self.failUnless(expires > time.time() + 24 * 3600)
+        self.failUnless(value[2] is None)
+        # Resources not belonging to a project keep their ttl
+        key = (resource.get_uri("project_projects"), PICKLED)
+        self.failUnless(key in resource.cache.entries)
+        resource.versions.bump('ENCODE')
+        resource.get("project_about", kwargs=encode)
+        resource.get("project_about", kwargs=other)
+        resource.get("project_projects")
+        # Only the resource of the bumped project is fetched again
+        self.failUnless(countingresourceprovider.calls == 4)
+
+    def test_version_bumped_during_fetch(self):
+        versions = Versions()
+
+        class BumpingResourceProvider(CountingResourceProvider):
+            def get(self, uri, content_type):
+                # The data is reloaded while the old one is being fetched
+                versions.bump('ENCODE')
+                return CountingResourceProvider.get(self, uri, content_type)
+        bumpingresourceprovider = BumpingResourceProvider()
+        resource = Resource(bumpingresourceprovider, ResourceCache())
+        resource.versions = versions
+        encode = {'project_name': 'ENCODE'}
+        resource.get("project_about", kwargs=encode)
+        key = (resource.get_uri("project_about", encode), PICKLED)
+        # Kept under the version it was fetched for
+        self.failUnless(key + ((0, None), ) in resource.cache.entries)
+        self.failIf(key + ((1, None), ) in resource.cache.entries)
+        resource.get_many([("project_about", PICKLED)], encode)
+        self.failUnless(bumpingresourceprovider.calls == 2)
+        self.failUnless(key + ((1, None), ) in resource.cache.entries)
+
+    def test_get_many(self):
+        countingresourceprovider = CountingResourceProvider()
+        resource = Resource(countingresourceprovider, ResourceCache())
+        kwargs = {'project_name': 'ENCODE'}
+        results = resource.get_many([("project_info", CSV),
+                                     ("project_about", CSV),
+                                     ("project_about", PICKLED),
+                                     ("project_projects", CSV)], kwargs)
+        self.failUnless(results == {("project_info", CSV): MARKER,
+                                    ("project_about", CSV): MARKER,
+                                    ("project_about", PICKLED): MARKER,
+                                    ("project_projects", CSV): MARKER})
+        # project_info and project_about have the same uri
+        self.failUnless(countingresourceprovider.calls == 3)
+        self.failUnless(resource.get_digest("project_info", CSV, kwargs))
+        resource.get_many([("project_projects", CSV)])
+        self.failUnless(countingresourceprovider.calls == 3)
+
+    def test_get_many_uses_bulk_endpoint(self):
+        bulkresourceprovider = BulkResourceProvider()
+        resource = Resource(bulkresourceprovider, ResourceCache())
+        kwargs = {'project_name': 'ENCODE'}
+        results = resource.get_many([("project_info", PICKLED),
+                                     ("project_about", PICKLED),
+                                     ("project_projects", CSV)], kwargs)
+        self.failUnless(results[("project_about", PICKLED)] == MARKER)
+        self.failUnless(bulkresourceprovider.calls == 0)
+        self.failUnless(len(bulkresourceprovider.bulk_calls) == 1)
+        self.failUnless(len(bulkresourceprovider.bulk_calls[0]) == 2)
+
+    def test_get_window(self):
+        resource = Resource(TableResourceProvider())
+        window = resource.get_window("project_projects", {}, 3, 10)
+        self.failUnless(window['total'] == 5)
+        self.failUnless(window['table_data'] == [('Gene3', ), ('Gene4', )])
+        self.failUnless(window['table_description'] == [('Gene', 'string')])
+        window = resource.get_window("project_projects", {}, 1)
+        self.failUnless(len(window['table_data']) == 4)
+
+    def test_get_window_missing_resource(self):
+        resource = Resource(FailingResourceProvider())
+        self.failUnless(resource.get_window("project_projects") is None)
+
+    def test_failures_are_remembered(self):
+        failingresourceprovider = FailingResourceProvider()
+        resource = Resource(failingresourceprovider, ResourceCache(),
+                            negatives=ResourceCache())
+        self.failUnless(resource.get("project_projects") is None)
+        self.failUnless(resource.get("project_projects") is None)
+        self.failUnless(failingresourceprovider.calls == 1)
+        self.failUnless(resource.negatives.stats()['hits'] == 1)
+        # Other content types of the same uri are still fetched
+        resource.get("project_projects", CSV)
+        self.failUnless(failingresourceprovider.calls == 2)
+
+    def test_breaker_fails_fast(self):
+        unreachableresourceprovider = UnreachableResourceProvider()
+        breakers = Breakers(threshold=2, reset_timeout=60)
+        resource = Resource(unreachableresourceprovider, breakers=breakers)
+        for index in range(5):
+            self.failUnless(resource.get("project_projects") is None)
+        self.failUnless(unreachableresourceprovider.calls == 2)
+        stats = breakers.stats()['127.0.0.1:6464']
+        self.failUnless(stats['open'])
+        self.failUnless(stats['trips'] == 1)
+        self.failUnless(stats['rejections'] == 3)
+
+    def test_missing_resources_keep_breaker_closed(self):
+        failingresourceprovider = FailingResourceProvider()
+        breakers = Breakers(threshold=2, reset_timeout=60)
+        resource = Resource(failingresourceprovider, breakers=breakers)
+        for name in ['ENCODE', 'Other', 'Third']:
+            self.failUnless(resource.get("project_experiments",
+                                         kwargs={'project_name': name})
+                            is None)
+        self.failUnless(resource.get("project_projects") is None)
+        self.failUnless(failingresourceprovider.calls == 4)
+        stats = breakers.stats()['127.0.0.1:6464']
+        self.failIf(stats['open'])
+        self.failUnless(stats['failures'] == 0)
+
+    def test_other_errors_keep_breaker_closed(self):
+        brokenresourceprovider = BrokenResourceProvider()
+        breakers = Breakers(threshold=1, reset_timeout=60)
+        resource = Resource(brokenresourceprovider, breakers=breakers)
+        self.failUnlessRaises(AttributeError, resource.get,
+                              "project_projects")
+        self.failUnlessRaises(AttributeError, resource.get_many,
+                              [("project_projects", PICKLED)])
+        self.failUnlessRaises(AttributeError, resource.stream,
+                              "project_projects", CSV)
+        self.failUnless(brokenresourceprovider.calls == 3)
+        stats = breakers.stats()['127.0.0.1:6464']
+        self.failIf(stats['open'])
+        self.failUnless(stats['failures'] == 0)
+
+    def test_stream_without_streaming_provider(self):
+        resource = Resource(DummyResourceProvider())
+        chunks = resource.stream("project_projects", CSV, chunk_size=10)
+        self.failUnless(list(chunks) == [MARKER[:10], MARKER[10:20],
+                                         MARKER[20:]])
+
+    def test_stream_cached_resource(self):
+        countingresourceprovider = CountingResourceProvider()
+        resource = Resource(countingresourceprovider, ResourceCache())
+        resource.get("project_projects", CSV)
+        chunks = resource.stream("project_projects", CSV)
+        self.failUnless(''.join(chunks) == MARKER)
+        self.failUnless(countingresourceprovider.calls == 1)
+
+    def test_stream(self):
+        provider = StreamingResourceProvider(['ABC', 'DEF'])
+        resource = Resource(provider, ResourceCache())
+        chunks = resource.stream("project_projects", CSV)
+        self.failUnless(list(chunks) == ['ABC', 'DEF'])
+        # Streamed bodies are passed through without being cached
+        self.failUnless(resource.cache.stats()['entries'] == 0)
+
+    def test_stream_missing_resource(self):
+        resource = Resource(StreamingResourceProvider(None))
+        self.failUnless(resource.stream("project_projects", CSV) is None)
+
+    def test_stream_no_more_data(self):
+        provider = StreamingResourceProvider([NoMoreData])
+        resource = Resource(provider)
+        self.failUnless(resource.stream("project_projects", CSV) is None)
+        provider = StreamingResourceProvider(['ABC', NoMoreData])
+        breakers = Breakers(threshold=1, reset_timeout=60)
+        resource = Resource(provider, breakers=breakers)
+        chunks = resource.stream("project_projects", CSV)
+        # A truncated body is not ended as if it was complete
+        self.failUnless(chunks.next() == 'ABC')
+        self.failUnlessRaises(TransportError, chunks.next)
+        self.failUnless(breakers.stats()['127.0.0.1:6464']['open'])
+
 
 # make the test suite.
 def suite():
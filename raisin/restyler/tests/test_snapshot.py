@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from raisin.restyler import snapshot
+from raisin.restyler import provider
+from raisin.restyler import cache
+from fixtures import DataResourceProvider
+from fixtures import reset_caches
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.output = tempfile.mkdtemp()
+        provider.set_provider(DataResourceProvider())
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+        reset_caches()
+        unittest.TestCase.tearDown(self)
+
+    def build(self, force=False):
+        return snapshot.build_snapshot(['/project/ENCODE'],
+                                       'http://example.com', self.output,
+                                       processes=1, force=force)
+
+    def test_match_path(self):
+        self.failUnless(snapshot.match_path('/') == ('homepage', {}))
+        path = '/project/ENCODE/experiment/subset/cell/K562/'
+        self.failUnless(snapshot.match_path(path) ==
+                        ('experiment_subset', {'project_name': 'ENCODE',
+                                               'parameter_list': 'cell',
+                                               'parameter_values': 'K562'}))
+        path = '/project/ENCODE/cell/K562/'
+        self.failUnless(snapshot.match_path(path)[0] == 'experiment')
+        self.failUnlessRaises(ValueError, snapshot.match_path, '/unknown')
+
+    def test_build_snapshot(self):
+        written, skipped, failed = self.build()
+        self.failUnless(written > 0 and skipped == 0 and failed == 0)
+        folder = os.path.join(self.output, 'project', 'ENCODE')
+        page = json.load(open(os.path.join(folder, 'page.json')))
+        self.failUnless(page['title'] == 'Project: ENCODE')
+        self.failUnless(len(page['tabs']) == 2)
+        self.failUnless(os.path.exists(os.path.join(folder, 'javascript.js')))
+        self.failUnless(os.path.exists(os.path.join(folder, 'tab',
+                                                    'downloads',
+                                                    'page.json')))
+        box_name = page['charts'][0]['id']
+        body = open(os.path.join(folder, box_name + '.csv')).read()
+        self.failUnless('RNA-Seq' in body)
+        self.failUnless(os.path.exists(os.path.join(folder,
+                                                    box_name + '.js')))
+
+    def test_rebuild_only_changed_files(self):
+        written = self.build()[0]
+        cache.set_cache(None)
+        self.failUnless(self.build() == (0, written, 0))
+        # Changed resources are built again
+        cache.set_cache(None)
+        provider.set_provider(DataResourceProvider('Changed'))
+        self.failUnless(self.build() == (written, 0, 0))
+        # Unless forced, unchanged resources are not built again
+        cache.set_cache(None)
+        self.failUnless(self.build(force=True) == (written, 0, 0))
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(SnapshotTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,115 @@
+import sys
+import unittest
+from raisin.restyler import timing
+
+
+class TimingTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.histograms = timing.Histograms()
+
+    def tearDown(self):
+        timing.PROFILES.clear()
+        unittest.TestCase.tearDown(self)
+
+    def test_histogram_buckets(self):
+        histogram = timing.Histogram()
+        histogram.observe(0.0005)
+        histogram.observe(0.001)
+        histogram.observe(0.003, 100)
+        histogram.observe(60.0)
+        self.failUnless(histogram.counts[0] == 2)
+        self.failUnless(histogram.counts[2] == 1)
+        self.failUnless(histogram.counts[-1] == 1)
+        self.failUnless(histogram.count == 4)
+        self.failUnless(histogram.bytes == 100)
+
+    def test_timings(self):
+        timings = timing.Timings(self.histograms)
+        timings.record(timing.FETCH, 'project_about', 0.02, 300)
+        timings.record(timing.FETCH, 'project_meta', 0.01, 100)
+        timings.record(timing.DECODE, 'project_about', 0.001, 300)
+        timings.record(timing.JAVASCRIPT, None, 0.005, 1000)
+        stages = timings.get_stages()
+        self.failUnless(stages[timing.FETCH][1:] == (400, 2))
+        resources = timings.get_resources()
+        self.failUnless(resources['project_about'][timing.DECODE] ==
+                        (0.001, 300))
+        self.failIf(None in resources)
+        timings.finish()
+        header = timings.get_header()
+        self.failUnless(header.startswith('decode;dur=1.0, fetch;dur=30.0, '
+                                          'javascript;dur=5.0, total;dur='),
+                        header)
+        stats = self.histograms.stats()
+        self.failUnless(stats[(timing.FETCH, None)]['count'] == 1)
+        self.failUnless(stats[(timing.FETCH, 'project_meta')]['bytes'] == 100)
+        self.failUnless(stats[(timing.TOTAL, None)]['count'] == 1)
+
+    def test_record_after_finish(self):
+        timings = timing.Timings(self.histograms)
+        timings.finish()
+        timings.record(timing.FETCH, 'project_about', 0.02, 300)
+        self.failUnless(timings.entries == [])
+        stats = self.histograms.stats()
+        self.failUnless(stats[(timing.FETCH, 'project_about')]['count'] == 1)
+        # Finishing again changes nothing
+        timings.finish()
+        self.failUnless(self.histograms.stats() == stats)
+
+    def test_disabled(self):
+        timings = timing.Timings(self.histograms, enabled=False)
+        timings.record(timing.FETCH, 'project_about', 0.02, 300)
+        timings.finish()
+        self.failUnless(timings.entries == [])
+        self.failUnless(self.histograms.stats() == {})
+
+    def test_render(self):
+        self.histograms.observe(timing.FETCH, 'project_about', 0.02, 300)
+        rendered = self.histograms.render()
+        labels = 'stage="fetch",name="project_about"'
+        self.failUnless('raisin_restyler_seconds_bucket{%s,le="0.01"} 0' %
+                        labels in rendered, rendered)
+        self.failUnless('raisin_restyler_seconds_bucket{%s,le="0.025"} 1' %
+                        labels in rendered)
+        self.failUnless('raisin_restyler_seconds_bucket{%s,le="+Inf"} 1' %
+                        labels in rendered)
+        self.failUnless('raisin_restyler_bytes_sum{%s} 300' % labels
+                        in rendered)
+
+    def test_slow_request_is_profiled(self):
+        slow_seconds = timing.PROFILE_SLOW_SECONDS
+        timing.PROFILE_SLOW_SECONDS = 0
+        try:
+            timings = timing.Timings(self.histograms, sample_rate=1.0)
+            self.failIf(timings.profiler is None)
+            timings.finish('http://example.com/')
+        finally:
+            timing.PROFILE_SLOW_SECONDS = slow_seconds
+        self.failUnless(timings.profiler is None)
+        url, seconds, statistics = timing.PROFILES[-1]
+        self.failUnless(url == 'http://example.com/')
+        self.failUnless('function calls' in statistics, statistics)
+
+    def test_fast_request_is_not_kept(self):
+        timings = timing.Timings(self.histograms, sample_rate=1.0)
+        timings.finish('http://example.com/')
+        self.failUnless(len(timing.PROFILES) == 0)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(TimingTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
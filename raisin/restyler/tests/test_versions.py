@@ -0,0 +1,80 @@
+import sys
+import unittest
+from raisin.restyler import versions
+
+
+class VersionResourceProvider:
+    """Returns the version of the data of every project"""
+
+    def __init__(self):
+        self.version = '1'
+        self.uris = []
+
+    def get(self, uri, content_type):
+        self.uris.append(uri)
+        return self.version
+
+
+class FailingResourceProvider:
+
+    def get(self, uri, content_type):
+        raise IOError("Unreachable")
+
+
+class VersionsTest(unittest.TestCase):
+
+    def test_get_project_name(self):
+        uri = 'http://127.0.0.1:6464/project/ENCODE/cell/K562/replicates'
+        self.failUnless(versions.get_project_name(uri) == 'ENCODE')
+        uri = 'http://127.0.0.1:6464/projects'
+        self.failUnless(versions.get_project_name(uri) is None)
+
+    def test_bump(self):
+        tokens = versions.Versions(resource=None)
+        self.failUnless(tokens.get('ENCODE') == (0, None))
+        tokens.bump('ENCODE')
+        self.failUnless(tokens.get('ENCODE') == (1, None))
+        self.failUnless(tokens.get('Other') == (0, None))
+
+    def test_version_resource(self):
+        provider = VersionResourceProvider()
+        tokens = versions.Versions(resource='project_about',
+                                   check_interval=3600, provider=provider)
+        first = tokens.get('ENCODE')
+        self.failUnless(provider.uris ==
+                        ['http://127.0.0.1:6464/project/ENCODE'],
+                        provider.uris)
+        # Not checked again before the interval is over
+        provider.version = '2'
+        self.failUnless(tokens.get('ENCODE') == first)
+        self.failUnless(len(provider.uris) == 1)
+        tokens.check_interval = 0
+        second = tokens.get('ENCODE')
+        self.failIf(second == first)
+        self.failUnless(second[0] == 0)
+
+    def test_version_resource_failing(self):
+        tokens = versions.Versions(resource='project_about',
+                                   check_interval=0,
+                                   provider=VersionResourceProvider())
+        token = tokens.get('ENCODE')
+        tokens.provider = FailingResourceProvider()
+        # The last known token is kept
+        self.failUnless(tokens.get('ENCODE') == token)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(VersionsTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
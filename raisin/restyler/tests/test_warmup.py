@@ -0,0 +1,129 @@
+import sys
+import time
+import pickle
+import threading
+import unittest
+from raisin.restyler import warmup
+from raisin.restyler import provider
+from raisin.restyler import cache
+from raisin.restyler.config import PICKLED
+from fixtures import reset_caches
+
+
+def table(*rows):
+    return pickle.dumps({'table_description': [], 'table_data': list(rows)})
+
+
+class HierarchyResourceProvider:
+    """Lists one project with one experiment with one replicate, and counts
+    the fetches.
+    """
+
+    def __init__(self):
+        self.uris = []
+
+    def get(self, uri, content_type):
+        self.uris.append((uri, content_type))
+        if uri.endswith('/projects'):
+            return table(('ENCODE', ))
+        if uri.endswith('/experiments/table'):
+            return table(('ENCODE', 'cell', 'K562'))
+        if uri.endswith('/replicates'):
+            return table(('ENCODE', 'K562', 'Rep1', 'Replicate 1',
+                          '/project/ENCODE/cell/K562/replicate/Rep1'))
+        if content_type == PICKLED:
+            return table(('RNA-Seq', ))
+        return '{"cols": [{"type": "string"}], "rows": []}'
+
+
+class WarmupTest(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.provider = HierarchyResourceProvider()
+        provider.set_provider(self.provider)
+
+    def tearDown(self):
+        reset_caches()
+        unittest.TestCase.tearDown(self)
+
+    def test_get_pages(self):
+        pages = warmup.Warmer().get_pages()
+        replicate = {'project_name': 'ENCODE',
+                     'parameter_list': 'cell',
+                     'parameter_values': 'K562',
+                     'replicate_name': 'Rep1'}
+        self.failUnless([layout_id for layout_id, matchdict in pages] ==
+                        ['homepage', 'project', 'experiment', 'replicate'],
+                        pages)
+        self.failUnless(pages[3][1] == replicate, pages)
+
+    def test_warm_cache(self):
+        progress = []
+        stats = warmup.warm_cache(progress=lambda *args:
+                                  progress.append(args))
+        self.failUnless(stats['pages'] == 4, stats)
+        self.failUnless(stats['failed'] == 0, stats)
+        self.failUnless(stats['bytes'] > 0, stats)
+        self.failUnless(len(progress) == 4, progress)
+        self.failUnless(progress[-1][:2] == (4, 4), progress)
+        # Every resource is fetched once in every content type
+        self.failUnless(len(self.provider.uris) ==
+                        len(set(self.provider.uris)), self.provider.uris)
+        replicate = [uri for uri, content_type in self.provider.uris
+                     if '/replicate/Rep1/' in uri]
+        self.failUnless(replicate, self.provider.uris)
+        # Everything is in the cache now
+        fetched = len(self.provider.uris)
+        stats = warmup.warm_cache()
+        self.failUnless(len(self.provider.uris) == fetched)
+        self.failUnless(stats['bytes'] == 0, stats)
+
+    def test_concurrency_cap(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        get = self.provider.get
+
+        def count(uri, content_type):
+            lock.acquire()
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            lock.release()
+            time.sleep(0.001)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return get(uri, content_type)
+        self.provider.get = count
+        warmup.warm_cache(concurrency=2)
+        self.failUnless(peak[0] <= 2, peak)
+
+    def test_refresh(self):
+        warmup.warm_cache()
+        fetched = len(self.provider.uris)
+        stats = warmup.warm_cache(refresh=True)
+        self.failUnless(len(self.provider.uris) == 2 * fetched)
+        self.failUnless(stats['bytes'] > 0, stats)
+
+    def test_start_warmup(self):
+        thread = warmup.start_warmup(concurrency=1)
+        thread.join()
+        self.failUnless(len(self.provider.uris) > 0)
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(WarmupTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
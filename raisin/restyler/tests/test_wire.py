@@ -0,0 +1,76 @@
+import sys
+import struct
+import unittest
+from raisin.restyler import wire
+
+TABLE = {'table_description': [('Project Id', 'string'),
+                               ('Read Length', 'number'),
+                               ('Percent', 'number'),
+                               ('Cell Type', 'string')],
+         'table_data': [('ENCODE', 76, 91.5, 'K562'),
+                        ('ENCODE', 36, 88.25, None),
+                        ('ENCODE', 100, 0.0, u'HeLa-S3')]}
+
+
+class WireTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        body = wire.encode_table(TABLE)
+        self.failUnless(wire.is_columnar(body))
+        table = wire.decode_table(body)
+        self.failUnless(table['table_description'] ==
+                        TABLE['table_description'])
+        self.failUnless(table['table_data'] == TABLE['table_data'])
+        self.failUnless(type(table['table_data'][2][3]) is str)
+
+    def test_rows_are_decoded_lazily(self):
+        table = wire.decode_table(wire.encode_table(TABLE))
+        rows = table['table_data']
+        self.failUnless(len(rows) == 3)
+        self.failUnless(rows.decoded is None)
+        self.failUnless(rows.get_column(1) == [76, 36, 100])
+        self.failUnless(rows.columns.keys() == [1])
+        self.failUnless(rows[0] == ('ENCODE', 76, 91.5, 'K562'))
+        self.failUnless(rows.body is None)
+        self.failUnless(rows.get_column(1) == [76, 36, 100])
+
+    def test_empty_table(self):
+        table = {'table_description': TABLE['table_description'],
+                 'table_data': []}
+        decoded = wire.decode_table(wire.encode_table(table))
+        self.failUnless(len(decoded['table_data']) == 0)
+        self.failUnless(list(decoded['table_data']) == [])
+
+    def test_truncated_body(self):
+        body = wire.encode_table(TABLE)
+        self.failUnlessRaises(ValueError, wire.decode_table, body[:-1])
+        self.failUnlessRaises(ValueError, wire.decode_table, "(dp0\n")
+
+    def test_fixed_width_numbers(self):
+        table = {'table_description': [('Reads', 'number'),
+                                       ('Percent', 'number')],
+                 'table_data': [(1, 0.5), (-2 ** 40, 2.0)]}
+        body = wire.encode_table(table)
+        # Little-endian 64 bit numbers whatever the size of a C long
+        columns = struct.pack('<2q', 1, -2 ** 40) + struct.pack('<2d', 0.5,
+                                                                2.0)
+        self.failUnless(body.endswith(columns))
+        decoded = wire.decode_table(body)
+        self.failUnless(decoded['table_data'] == table['table_data'])
+
+
+# make the test suite.
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = loader.loadTestsFromTestCase(WireTest)
+    return testsuite
+
+
+# Make the test suite; run the tests.
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
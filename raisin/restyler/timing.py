@@ -0,0 +1,233 @@
+"""Time the stages of building pages and boxes.
+
+Every Page and Box records the wall time and the bytes of each stage, like
+fetching, decoding and rendering a resource, in its timings. They give the
+breakdown of the request as a Server-Timing header, and are added to the
+histograms in HISTOGRAMS when the request is done. The histograms can be
+scraped in the Prometheus text format.
+
+A sample of PROFILE_SAMPLE_RATE of the requests is run under cProfile, and
+the profiles of the ones taking at least PROFILE_SLOW_SECONDS are kept.
+"""
+
+import os
+import time
+import random
+import pstats
+import cProfile
+import threading
+from collections import deque
+from cStringIO import StringIO
+from config import TIMINGS
+from config import PROFILE_SAMPLE_RATE
+from config import PROFILE_SLOW_SECONDS
+from config import PROFILE_KEEP
+from config import PROFILE_DIRECTORY
+
+# The stages of building pages and boxes
+FETCH = 'fetch'
+DECODE = 'decode'
+RENDER = 'render'
+JAVASCRIPT = 'javascript'
+TOTAL = 'total'
+
+# Upper bounds in seconds of the buckets of the histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of durations in buckets, with their sum"""
+
+    def __init__(self):
+        """Start with empty buckets"""
+        # The last bucket has no upper bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds, size=0):
+        """Count a duration"""
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+
+
+class Histograms:
+    """Histograms of the durations of the stages, overall and by resource
+    name.
+    """
+
+    def __init__(self):
+        """Start without histograms"""
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, name, seconds, size=0):
+        """Count the duration of a stage of the named resource, None for a
+        stage of the whole request.
+        """
+        self.lock.acquire()
+        try:
+            histogram = self.histograms.get((stage, name), None)
+            if histogram is None:
+                histogram = self.histograms[(stage, name)] = Histogram()
+            histogram.observe(seconds, size)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Drop all histograms"""
+        self.lock.acquire()
+        try:
+            self.histograms.clear()
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return the number, total seconds and bytes of every histogram by
+        stage and resource name.
+        """
+        self.lock.acquire()
+        try:
+            return dict([(key, {'count': histogram.count,
+                                'seconds': histogram.seconds,
+                                'bytes': histogram.bytes})
+                         for key, histogram in self.histograms.items()])
+        finally:
+            self.lock.release()
+
+    def render(self):
+        """Render the histograms in the Prometheus text format"""
+        lines = ['# TYPE raisin_restyler_seconds histogram']
+        self.lock.acquire()
+        try:
+            for (stage, name), histogram in sorted(self.histograms.items()):
+                labels = 'stage="%s"' % stage
+                if not name is None:
+                    labels += ',name="%s"' % name
+                cumulative = 0
+                bounds = [repr(bound) for bound in BUCKETS] + ['+Inf']
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append('raisin_restyler_seconds_bucket{%s,le="%s"} '
+                                 '%s' % (labels, bound, cumulative))
+                lines.append('raisin_restyler_seconds_sum{%s} %r' %
+                             (labels, histogram.seconds))
+                lines.append('raisin_restyler_seconds_count{%s} %s' %
+                             (labels, histogram.count))
+                lines.append('raisin_restyler_bytes_sum{%s} %s' %
+                             (labels, histogram.bytes))
+        finally:
+            self.lock.release()
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by all requests of the process
+HISTOGRAMS = Histograms()
+# The last profiles of slow requests, as (url, seconds, statistics)
+PROFILES = deque(maxlen=PROFILE_KEEP)
+
+
+class Timings:
+    """Wall time and bytes of the stages of one request"""
+
+    def __init__(self, histograms=HISTOGRAMS, enabled=TIMINGS,
+                 sample_rate=PROFILE_SAMPLE_RATE):
+        """Start timing the request, under cProfile for a sample of them"""
+        self.histograms = histograms
+        self.enabled = enabled
+        self.started = time.time()
+        self.seconds = None
+        # Tuples (stage, name, seconds, bytes) in the order they were done
+        self.entries = []
+        self.lock = threading.Lock()
+        self.profiler = None
+        if enabled and sample_rate and random.random() < sample_rate:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def record(self, stage, name, seconds, size=0):
+        """Record the wall time and bytes of a stage of a resource. Stages
+        done after the request, like refreshes in the background, only go
+        into the histograms.
+        """
+        if not self.enabled:
+            return
+        self.lock.acquire()
+        try:
+            done = not self.seconds is None
+            if not done:
+                self.entries.append((stage, name, seconds, size))
+        finally:
+            self.lock.release()
+        if done:
+            self.histograms.observe(stage, name, seconds, size)
+
+    def finish(self, url=None):
+        """Stop timing the request and add its stages to the histograms"""
+        if not self.enabled or not self.seconds is None:
+            return
+        self.lock.acquire()
+        try:
+            self.seconds = time.time() - self.started
+        finally:
+            self.lock.release()
+        if not self.profiler is None:
+            self.profiler.disable()
+            if self.seconds >= PROFILE_SLOW_SECONDS:
+                self.keep_profile(url)
+            self.profiler = None
+        for stage, name, seconds, size in self.entries:
+            if not name is None:
+                self.histograms.observe(stage, name, seconds, size)
+        for stage, (seconds, size, count) in self.get_stages().items():
+            self.histograms.observe(stage, None, seconds, size)
+        self.histograms.observe(TOTAL, None, self.seconds)
+
+    def keep_profile(self, url):
+        """Keep the statistics of the profile of a slow request"""
+        output = StringIO()
+        statistics = pstats.Stats(self.profiler, stream=output)
+        statistics.sort_stats('cumulative').print_stats(30)
+        PROFILES.append((url, self.seconds, output.getvalue()))
+        if not PROFILE_DIRECTORY is None:
+            filename = 'restyler-%d-%d.prof' % (self.started * 1000,
+                                                os.getpid())
+            self.profiler.dump_stats(os.path.join(PROFILE_DIRECTORY,
+                                                  filename))
+
+    def get_stages(self):
+        """Get the seconds, bytes and number of entries by stage"""
+        stages = {}
+        for stage, name, seconds, size in self.entries:
+            total = stages.get(stage, (0.0, 0, 0))
+            stages[stage] = (total[0] + seconds, total[1] + size,
+                             total[2] + 1)
+        return stages
+
+    def get_resources(self):
+        """Get the seconds and bytes of every stage by resource name"""
+        resources = {}
+        for stage, name, seconds, size in self.entries:
+            if name is None:
+                continue
+            stages = resources.setdefault(name, {})
+            total = stages.get(stage, (0.0, 0))
+            stages[stage] = (total[0] + seconds, total[1] + size)
+        return resources
+
+    def get_header(self):
+        """Get the stages as the value of a Server-Timing header, with the
+        durations in milliseconds.
+        """
+        stages = self.get_stages().items()
+        if not self.seconds is None:
+            stages.append((TOTAL, (self.seconds, 0, 1)))
+        return ', '.join(['%s;dur=%.1f' % (stage, seconds * 1000)
+                          for stage, (seconds, size, count) in sorted(stages)])
@@ -0,0 +1,109 @@
+"""Version tokens of the data of every project.
+
+The statistics of a project only change when the project is processed
+again, so with VERSION_TOKENS its cached resources are kept under a token
+of the version of its data rather than expired after CACHE_TTL. Changing
+the token of a project makes the entries of exactly that project miss, and
+the ones kept under the old token are evicted as the least recently used.
+
+The token changes when bump is called for the project, for example after
+the Grape pipeline has loaded new data, and with VERSION_RESOURCE when the
+body of this resource of the project changes.
+"""
+
+import re
+import time
+import threading
+from hashlib import md5
+from raisin.box import RESOURCES
+from config import PICKLED
+from config import VERSION_RESOURCE
+from config import VERSION_CHECK_INTERVAL
+from provider import get_provider
+
+# The project a resource belongs to, by its uri
+PROJECT_NAME = re.compile(r'/project/([^/?#]+)')
+
+
+def get_project_name(uri):
+    """Get the name of the project of a resource uri, or None when the
+    resource does not belong to a project.
+    """
+    match = PROJECT_NAME.search(uri)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+class Versions:
+    """Version tokens of the data of the projects"""
+
+    def __init__(self, resource=VERSION_RESOURCE,
+                 check_interval=VERSION_CHECK_INTERVAL, provider=None):
+        """Without a resource, the tokens only change with bump. Without a
+        provider, the one shared by the whole process is used.
+        """
+        self.resource = resource
+        self.check_interval = check_interval
+        self.provider = provider
+        # Maps the project name to a tuple (generation, digest of the
+        # version resource, time it was checked)
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get(self, project_name):
+        """Get the version token of the data of a project"""
+        now = time.time()
+        self.lock.acquire()
+        try:
+            generation, digest, checked = self.tokens.get(project_name,
+                                                          (0, None, None))
+            check = not self.resource is None and \
+                (checked is None or checked + self.check_interval <= now)
+            if check:
+                # Other requests keep using the token meanwhile
+                self.tokens[project_name] = (generation, digest, now)
+        finally:
+            self.lock.release()
+        if check:
+            fetched = self.fetch(project_name)
+            if not fetched is None and fetched != digest:
+                self.lock.acquire()
+                try:
+                    generation, old, checked = self.tokens[project_name]
+                    self.tokens[project_name] = (generation, fetched, checked)
+                finally:
+                    self.lock.release()
+                digest = fetched
+        return (generation, digest)
+
+    def fetch(self, project_name):
+        """Fetch the version resource of a project, returning the digest of
+        its body or None when it is not available.
+        """
+        provider = self.provider
+        if provider is None:
+            provider = get_provider()
+        uri = RESOURCES[self.resource]['uri'] % {'project_name': project_name}
+        try:
+            body = provider.get(uri, PICKLED)
+        except Exception:
+            # The token is checked again after the interval
+            return None
+        if body is None:
+            return None
+        return md5(body).hexdigest()
+
+    def bump(self, project_name):
+        """Change the version token of the data of a project"""
+        self.lock.acquire()
+        try:
+            generation, digest, checked = self.tokens.get(project_name,
+                                                          (0, None, None))
+            self.tokens[project_name] = (generation + 1, digest, checked)
+        finally:
+            self.lock.release()
+
+
+# Shared by all resources of the process
+VERSIONS = Versions()
@@ -0,0 +1,170 @@
+"""Warm the resource cache with the resources of all pages.
+
+After a deploy, or after the Grape pipeline has loaded new data, the first
+visitor of every page would wait for all of its resources to be fetched.
+Warming the cache fetches them before the traffic arrives. The pages are
+found the way they link to each other: the projects listed by
+project_projects, the experiments of every project listed by
+project_experimentstable and the replicates of every experiment listed by
+experiment_replicates. The resources of all tabs of every page are then
+fetched into the cache. WARMUP_CONCURRENCY pages are warmed at the same
+time, each fetching one resource or bulk request at a time, so that the
+warm-up never has more than WARMUP_CONCURRENCY requests to the Restish
+server running.
+
+The cache lives in the process serving the pages, so the web application
+warms it at startup, and again after every data load with refresh, which
+fetches the resources in the cache again instead of dropping them:
+
+    from raisin.restyler.warmup import start_warmup
+    start_warmup(refresh=True)
+"""
+
+import time
+import threading
+from config import PICKLED
+from config import WARMUP_CONCURRENCY
+from page import Restyler
+from page import LAYOUTS
+from page import match_path
+from resource import Resource
+from cache import get_cache
+from cache import NEGATIVES
+from fetcher import fetch_concurrently
+from timing import FETCH
+
+# The tables listing the projects, the experiments of a project and the
+# replicates of an experiment. They are got before the pages are warmed
+LISTINGS = [('project_projects', PICKLED),
+            ('project_experimentstable', PICKLED),
+            ('experiment_replicates', PICKLED)]
+
+
+def get_wanted(layout_id):
+    """Get the names and content types of the resources of all tabs of a
+    layout.
+    """
+    wanted = set()
+    for (cells_layout_id, tab_name), cells in LAYOUTS.items():
+        if cells_layout_id == layout_id:
+            restyler = Restyler(None, cells, render=False)
+            wanted.update(restyler.get_wanted())
+    return sorted(wanted)
+
+
+class Warmer(object):
+    """Fetches the resources of all pages into the cache"""
+
+    def __init__(self, concurrency=WARMUP_CONCURRENCY, refresh=False,
+                 progress=None):
+        """Progress is called with the number of pages warmed, the number
+        of pages and the bytes fetched after every page.
+        """
+        self.concurrency = concurrency
+        self.refresh = refresh
+        self.progress = progress
+        # The resource records the bytes fetched with record
+        self.resource = Resource(cache=get_cache(),
+                                 negatives=get_cache(NEGATIVES),
+                                 timings=self)
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.warmed = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def record(self, stage, name, seconds, size=0):
+        """Count the bytes fetched, like Timings.record"""
+        if stage != FETCH:
+            return
+        self.lock.acquire()
+        try:
+            self.bytes += size
+        finally:
+            self.lock.release()
+
+    def get_rows(self, name, kwargs=None):
+        """Get the rows of a table listing pages"""
+        key = (name, PICKLED)
+        table = self.resource.get_many([key], kwargs, self.refresh, 1)[key]
+        if not table:
+            return []
+        return table.get('table_data', [])
+
+    def get_pages(self):
+        """Get the layout ids and matchdicts of the homepage, the projects,
+        their experiments and the replicates of these.
+        """
+        projects = [{'project_name': row[0]}
+                    for row in self.get_rows('project_projects')]
+        jobs = [('project_experimentstable', project)
+                for project in projects]
+        experiments = [{'project_name': row[0],
+                        'parameter_list': row[1],
+                        'parameter_values': row[2]}
+                       for rows in fetch_concurrently(self.get_rows, jobs,
+                                                      self.concurrency)
+                       for row in rows]
+        pages = [('homepage', {})]
+        pages.extend([('project', project) for project in projects])
+        pages.extend([('experiment', experiment)
+                      for experiment in experiments])
+        jobs = [('experiment_replicates', experiment)
+                for experiment in experiments]
+        for rows in fetch_concurrently(self.get_rows, jobs, self.concurrency):
+            for row in rows:
+                try:
+                    pages.append(match_path(row[4]))
+                except ValueError:
+                    # Not the url of a page
+                    continue
+        return pages
+
+    def warm_page(self, layout_id, matchdict):
+        """Fetch the resources of all tabs of a page into the cache"""
+        # The listings have been got already
+        wanted = [key for key in get_wanted(layout_id)
+                  if not key in LISTINGS]
+        # The pages are warmed concurrently already
+        results = self.resource.get_many(wanted, matchdict, self.refresh, 1)
+        self.lock.acquire()
+        try:
+            self.warmed += 1
+            self.failed += len([result for result in results.values()
+                                if result is None])
+            warmed = self.warmed
+            size = self.bytes
+        finally:
+            self.lock.release()
+        if not self.progress is None:
+            self.progress(warmed, self.pages, size)
+
+    def warm(self):
+        """Fetch the resources of all pages into the cache.
+
+        Returns the number of pages warmed, of resources that could not be
+        fetched, of bytes fetched and the seconds it took.
+        """
+        started = time.time()
+        pages = self.get_pages()
+        self.pages = len(pages)
+        fetch_concurrently(self.warm_page, pages, self.concurrency)
+        return {'pages': self.warmed,
+                'failed': self.failed,
+                'bytes': self.bytes,
+                'seconds': time.time() - started}
+
+
+def warm_cache(concurrency=WARMUP_CONCURRENCY, refresh=False, progress=None):
+    """Fetch the resources of all pages into the cache"""
+    return Warmer(concurrency, refresh, progress).warm()
+
+
+def start_warmup(concurrency=WARMUP_CONCURRENCY, refresh=False,
+                 progress=None):
+    """Warm the cache in a background thread, which is returned"""
+    thread = threading.Thread(target=warm_cache,
+                              args=(concurrency, refresh, progress))
+    thread.setDaemon(True)
+    thread.start()
+    return thread
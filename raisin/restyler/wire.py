@@ -0,0 +1,198 @@
+"""Columnar wire format for the tables of the Restish server.
+
+The tables are dictionaries with a table_description and table_data. A body
+in the columnar format starts with MAGIC, followed by a line of JSON with the
+description, the number of rows and the kind and size of every column, and
+then the columns one after the other:
+
+    i   integers, as little-endian 64 bit integers
+    f   floats, as little-endian 64 bit doubles
+    s   strings, separated by null bytes
+    j   anything else, as JSON list
+
+Unlike pickle, decoding never runs code given by the backend, and the
+columns are only decoded when the rows are needed. The numbers have the
+same size and byte order on every machine, so that the server and the
+client need not agree on the size of a C long.
+"""
+
+import json
+import struct
+import threading
+
+MAGIC = 'RAISINCOL1\n'
+
+# Format of one number of the numeric column kinds
+NUMBER_FORMATS = {'i': 'q', 'f': 'd'}
+NUMBER_SIZE = 8
+
+
+def is_columnar(body):
+    """Tell whether a body is in the columnar format"""
+    return body.startswith(MAGIC)
+
+
+def get_column_kind(values):
+    """Get the kind of encoding used for the values of a column"""
+    types = set([type(value) for value in values])
+    if types == set([int]):
+        return 'i'
+    if types == set([float]):
+        return 'f'
+    if types == set([str]):
+        for value in values:
+            if '\0' in value:
+                return 'j'
+        return 's'
+    return 'j'
+
+
+def encode_column(kind, values):
+    """Encode the values of a column"""
+    if kind in NUMBER_FORMATS:
+        return struct.pack('<%d%s' % (len(values), NUMBER_FORMATS[kind]),
+                           *values)
+    if kind == 's':
+        return '\0'.join(values)
+    return json.dumps(values, separators=(',', ':'))
+
+
+def decode_column(kind, block, rows):
+    """Decode the values of a column"""
+    if kind in NUMBER_FORMATS:
+        if len(block) != rows * NUMBER_SIZE:
+            raise ValueError("Column size not correct")
+        values = list(struct.unpack('<%d%s' % (rows, NUMBER_FORMATS[kind]),
+                                    block))
+    elif kind == 's':
+        values = []
+        if rows > 0:
+            values = block.split('\0')
+    elif kind == 'j':
+        values = [to_str(value) for value in json.loads(block)]
+    else:
+        raise ValueError("Unknown column kind %s" % kind)
+    if len(values) != rows:
+        raise ValueError("Number of rows not correct")
+    return values
+
+
+def to_str(value):
+    """Give back strings as str, like they are in pickled tables"""
+    if isinstance(value, unicode):
+        try:
+            return value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    return value
+
+
+def encode_table(table):
+    """Encode a table in the columnar format"""
+    description = table['table_description']
+    rows = [tuple(row) for row in table['table_data']]
+    columns = zip(*rows)
+    if not columns:
+        columns = [()] * len(description)
+    kinds = []
+    blocks = []
+    for values in columns:
+        kind = get_column_kind(values)
+        kinds.append(kind)
+        blocks.append(encode_column(kind, list(values)))
+    header = {'description': description,
+              'rows': len(rows),
+              'columns': [[kind, len(block)]
+                          for kind, block in zip(kinds, blocks)]}
+    return ''.join([MAGIC, json.dumps(header), '\n'] + blocks)
+
+
+def decode_table(body):
+    """Decode a table in the columnar format.
+
+    The description is decoded right away, the rows when they are needed.
+    """
+    if not is_columnar(body):
+        raise ValueError("Not a columnar body")
+    end = body.find('\n', len(MAGIC))
+    if end == -1:
+        raise ValueError("Header not found")
+    header = json.loads(body[len(MAGIC):end])
+    description = [tuple([to_str(item) for item in column])
+                   for column in header['description']]
+    rows = ColumnarRows(body, end + 1, header)
+    return {'table_description': description, 'table_data': rows}
+
+
+class ColumnarRows(object):
+    """Rows of a table in the columnar format, decoded on first use"""
+
+    def __init__(self, body, offset, header):
+        """Check the sizes of the columns, without decoding them yet"""
+        self.body = body
+        self.rows = header['rows']
+        self.kinds = []
+        self.offsets = []
+        for kind, size in header['columns']:
+            self.kinds.append(kind)
+            self.offsets.append((offset, offset + size))
+            offset += size
+        if offset != len(body):
+            raise ValueError("Body length not correct")
+        self.columns = {}
+        self.decoded = None
+        # Tables are shared between requests through the resource cache
+        self.lock = threading.RLock()
+
+    def get_column(self, index):
+        """Get the values of one column, decoding only this column"""
+        self.lock.acquire()
+        try:
+            if not self.decoded is None:
+                return [row[index] for row in self.decoded]
+            if not index in self.columns:
+                start, end = self.offsets[index]
+                self.columns[index] = decode_column(self.kinds[index],
+                                                    self.body[start:end],
+                                                    self.rows)
+            return self.columns[index]
+        finally:
+            self.lock.release()
+
+    def get_rows(self):
+        """Get the rows as list of tuples"""
+        if self.decoded is None:
+            self.lock.acquire()
+            try:
+                if self.decoded is None:
+                    columns = [self.get_column(index)
+                               for index in range(len(self.kinds))]
+                    if columns:
+                        decoded = zip(*columns)
+                    else:
+                        decoded = [()] * self.rows
+                    # The rows hold everything needed from now on
+                    self.body = None
+                    self.columns = {}
+                    self.decoded = decoded
+            finally:
+                self.lock.release()
+        return self.decoded
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.get_rows())
+
+    def __getitem__(self, index):
+        return self.get_rows()[index]
+
+    def __eq__(self, other):
+        return self.get_rows() == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.get_rows())
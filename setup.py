@@ -36,5 +36,7 @@ setup(name='raisin.restyler',
       ],
       entry_points="""
       # -*- Entry points: -*-
+      [console_scripts]
+      raisin_snapshot = raisin.restyler.snapshot:main
       """,
       )